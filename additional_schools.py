@@ -5,7 +5,6 @@ from qgis.core import (
 )
 from qgis.PyQt.QtCore import QVariant
 from qgis.PyQt.QtWidgets import QAction
-from .additional_schools_dialog import AdditionalSchoolsDialog
 
 class AdditionalSchools:
     INPUT_SCHOOLS_LAYER = 'INPUT_SCHOOLS_LAYER'
@@ -21,7 +20,8 @@ class AdditionalSchools:
         """
         self.iface = iface  # Store iface for use in other methods if needed
         self.output_layer = None
-        self.dialog = AdditionalSchoolsDialog()
+        # The dialog pulls in the database and numeric libraries, so it is only created when first opened
+        self.dialog = None
 
     def name(self):
         return 'additional_schools'
@@ -51,6 +51,10 @@ class AdditionalSchools:
         """
         This method is called when the plugin's action is triggered.
         """
+        if self.dialog is None:
+            from .additional_schools_dialog import AdditionalSchoolsDialog
+            self.dialog = AdditionalSchoolsDialog()
+
         # Show the dialog when the plugin is run
         self.dialog.exec_()
 
@@ -1,12 +1,40 @@
-from PyQt5.QtWidgets import QDialog, QFileDialog
+from PyQt5.QtWidgets import QDialog, QFileDialog, QInputDialog
 from PyQt5.QtCore import QVariant
-from qgis.core import QgsProject, QgsVectorLayer, QgsField, QgsFeature, QgsPalLayerSettings, QgsTextFormat, QgsVectorLayerSimpleLabeling
-from qgis import processing
+from qgis.core import Qgis, QgsMessageLog, QgsProject, QgsRasterLayer, QgsSettings, QgsVectorLayer, QgsField, QgsFeature, QgsGeometry, QgsPointXY
 import psycopg2
-from psycopg2 import sql
-import csv
+from psycopg2.errors import QueryCanceled
+import datetime
 import os
+import shutil
+import sqlite3
+import tempfile
 from .additional_schools_dialog_ui import Ui_additionalSchoolsDialog
+from .backends import GeoPackageBackend, PostgisBackend
+from .catchment import CATCHMENT_TABLE, fetch_area_points, fetch_schools, overloaded_schools, school_loads, write_catchments
+from .columnar import ARROW, EXTENSIONS, GRID_COLUMNS, PARQUET, RESULT_COLUMNS, export_table
+from .deduplicate import merged_duplicates, refresh_deduplicated
+from .database import DEFAULT_DSN, DEFAULT_STATEMENT_TIMEOUT, DatabaseRouter, DatabaseUnavailableError, current_lsn, parse_shards
+from .diagnostics import ExplainCursor, find_issues, table_statistics, write_report
+from .engine import (
+    DEFAULT_AREA_FIELD, DEFAULT_RESULTS_TABLE, calculate_deficits, calculate_deficits_from_counts, calculate_deficits_in_chunks,
+    calculate_deficits_per_area, fetch_area_counts
+)
+from .history import record_run
+from .network import fetch_demand_points, load_graph, travel_times
+from .parallel import calculate_deficits_in_parallel
+from .shards import NATIONAL_RESULTS_TABLE, ShardError, calculate_national_deficits
+from .subdivide import refresh_subdivided
+from .surface import GAP, RATIO, create_rasters, layer_window, open_rasters, rasterize, write_geotiff
+from .uncertainty import DISTRIBUTIONS, TOTAL_LEVEL, UNCERTAINTY_TABLE, deficit_percentiles, write_uncertainty
+from .grid import (
+    GRID_TABLE, HEXAGON, SQUARE, cell_centres, fetch_cell_population, fetch_school_points, grid_deficits, iter_cell_population,
+    square_cells, write_grid
+)
+from .placement import metric_srid, propose_sites
+from .roadgraph import unserved_population
+from .planner import CHUNKED, PARALLEL, PER_AREA, PLAIN, Plan, choose_plan
+from .styling import CLASS_FIELD, class_breaks, class_ranges, local_class_breaks
+from .projection import area_growth_rates, fetch_area_rates, fetch_level_rates, projection_rows, write_projection
 
 class AdditionalSchoolsDialog(QDialog, Ui_additionalSchoolsDialog):
     def __init__(self, parent=None):
@@ -14,62 +42,182 @@ class AdditionalSchoolsDialog(QDialog, Ui_additionalSchoolsDialog):
         super().__init__(parent)
         self.setupUi(self)
 
+        # Writes go to the primary database, heavy reads to the read replica when one is configured
+        self.router = self.load_database_router()
+
+        # Layers are read from PostGIS until a GeoPackage is chosen as data source
+        self.backend = PostgisBackend(self.router.connect_read)
+        self.comboBox_dataSource.addItems(["PostGIS database", "GeoPackage file..."])
+        self.comboBox_dataSource.currentIndexChanged.connect(self.select_data_source)
+
+        # Areas can additionally be analysed on a regular grid of cells
+        self.comboBox_gridShape.addItems(["No grid analysis", "Hexagon grid", "Square grid"])
+
+        # Results can additionally be exported for analytics tools that read columnar files
+        self.comboBox_columnarFormat.addItems(["No columnar export", "GeoParquet", "Arrow IPC"])
+
+        # Schools to add can be driven by the population beyond a travel time from a school over a road network
+        settings = QgsSettings()
+        self.road_network = (settings.value("additional_schools/road_network", ""),
+                             settings.value("additional_schools/road_layer", ""))
+        self.checkBox_accessibility.toggled.connect(self.select_road_network)
+
+        # The schools to add can be simulated from uncertain populations to give percentile bands
+        self.comboBox_uncertaintyDistribution.addItems(["Normal", "Log-normal", "Uniform"])
+
+        # A smoothed raster of school coverage can be written next to the results
+        self.comboBox_surfaceMode.addItems(["Schools per 1,000 people", "Schools missing per km²"])
+
         # Populate combo boxes with available layers
         self.populate_layer_comboboxes()
 
         # Connect the city layer combo box to update population field combo box
         self.comboBox_cityLayer.currentIndexChanged.connect(self.populate_population_fields)
 
+        # Connect the schools layer combo box to update the school name field combo box
+        self.comboBox_schoolsLayer.currentIndexChanged.connect(self.populate_school_fields)
+
         # Connect the execute button to calculate the required schools
         self.button_execute.clicked.connect(self.calculate_required_schools)
 
+        # Connect the history button to compare recorded runs
+        self.button_history.clicked.connect(self.show_run_history)
+
+    def select_data_source(self):
+        """Switch between the PostGIS database and a local GeoPackage file."""
+        if self.comboBox_dataSource.currentIndex() == 1:
+            path, _ = QFileDialog.getOpenFileName(self, "Open GeoPackage", "", "GeoPackage Files (*.gpkg)")
+            if not path:
+                self.comboBox_dataSource.setCurrentIndex(0)
+                return
+            self.backend = GeoPackageBackend(path)
+        else:
+            self.backend = PostgisBackend(self.router.connect_read)
+        self.enable_database_options()
+        self.populate_layer_comboboxes()
+
+    def enable_database_options(self):
+        """Enable the options that only run in the database when the data source has them, and disable them otherwise."""
+        # Offline runs only count the deficits and style their layer; they record no history either
+        widgets = (
+            self.checkBox_proposeSites, self.spinBox_serviceRadius, self.comboBox_candidatesLayer,
+            self.checkBox_capturePlans, self.spinBox_chunkSize, self.checkBox_resume, self.spinBox_workers,
+            self.spinBox_maxVertices, self.checkBox_subdivide, self.checkBox_perArea, self.checkBox_autoPlan,
+            self.checkBox_sharded, self.button_history, self.spinBox_duplicateTolerance, self.comboBox_schoolNameField,
+            self.checkBox_projection, self.spinBox_projectionYears, self.doubleSpinBox_growthRate,
+            self.comboBox_growthRateField, self.comboBox_growthRateTable, self.comboBox_gridShape, self.spinBox_cellSize,
+            self.comboBox_columnarFormat, self.checkBox_exportGeometry, self.checkBox_catchments,
+            self.checkBox_accessibility, self.spinBox_travelMinutes, self.spinBox_travelSpeed,
+            self.checkBox_uncertainty, self.spinBox_draws, self.comboBox_uncertaintyDistribution,
+            self.doubleSpinBox_populationError, self.doubleSpinBox_ratioError, self.checkBox_surface,
+            self.comboBox_surfaceMode, self.spinBox_bandwidth,
+        )
+        for widget in widgets:
+            widget.setEnabled(self.backend.database_options)
+
+    def select_road_network(self, checked):
+        """Choose the GeoPackage road layer travel times are measured on when accessibility is switched on."""
+        if not checked:
+            return
+        path, _ = QFileDialog.getOpenFileName(self, "Open Road Network", self.road_network[0], "GeoPackage Files (*.gpkg)")
+        if not path:
+            self.checkBox_accessibility.setChecked(False)
+            return
+        try:
+            connection = sqlite3.connect(path)
+            try:
+                layers = [row[0] for row in connection.execute(
+                    "SELECT table_name FROM gpkg_geometry_columns "
+                    "WHERE upper(geometry_type_name) LIKE '%LINESTRING' ORDER BY table_name"
+                )]
+            finally:
+                connection.close()
+        except sqlite3.Error as error:
+            self.show_error(f"Error reading the road network: {error}")
+            self.checkBox_accessibility.setChecked(False)
+            return
+        if not layers:
+            self.show_error("The GeoPackage has no line layer to use as road network.")
+            self.checkBox_accessibility.setChecked(False)
+            return
+        layer = layers[0]
+        if len(layers) > 1:
+            current = layers.index(self.road_network[1]) if self.road_network[1] in layers else 0
+            layer, ok = QInputDialog.getItem(self, "Road Network", "Road layer:", layers, current, False)
+            if not ok:
+                self.checkBox_accessibility.setChecked(False)
+                return
+        self.road_network = (path, layer)
+        settings = QgsSettings()
+        settings.setValue("additional_schools/road_network", path)
+        settings.setValue("additional_schools/road_layer", layer)
+
     def populate_layer_comboboxes(self):
         """Populate the combo boxes with available layers."""
         try:
-            connection = self.connect_to_db()
-            cursor = connection.cursor()
-            cursor.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = 'public'")
-            layer_names = [row[0] for row in cursor.fetchall()]
+            layer_names = self.backend.layer_names()
 
             # Clear existing items in the combo boxes
             self.comboBox_cityLayer.clear()
             self.comboBox_schoolsLayer.clear()
+            self.comboBox_candidatesLayer.clear()
+            self.comboBox_growthRateTable.clear()
 
             # Add placeholder text to combo boxes
             self.comboBox_cityLayer.addItem("Select a city layer")
             self.comboBox_schoolsLayer.addItem("Select schools layer")
+            self.comboBox_candidatesLayer.addItem("Grid candidates")
+            self.comboBox_growthRateTable.addItem("None")
 
             # Add available layer names to each combo box
             self.comboBox_cityLayer.addItems(layer_names)
             self.comboBox_schoolsLayer.addItems(layer_names)
-
-            cursor.close()
-            connection.close()
+            self.comboBox_candidatesLayer.addItems(layer_names)
+            self.comboBox_growthRateTable.addItems(layer_names)
         except (Exception, psycopg2.DatabaseError) as error:
             self.show_error(f"Error connecting to the database: {error}")
 
     def populate_population_fields(self):
-        """Populate the population fields combo box based on the selected city layer."""
+        """Populate the population and admin level field combo boxes based on the selected city layer."""
         try:
             self.comboBox_populationField.clear()
             self.comboBox_populationField.addItem("Select a population field")
+            self.comboBox_areaField.clear()
+            self.comboBox_level1Field.clear()
+            self.comboBox_level1Field.addItem("None")
+            self.comboBox_level2Field.clear()
+            self.comboBox_level2Field.addItem("None")
+            self.comboBox_growthRateField.clear()
+            self.comboBox_growthRateField.addItem("None")
 
             city_layer_name = self.comboBox_cityLayer.currentText()
             print(f"Selected City Layer: {city_layer_name}")  # Debug statement
 
             if city_layer_name != "Select a city layer":
-                connection = self.connect_to_db()
-                cursor = connection.cursor()
-                cursor.execute(sql.SQL("SELECT column_name FROM information_schema.columns WHERE table_name = %s"), [city_layer_name])
-                field_names = [row[0] for row in cursor.fetchall()]
+                field_names = self.backend.field_names(city_layer_name)
                 print(f"Available Fields: {field_names}")  # Debug statement
                 self.comboBox_populationField.addItems(field_names)
-
-                cursor.close()
-                connection.close()
+                self.comboBox_areaField.addItems(field_names)
+                self.comboBox_level1Field.addItems(field_names)
+                self.comboBox_level2Field.addItems(field_names)
+                self.comboBox_growthRateField.addItems(field_names)
+                if DEFAULT_AREA_FIELD in field_names:
+                    self.comboBox_areaField.setCurrentText(DEFAULT_AREA_FIELD)
         except (Exception, psycopg2.DatabaseError) as error:
             self.show_error(f"Error retrieving population fields: {error}")
 
+    def populate_school_fields(self):
+        """Populate the school name field combo box based on the selected schools layer."""
+        try:
+            self.comboBox_schoolNameField.clear()
+            self.comboBox_schoolNameField.addItem("None")
+
+            schools_layer_name = self.comboBox_schoolsLayer.currentText()
+            if schools_layer_name != "Select schools layer":
+                self.comboBox_schoolNameField.addItems(self.backend.field_names(schools_layer_name))
+        except (Exception, psycopg2.DatabaseError) as error:
+            self.show_error(f"Error retrieving school fields: {error}")
+
     def calculate_required_schools(self):
         """Calculate the required number of schools based on the population and people per school."""
         try:
@@ -80,9 +228,6 @@ class AdditionalSchoolsDialog(QDialog, Ui_additionalSchoolsDialog):
                 self.show_error("Please select both the city and schools layers.")
                 return
             
-            connection = self.connect_to_db()
-            cursor = connection.cursor()
-            
             population_field = self.comboBox_populationField.currentText()
             print(f"Selected Population Field: {population_field}")  # Debug statement
 
@@ -91,67 +236,647 @@ class AdditionalSchoolsDialog(QDialog, Ui_additionalSchoolsDialog):
                 return
             
             people_per_school = self.spinBox_peoplePerSchool.value()
+            area_field = self.comboBox_areaField.currentText()
+            parent_fields = [
+                field for field in (self.comboBox_level1Field.currentText(), self.comboBox_level2Field.currentText())
+                if field and field != "None"
+            ]
+
+            # Offline backends count on their own; the database options do not apply to them
+            if not self.backend.database_options:
+                results = self.backend.calculate_deficits(
+                    city_layer_name, schools_layer_name, population_field, people_per_school,
+                    area_field=area_field, parent_fields=parent_fields
+                )
+                if self.checkBox_resultsLayer.isChecked():
+                    self.add_results_layer(area_field, local_class_breaks(
+                        [row[4] for row in results if row[0] == area_field], self.spinBox_classes.value()
+                    ))
+                self.save_results_csv(results)
+                return
 
-            cursor.execute(sql.SQL("SELECT adm3_en, {population_field}, ST_Transform(geom, 4326) AS geom FROM {city_layer}").format(
-                population_field=sql.Identifier(population_field),
-                city_layer=sql.Identifier(city_layer_name)
-            ))
-
-            city_features = cursor.fetchall()
-            total_population = sum([row[1] for row in city_features])
-
-            results = []
-
-            for feature in city_features:
-                area_name = feature[0]
-                population = feature[1]
-                geom = feature[2]
-
-                required_schools = round(population / people_per_school)
-                cursor.execute(sql.SQL("""
-                    SELECT COUNT(*) FROM {schools_layer}
-                    WHERE ST_Within(ST_Transform(geom, 4326), %s)
-                """).format(
-                    schools_layer=sql.Identifier(schools_layer_name)
-                ), [geom])
-                available_schools = cursor.fetchone()[0]
-                schools_to_add = max(0, round(required_schools - available_schools))
-                label = f"{area_name} = {schools_to_add}"
-
-                results.append([area_name, required_schools, available_schools, schools_to_add])
-
-                cursor.execute("""
-                    INSERT INTO results_table (area_name, required_schools, available_schools, schools_to_add, geom)
-                    VALUES (%s, %s, %s, %s, %s)
-                    ON CONFLICT (area_name) DO UPDATE SET
-                    required_schools = EXCLUDED.required_schools,
-                    available_schools = EXCLUDED.available_schools,
-                    schools_to_add = EXCLUDED.schools_to_add,
-                    geom = EXCLUDED.geom
-                """, [area_name, required_schools, available_schools, schools_to_add, geom])
-
-            # Ask the user for the save location
-            save_path, _ = QFileDialog.getSaveFileName(self, "Save CSV", "", "CSV Files (*.csv)")
-            if save_path:
-                # Save the results to a CSV file
-                with open(save_path, 'w', newline='') as csvfile:
-                    fieldnames = ['Area', 'Required Schools', 'Available Schools', 'Schools to Add']
-                    writer = csv.writer(csvfile)
-                    writer.writerow(fieldnames)
-                    writer.writerows(results)
-                self.show_info(f"Results have been updated in the database and saved to {save_path}.")
+            # Everything the run writes is committed at once and rolled back if any step fails
+            if self.checkBox_sharded.isChecked():
+                shards = parse_shards(QgsSettings().value("additional_schools/shards", ""))
+                if not shards:
+                    self.show_error("No regional databases are configured in the additional_schools/shards setting.")
+                    return
+                outcome = self.router.run(lambda connection: self.run_national_calculation(
+                    connection, shards, city_layer_name, schools_layer_name, population_field, people_per_school,
+                    area_field, parent_fields
+                ))
             else:
-                self.show_info(f"Results have been updated in the database, but no CSV file was saved.")
+                outcome = self.router.run(lambda connection: self.run_calculation(
+                    connection, city_layer_name, schools_layer_name, population_field, people_per_school,
+                    area_field, parent_fields
+                ))
 
-            connection.commit()
-            cursor.close()
-            connection.close()
+            if outcome['results_breaks'] is not None:
+                self.add_results_layer(area_field, outcome['results_breaks'], outcome['results_table'])
+            if outcome['proposals']:
+                self.add_proposed_sites_layer(*outcome['proposals'])
+            if outcome['grid']:
+                self.add_grid_layer(*outcome['grid'])
+            if outcome['catchments']:
+                self.add_catchments_layer(outcome['catchments'][0])
+
+            save_path = self.save_results_csv(outcome['results'])
+            if outcome['duplicates'] is not None:
+                self.save_duplicates_report(outcome['duplicates'], save_path)
+            if outcome['catchments']:
+                self.save_overload_report(*outcome['catchments'][1:], save_path)
+            if outcome['plans']:
+                self.save_query_plans(*outcome['plans'], save_path)
+            if outcome['surface']:
+                self.save_coverage_surface(outcome['surface'], save_path)
+            if outcome['uncertainty']:
+                low, median, high = (value for _, value in outcome['uncertainty'])
+                self.show_info(
+                    f"{median} schools to add, between {low} and {high} in 90% of {self.spinBox_draws.value()} draws. "
+                    f"The percentiles of every area are in the {UNCERTAINTY_TABLE} table."
+                )
+            if self.comboBox_columnarFormat.currentIndex():
+                self.export_columnar(outcome, save_path)
+        except DatabaseUnavailableError as error:
+            self.show_error(f"The database is unavailable, please try again later.\n\n{error}")
+        except ShardError as error:
+            self.show_error(
+                f"These regional databases failed: {error}\n\n"
+                "The counts of the other regions were kept; run again to retry only the failed ones."
+            )
+        except QueryCanceled:
+            self.show_error(
+                "A query ran longer than the statement timeout and was cancelled. The run was rolled back.\n\n"
+                "Large layers are counted in one statement unless the run is chunked; set a chunk size, or raise the "
+                "additional_schools/statement_timeout setting."
+            )
         except (Exception, psycopg2.DatabaseError) as error:
             self.show_error(f"Error during calculation: {error}")
 
+    def run_calculation(self, connection, city_layer_name, schools_layer_name, population_field, people_per_school,
+                        area_field, parent_fields):
+        """
+        Run the database part of a calculation on ``connection`` and return what the dialog shows of it.
+
+        The caller commits. Caches and checkpoints are committed on the way so
+        they survive a failed run, the results and run history only at the end.
+        """
+        cursor = connection.cursor()
+
+        # Capture the query plans of the run when diagnosing a slow database
+        if self.checkBox_capturePlans.isChecked():
+            cursor = ExplainCursor(cursor)
+
+        # Let the table statistics decide the strategy unless the user set it by hand
+        if self.checkBox_autoPlan.isChecked():
+            plan = choose_plan(table_statistics(cursor, city_layer_name, schools_layer_name), os.cpu_count() or 1)
+            QgsMessageLog.logMessage(
+                f"Chose the {plan.strategy} strategy: " + "; ".join(plan.reasons), "Additional Schools", Qgis.Info
+            )
+        else:
+            plan = self.manual_plan()
+
+        # Split complex areas into small indexed pieces, reusing the cached pieces of unchanged areas
+        pieces_table = None
+        if plan.max_vertices:
+            pieces_table = refresh_subdivided(cursor, city_layer_name, schools_layer_name, plan.max_vertices)
+            connection.commit()
+
+        # Count against a copy of the schools layer with duplicates from merged sources removed
+        counted_schools = schools_layer_name
+        duplicates = None
+        if self.spinBox_duplicateTolerance.value():
+            name_field = self.comboBox_schoolNameField.currentText()
+            counted_schools = refresh_deduplicated(
+                cursor, schools_layer_name, self.spinBox_duplicateTolerance.value(),
+                name_field=None if name_field in ("", "None") else name_field
+            )
+            duplicates = merged_duplicates(cursor, counted_schools)
+            connection.commit()
+
+        # Read from the replica once it has replayed everything committed above, else from the primary
+        read_endpoint = self.router.read_endpoint(current_lsn(connection) if self.router.has_replica else None)
+        read_connection = connection if read_endpoint == self.router.write_dsn else self.router.connect(read_endpoint)
+        try:
+            read_cursor = cursor if read_connection is connection else read_connection.cursor()
+
+            # Count schools per area once and roll the counts up to every admin level
+            chunk_size = plan.chunk_size
+            per_area = plan.strategy == PER_AREA
+            workers = plan.workers
+            counts = None
+            accessibility = self.checkBox_accessibility.isChecked()
+            uncertainty = self.checkBox_uncertainty.isChecked()
+            keep_counts = self.checkBox_projection.isChecked() or accessibility or uncertainty
+            if keep_counts and (per_area or chunk_size or workers > 1):
+                QgsMessageLog.logMessage(
+                    "Projections, travel times and uncertainty reuse the counts of one query, so the per-area, "
+                    "chunk and worker options are ignored for this run", "Additional Schools", Qgis.Warning
+                )
+            # Per-area and chunked runs write as they count, so they stay on the primary; workers read from the
+            # replica themselves, and a single query reads there and writes the roll-up here
+            if keep_counts or (read_connection is not connection and not (per_area or chunk_size or workers > 1)):
+                # Keep the counts, on the replica when there is one, so projections reuse them
+                counts = fetch_area_counts(
+                    read_cursor, city_layer_name, counted_schools, population_field,
+                    area_field=area_field, parent_fields=parent_fields, pieces_table=pieces_table
+                )
+                # Areas need schools for the people who cannot reach one in time rather than for their whole population
+                unserved = self.find_unserved_population(
+                    read_cursor, city_layer_name, counted_schools, population_field, area_field, parent_fields
+                ) if accessibility else None
+                results = calculate_deficits_from_counts(
+                    cursor, counts, people_per_school, area_field=area_field, parent_fields=parent_fields,
+                    unserved=unserved
+                )
+            elif per_area:
+                results = calculate_deficits_per_area(
+                    cursor, city_layer_name, counted_schools, population_field, people_per_school,
+                    area_field=area_field, parent_fields=parent_fields
+                )
+            elif chunk_size:
+                results = calculate_deficits_in_chunks(
+                    cursor, city_layer_name, counted_schools, population_field, people_per_school,
+                    area_field=area_field, parent_fields=parent_fields,
+                    chunk_size=chunk_size, resume=self.checkBox_resume.isChecked(), pieces_table=pieces_table
+                )
+            elif workers > 1:
+                results = calculate_deficits_in_parallel(
+                    cursor, lambda: self.router.connect(read_endpoint), city_layer_name, counted_schools, population_field,
+                    people_per_school, area_field=area_field, parent_fields=parent_fields,
+                    workers=workers, pieces_table=pieces_table
+                )
+            else:
+                results = calculate_deficits(
+                    cursor, city_layer_name, counted_schools, population_field, people_per_school,
+                    area_field=area_field, parent_fields=parent_fields, pieces_table=pieces_table
+                )
+
+            # Keep a copy of every run so deficits can be compared over time
+            record_run(cursor, {
+                'city_layer': city_layer_name,
+                'schools_layer': schools_layer_name,
+                'population_field': population_field,
+                'people_per_school': people_per_school,
+                'duplicate_tolerance': self.spinBox_duplicateTolerance.value(),
+                'area_field': area_field,
+                'parent_fields': parent_fields
+            }, results)
+            if self.checkBox_projection.isChecked():
+                self.project_deficits(read_cursor, cursor, counts, city_layer_name, population_field, people_per_school,
+                                      area_field, parent_fields)
+
+            outcome = {'results': results, 'results_table': DEFAULT_RESULTS_TABLE, 'duplicates': duplicates,
+                       'results_breaks': None, 'proposals': None, 'grid': None, 'catchments': None, 'plans': None,
+                       'uncertainty': None, 'surface': None}
+            if uncertainty:
+                outcome['uncertainty'] = self.simulate_deficits(
+                    cursor, counts, unserved, people_per_school, area_field, parent_fields
+                )
+            if self.checkBox_resultsLayer.isChecked():
+                outcome['results_breaks'] = class_breaks(
+                    cursor, DEFAULT_RESULTS_TABLE, area_field, self.spinBox_classes.value()
+                )
+
+            if self.checkBox_proposeSites.isChecked():
+                outcome['proposals'] = self.propose_school_sites(
+                    read_cursor, city_layer_name, counted_schools, population_field, area_field, results
+                )
+
+            # Show where within the areas schools are missing on a regular grid
+            if self.comboBox_gridShape.currentIndex():
+                outcome['grid'] = self.analyse_grid(
+                    read_cursor, cursor, city_layer_name, counted_schools, population_field, people_per_school
+                )
+
+            # Assign the population to the nearest schools to find the schools serving too many people
+            if self.checkBox_catchments.isChecked():
+                outcome['catchments'] = self.analyse_catchments(
+                    read_cursor, cursor, city_layer_name, counted_schools, population_field, people_per_school
+                )
+
+            # Rasterize the schools and population for the coverage surface written with the results
+            if self.checkBox_surface.isChecked():
+                outcome['surface'] = self.rasterize_coverage(
+                    read_cursor, city_layer_name, counted_schools, population_field, people_per_school
+                )
+
+            if isinstance(cursor, ExplainCursor):
+                outcome['plans'] = (cursor.statements, find_issues(cursor.wrapped, cursor.statements))
+            return outcome
+        finally:
+            if read_connection is not connection:
+                read_connection.close()
+
+    def run_national_calculation(self, connection, shards, city_layer_name, schools_layer_name, population_field,
+                                 people_per_school, area_field, parent_fields):
+        """Count every regional database, merge their deficits into the national table and return what the dialog shows."""
+        cursor = connection.cursor()
+        results = calculate_national_deficits(
+            cursor, shards, self.router.connect, city_layer_name, schools_layer_name, population_field,
+            people_per_school, area_field=area_field, parent_fields=parent_fields
+        )
+        record_run(cursor, {
+            'city_layer': city_layer_name,
+            'schools_layer': schools_layer_name,
+            'population_field': population_field,
+            'people_per_school': people_per_school,
+            'shards': list(shards),
+            'area_field': area_field,
+            'parent_fields': parent_fields
+        }, results)
+        breaks = None
+        if self.checkBox_resultsLayer.isChecked():
+            breaks = class_breaks(cursor, NATIONAL_RESULTS_TABLE, area_field, self.spinBox_classes.value())
+        return {'results': results, 'results_table': NATIONAL_RESULTS_TABLE, 'duplicates': None,
+                'results_breaks': breaks, 'proposals': None, 'grid': None, 'catchments': None, 'plans': None,
+                'uncertainty': None, 'surface': None}
+
+    def manual_plan(self):
+        """Return the plan of the strategy options set by hand, leaving the widgets as they are."""
+        chunk_size = self.spinBox_chunkSize.value()
+        workers = self.spinBox_workers.value()
+        if self.checkBox_perArea.isChecked():
+            strategy = PER_AREA
+        elif chunk_size:
+            strategy = CHUNKED
+        elif workers > 1:
+            strategy = PARALLEL
+        else:
+            strategy = PLAIN
+        max_vertices = self.spinBox_maxVertices.value() if self.checkBox_subdivide.isChecked() else 0
+        return Plan(strategy, chunk_size=chunk_size, workers=workers, max_vertices=max_vertices,
+                    reasons=["set by hand"])
+
+    def analyse_grid(self, read_cursor, cursor, city_layer_name, schools_layer_name, population_field, people_per_school):
+        """Calculate the deficits of every grid cell, store them and return the grid SRID and class breaks."""
+        shape = HEXAGON if self.comboBox_gridShape.currentIndex() == 1 else SQUARE
+        size = self.spinBox_cellSize.value()
+        srid = metric_srid(read_cursor, city_layer_name)
+        cell_i, cell_j, population = fetch_cell_population(
+            read_cursor.connection, city_layer_name, population_field, srid, size, shape
+        )
+        cells = grid_deficits(
+            cell_i, cell_j, population, fetch_school_points(read_cursor, schools_layer_name, srid),
+            size, shape, people_per_school
+        )
+        write_grid(cursor, cells, size, shape, srid)
+        return srid, local_class_breaks(cells['schools_to_add'], self.spinBox_classes.value())
+
+    def analyse_catchments(self, read_cursor, cursor, city_layer_name, schools_layer_name, population_field,
+                           people_per_school):
+        """
+        Assign the population to the nearest schools and store the catchments of the overloaded ones.
+
+        Returns the SRID of the catchments, the report rows of the overloaded
+        schools and the number of schools.
+        """
+        srid = metric_srid(read_cursor, city_layer_name)
+        if self.comboBox_gridShape.currentIndex():
+            # Grid cells spread the population of large areas over the schools around them
+            shape = HEXAGON if self.comboBox_gridShape.currentIndex() == 1 else SQUARE
+            size = self.spinBox_cellSize.value()
+            cell_i, cell_j, population = fetch_cell_population(
+                read_cursor.connection, city_layer_name, population_field, srid, size, shape
+            )
+            points = cell_centres(cell_i, cell_j, size, shape)
+        else:
+            points, population = fetch_area_points(read_cursor, city_layer_name, population_field, srid)
+
+        # De-duplicated schools keep their names in their own column
+        name_field = self.comboBox_schoolNameField.currentText()
+        if schools_layer_name != self.comboBox_schoolsLayer.currentText():
+            name_field = "name"
+        # The row ids only hold within one transaction, so the schools are read where their catchments are written
+        school_ids, names, schools, lonlat = fetch_schools(
+            cursor, schools_layer_name, srid, None if name_field in ("", "None") else name_field
+        )
+        served, load = school_loads(schools, points, population, people_per_school)
+        write_catchments(cursor, city_layer_name, schools_layer_name, school_ids, names, served, load, srid)
+        return srid, overloaded_schools(names, lonlat, served, load), len(school_ids)
+
+    def find_unserved_population(self, read_cursor, city_layer_name, schools_layer_name, population_field, area_field,
+                                 parent_fields):
+        """
+        Return the population of every area that cannot reach a school over the road network in the time set.
+
+        Areas are keyed by their (level_1 .. level_n, area key) tuples, like the counts.
+        """
+        graph = load_graph(*self.road_network)
+        threshold = self.spinBox_travelMinutes.value() * 60
+        area_keys, points, population = fetch_demand_points(
+            read_cursor, city_layer_name, population_field, area_field, metric_srid(read_cursor, city_layer_name),
+            graph.srid, self.spinBox_cellSize.value(), parent_fields
+        )
+        times = travel_times(
+            graph, fetch_school_points(read_cursor, schools_layer_name, graph.srid), points,
+            speed=self.spinBox_travelSpeed.value(), limit=threshold
+        )
+        return unserved_population(area_keys, times, population, threshold)
+
+    def rasterize_coverage(self, read_cursor, city_layer_name, schools_layer_name, population_field, people_per_school):
+        """
+        Rasterize the population and schools on grid cells of the chosen size into memory-mapped files.
+
+        Returns what :meth:`save_coverage_surface` needs: the scratch
+        directory of the rasters, their window, cell size and SRID, and the
+        people per school.
+        """
+        size = self.spinBox_cellSize.value()
+        srid = metric_srid(read_cursor, city_layer_name)
+        window = layer_window(read_cursor, city_layer_name, srid, size)
+        directory = tempfile.mkdtemp(prefix="additional_schools_surface_")
+        try:
+            schools, population = create_rasters(directory, window)
+            for cells in iter_cell_population(read_cursor.connection, city_layer_name, population_field, srid, size, SQUARE):
+                rasterize(population, cells[:, 0], cells[:, 1], cells[:, 2], window)
+            school_i, school_j = square_cells(fetch_school_points(read_cursor, schools_layer_name, srid), size)
+            rasterize(schools, school_i, school_j, [1] * len(school_i), window)
+            schools.flush()
+            population.flush()
+        except Exception:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+        return directory, window, size, srid, people_per_school
+
+    def project_deficits(self, read_cursor, cursor, counts, city_layer_name, population_field, people_per_school,
+                         area_field, parent_fields):
+        """Project the deficits of every area and admin level over the chosen years and store them."""
+        keys = [tuple(row[:len(parent_fields) + 1]) for row in counts]
+        rate_field = self.comboBox_growthRateField.currentText()
+        rates_table = self.comboBox_growthRateTable.currentText()
+        rates = area_growth_rates(
+            keys, self.doubleSpinBox_growthRate.value() / 100, area_field, parent_fields,
+            area_rates=fetch_area_rates(read_cursor, city_layer_name, population_field, area_field, rate_field)
+            if rate_field not in ("", "None") else None,
+            level_rates=fetch_level_rates(read_cursor, rates_table) if rates_table not in ("", "None") else None
+        )
+        population = [row[len(parent_fields) + 1] or 0 for row in counts]
+        available = [row[len(parent_fields) + 2] for row in counts]
+        write_projection(cursor, projection_rows(
+            keys, population, available, rates, datetime.date.today().year, self.spinBox_projectionYears.value(),
+            people_per_school, area_field, parent_fields
+        ))
+
+    def simulate_deficits(self, cursor, counts, unserved, people_per_school, area_field, parent_fields):
+        """
+        Simulate the schools to add from uncertain populations, store their percentiles and return the bands of the total.
+
+        With travel times, only the population beyond reach of a school is
+        simulated, as the calculation counted it.
+        """
+        keys = [tuple(row[:len(parent_fields) + 1]) for row in counts]
+        if unserved is None:
+            population = [row[len(parent_fields) + 1] or 0 for row in counts]
+            available = [row[len(parent_fields) + 2] for row in counts]
+        else:
+            population = [unserved.get(key, 0) for key in keys]
+            available = [0] * len(keys)
+        rows = deficit_percentiles(
+            keys, population, available, people_per_school, area_field, parent_fields,
+            draws=self.spinBox_draws.value(),
+            population_error=self.doubleSpinBox_populationError.value() / 100,
+            ratio_error=self.doubleSpinBox_ratioError.value() / 100,
+            distribution=DISTRIBUTIONS[self.comboBox_uncertaintyDistribution.currentIndex()]
+        )
+        write_uncertainty(cursor, rows)
+        return [row[2:4] for row in rows if row[0] == TOTAL_LEVEL]
+
+    def save_results_csv(self, results):
+        """Ask the user for a location, save the results there as CSV and return the chosen path."""
+        save_path, _ = QFileDialog.getSaveFileName(self, "Save CSV", "", "CSV Files (*.csv)")
+        if save_path:
+            # Save the results to a CSV file
+            import csv
+            with open(save_path, 'w', newline='') as csvfile:
+                fieldnames = ['Level', 'Area', 'Required Schools', 'Available Schools', 'Schools to Add', 'Parent Areas']
+                writer = csv.writer(csvfile)
+                writer.writerow(fieldnames)
+                writer.writerows(results)
+            self.show_info(f"Results have been updated in the database and saved to {save_path}.")
+        else:
+            self.show_info(f"Results have been updated in the database, but no CSV file was saved.")
+        return save_path
+
+    def add_results_layer(self, area_field, breaks, results_table=DEFAULT_RESULTS_TABLE):
+        """Add the areas of the results table to the project, already classified by schools to add and labelled."""
+        from qgis.core import QgsDataSourceUri, QgsWkbTypes
+
+        subset = "admin_level = '{}'".format(area_field.replace("'", "''"))
+        if not self.backend.database_options:
+            layer = QgsVectorLayer(f"{self.backend.path}|layername={DEFAULT_RESULTS_TABLE}|subset={subset}", "Schools to add", "ogr")
+        else:
+            # Declaring the key, geometry type and SRID spares the provider from scanning the table for them
+            uri = QgsDataSourceUri(self.router.write_dsn)
+            uri.setDataSource("public", results_table, "geom", subset, "id")
+            uri.setWkbType(QgsWkbTypes.MultiPolygon)
+            uri.setSrid("4326")
+            uri.setUseEstimatedMetadata(True)
+            layer = QgsVectorLayer(uri.uri(False), "Schools to add", "postgres")
+        if not layer.isValid():
+            self.show_error("The results table could not be loaded as a layer.")
+            return
+        self.style_classified_layer(layer, breaks, f"\"area_name\" || '\\n' || \"{CLASS_FIELD}\"")
+        QgsProject.instance().addMapLayer(layer)
+
+    def add_grid_layer(self, srid, breaks):
+        """Add the grid cells to the project, classified by schools to add."""
+        from qgis.core import QgsDataSourceUri, QgsWkbTypes
+
+        uri = QgsDataSourceUri(self.router.write_dsn)
+        uri.setDataSource("public", GRID_TABLE, "geom", "", "cell_id")
+        uri.setWkbType(QgsWkbTypes.Polygon)
+        uri.setSrid(str(srid))
+        uri.setUseEstimatedMetadata(True)
+        layer = QgsVectorLayer(uri.uri(False), "Schools to add per cell", "postgres")
+        if not layer.isValid():
+            self.show_error("The grid table could not be loaded as a layer.")
+            return
+        self.style_classified_layer(layer, breaks)
+        QgsProject.instance().addMapLayer(layer)
+
+    def add_catchments_layer(self, srid):
+        """Add the catchments of the overloaded schools to the project."""
+        from qgis.core import QgsDataSourceUri, QgsWkbTypes
+
+        uri = QgsDataSourceUri(self.router.write_dsn)
+        uri.setDataSource("public", CATCHMENT_TABLE, "geom", "", "id")
+        uri.setWkbType(QgsWkbTypes.MultiPolygon)
+        uri.setSrid(str(srid))
+        uri.setUseEstimatedMetadata(True)
+        layer = QgsVectorLayer(uri.uri(False), "Overloaded school catchments", "postgres")
+        if not layer.isValid():
+            self.show_error("The catchments table could not be loaded as a layer.")
+            return
+        QgsProject.instance().addMapLayer(layer)
+
+    def style_classified_layer(self, layer, breaks, label_expression=None):
+        """Classify ``layer`` by schools to add between the given breaks and label it with ``label_expression``."""
+        from PyQt5.QtGui import QColor
+        from qgis.core import (
+            QgsGradientColorRamp, QgsGraduatedSymbolRenderer, QgsPalLayerSettings, QgsRendererRange, QgsSymbol,
+            QgsTextFormat, QgsVectorLayerSimpleLabeling
+        )
+
+        # Classes come from breaks computed where the data lives, so QGIS never classifies the layer itself
+        ramp = QgsGradientColorRamp(QColor(255, 255, 204), QColor(189, 0, 38))
+        classes = class_ranges(breaks)
+        ranges = []
+        for index, (lower, upper, label) in enumerate(classes):
+            symbol = QgsSymbol.defaultSymbol(layer.geometryType())
+            symbol.setColor(ramp.color(index / max(1, len(classes) - 1)))
+            ranges.append(QgsRendererRange(lower, upper, symbol, label))
+        layer.setRenderer(QgsGraduatedSymbolRenderer(CLASS_FIELD, ranges))
+        if label_expression is None:
+            return
+
+        label_settings = QgsPalLayerSettings()
+        label_settings.fieldName = label_expression
+        label_settings.isExpression = True
+        text_format = QgsTextFormat()
+        text_format.setSize(8)
+        label_settings.setFormat(text_format)
+        layer.setLabeling(QgsVectorLayerSimpleLabeling(label_settings))
+        layer.setLabelsEnabled(True)
+
+    def propose_school_sites(self, cursor, city_layer_name, schools_layer_name, population_field, area_field, results):
+        """Propose locations for the missing schools of each area and return their SRID and the proposals."""
+        # Sites are placed per area key, so areas of the same name under different parents share theirs
+        schools_to_add = {}
+        for row in results:
+            if row[0] == area_field:
+                schools_to_add[row[1]] = schools_to_add.get(row[1], 0) + row[4]
+        candidates_layer = self.comboBox_candidatesLayer.currentText()
+        return propose_sites(
+            cursor, city_layer_name, schools_layer_name, population_field, area_field, schools_to_add,
+            radius=self.spinBox_serviceRadius.value(),
+            candidates_layer=None if candidates_layer == "Grid candidates" else candidates_layer
+        )
+
+    def add_proposed_sites_layer(self, srid, proposals):
+        """Add the proposed school sites to the project as a point layer."""
+        if not proposals:
+            return
+
+        layer = QgsVectorLayer(f"Point?crs=EPSG:{srid}", "Proposed schools", "memory")
+        provider = layer.dataProvider()
+        provider.addAttributes([
+            QgsField("area_name", QVariant.String),
+            QgsField("rank", QVariant.Int),
+            QgsField("covered_population", QVariant.Double)
+        ])
+        layer.updateFields()
+
+        features = []
+        for area_name, rank, x, y, covered_population in proposals:
+            feature = QgsFeature(layer.fields())
+            feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(x, y)))
+            feature.setAttributes([area_name, rank, covered_population])
+            features.append(feature)
+        provider.addFeatures(features)
+        layer.updateExtents()
+        QgsProject.instance().addMapLayer(layer)
+
+    def save_duplicates_report(self, duplicates, save_path):
+        """Save the schools that were merged as duplicates next to the CSV report."""
+        import csv
+        if save_path:
+            report_path = os.path.splitext(save_path)[0] + "_duplicates.csv"
+        else:
+            report_path = os.path.join(tempfile.gettempdir(), "additional_schools_duplicates.csv")
+        with open(report_path, 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(['Kept School', 'Longitude', 'Latitude', 'Schools Merged', 'Merged Names'])
+            writer.writerows(duplicates)
+        merged = sum(row[3] - 1 for row in duplicates)
+        self.show_info(f"{merged} duplicate schools were merged into {len(duplicates)} schools; see {report_path}.")
+
+    def save_overload_report(self, overloaded, schools, save_path):
+        """Save the overloaded schools next to the CSV report."""
+        import csv
+        if save_path:
+            report_path = os.path.splitext(save_path)[0] + "_overloaded.csv"
+        else:
+            report_path = os.path.join(tempfile.gettempdir(), "additional_schools_overloaded.csv")
+        with open(report_path, 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(['School', 'Longitude', 'Latitude', 'Population Served', 'Load'])
+            writer.writerows(overloaded)
+        self.show_info(f"{len(overloaded)} of {schools} schools serve more than one school's population; see {report_path}.")
+
+    def save_coverage_surface(self, surface, save_path):
+        """Smooth the rasters of :meth:`rasterize_coverage` into a GeoTIFF next to the CSV report and add it to the project."""
+        directory, window, size, srid, people_per_school = surface
+        if save_path:
+            surface_path = os.path.splitext(save_path)[0] + "_coverage.tif"
+        else:
+            surface_path = os.path.join(tempfile.gettempdir(), "additional_schools_coverage.tif")
+        mode = RATIO if self.comboBox_surfaceMode.currentIndex() == 0 else GAP
+        try:
+            write_geotiff(surface_path, *open_rasters(directory), window, size, srid, people_per_school, mode,
+                          bandwidth=self.spinBox_bandwidth.value())
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        layer = QgsRasterLayer(surface_path, "Coverage surface")
+        if not layer.isValid():
+            self.show_error(f"The coverage surface was written to {surface_path} but could not be loaded as a layer.")
+            return
+        QgsProject.instance().addMapLayer(layer)
+
+    def save_query_plans(self, statements, issues, save_path):
+        """Save the captured query plans and the issues found in them next to the CSV report."""
+        if save_path:
+            report_path = os.path.splitext(save_path)[0] + "_plans.json"
+        else:
+            report_path = os.path.join(tempfile.gettempdir(), "additional_schools_plans.json")
+        write_report(report_path, statements, issues)
+        message = f"Query plans of {len(statements)} statements saved to {report_path}."
+        if issues:
+            message += "\n\n" + "\n".join(f"{issue['relation']}: {issue['issue']}" for issue in issues)
+        self.show_info(message)
+
+    def export_columnar(self, outcome, save_path):
+        """Export the results, and the grid when one was analysed, as GeoParquet or Arrow IPC next to the CSV report."""
+        file_format = PARQUET if self.comboBox_columnarFormat.currentIndex() == 1 else ARROW
+        if save_path:
+            base = os.path.splitext(save_path)[0]
+        else:
+            base = os.path.join(tempfile.gettempdir(), "additional_schools")
+        geometry = self.checkBox_exportGeometry.isChecked()
+
+        # The results were just committed on the primary, which the replica may not have replayed yet
+        connection = self.router.connect_write()
+        try:
+            connection.set_session(readonly=True)
+            paths = [base + EXTENSIONS[file_format]]
+            rows = export_table(connection, outcome['results_table'], RESULT_COLUMNS, paths[0], file_format,
+                                srid=4326 if geometry else None)
+            if outcome['grid']:
+                paths.append(base + "_grid" + EXTENSIONS[file_format])
+                export_table(connection, GRID_TABLE, GRID_COLUMNS, paths[1], file_format,
+                             srid=outcome['grid'][0] if geometry else None, geometry_types=['Polygon'])
+        finally:
+            connection.close()
+        self.show_info(f"{rows} result rows exported to {', '.join(paths)}.")
+
+    def show_run_history(self):
+        """Open the dialog comparing recorded runs."""
+        from .run_history_dialog import RunHistoryDialog
+        RunHistoryDialog(self.connect_to_db, self).exec_()
+
+    def load_database_router(self):
+        """Read the primary and read replica endpoints from the QGIS settings."""
+        settings = QgsSettings()
+        return DatabaseRouter(
+            write_dsn=settings.value("additional_schools/write_dsn", DEFAULT_DSN),
+            read_dsn=settings.value("additional_schools/read_dsn", "") or None,
+            max_lag_seconds=settings.value("additional_schools/max_replica_lag", 0, type=int),
+            statement_timeout=settings.value("additional_schools/statement_timeout", DEFAULT_STATEMENT_TIMEOUT, type=int)
+        )
+
     def connect_to_db(self):
-        """Establish a database connection."""
-        return psycopg2.connect(database="additional schools", user="postgres", password="fargo", host="localhost", port="5432")
+        """Establish a database connection to the primary, where results are written."""
+        return self.router.connect_write()
 
     def show_error(self, message):
         """Show error message to the user."""
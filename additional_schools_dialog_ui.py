@@ -14,7 +14,7 @@ from PyQt5 import QtCore, QtGui, QtWidgets
 class Ui_additionalSchoolsDialog(object):
     def setupUi(self, additionalSchoolsDialog):
         additionalSchoolsDialog.setObjectName("additionalSchoolsDialog")
-        additionalSchoolsDialog.resize(641, 300)
+        additionalSchoolsDialog.resize(641, 690)
         self.label_cityLayer = QtWidgets.QLabel(additionalSchoolsDialog)
         self.label_cityLayer.setGeometry(QtCore.QRect(10, 0, 380, 20))
         self.label_cityLayer.setObjectName("label_cityLayer")
@@ -33,6 +33,24 @@ class Ui_additionalSchoolsDialog(object):
         self.comboBox_populationField = QtWidgets.QComboBox(additionalSchoolsDialog)
         self.comboBox_populationField.setGeometry(QtCore.QRect(10, 100, 380, 25))
         self.comboBox_populationField.setObjectName("comboBox_populationField")
+        self.label_areaField = QtWidgets.QLabel(additionalSchoolsDialog)
+        self.label_areaField.setGeometry(QtCore.QRect(400, 0, 230, 20))
+        self.label_areaField.setObjectName("label_areaField")
+        self.comboBox_areaField = QtWidgets.QComboBox(additionalSchoolsDialog)
+        self.comboBox_areaField.setGeometry(QtCore.QRect(400, 20, 230, 25))
+        self.comboBox_areaField.setObjectName("comboBox_areaField")
+        self.label_level1Field = QtWidgets.QLabel(additionalSchoolsDialog)
+        self.label_level1Field.setGeometry(QtCore.QRect(400, 40, 230, 20))
+        self.label_level1Field.setObjectName("label_level1Field")
+        self.comboBox_level1Field = QtWidgets.QComboBox(additionalSchoolsDialog)
+        self.comboBox_level1Field.setGeometry(QtCore.QRect(400, 60, 230, 25))
+        self.comboBox_level1Field.setObjectName("comboBox_level1Field")
+        self.label_level2Field = QtWidgets.QLabel(additionalSchoolsDialog)
+        self.label_level2Field.setGeometry(QtCore.QRect(400, 80, 230, 20))
+        self.label_level2Field.setObjectName("label_level2Field")
+        self.comboBox_level2Field = QtWidgets.QComboBox(additionalSchoolsDialog)
+        self.comboBox_level2Field.setGeometry(QtCore.QRect(400, 100, 230, 25))
+        self.comboBox_level2Field.setObjectName("comboBox_level2Field")
         self.label_peoplePerSchool = QtWidgets.QLabel(additionalSchoolsDialog)
         self.label_peoplePerSchool.setGeometry(QtCore.QRect(10, 130, 380, 20))
         self.label_peoplePerSchool.setObjectName("label_peoplePerSchool")
@@ -42,6 +60,228 @@ class Ui_additionalSchoolsDialog(object):
         self.spinBox_peoplePerSchool.setMaximum(100000)
         self.spinBox_peoplePerSchool.setProperty("value", 2000)
         self.spinBox_peoplePerSchool.setObjectName("spinBox_peoplePerSchool")
+        self.label_serviceRadius = QtWidgets.QLabel(additionalSchoolsDialog)
+        self.label_serviceRadius.setGeometry(QtCore.QRect(400, 130, 230, 20))
+        self.label_serviceRadius.setObjectName("label_serviceRadius")
+        self.spinBox_serviceRadius = QtWidgets.QSpinBox(additionalSchoolsDialog)
+        self.spinBox_serviceRadius.setGeometry(QtCore.QRect(400, 150, 100, 25))
+        self.spinBox_serviceRadius.setMinimum(100)
+        self.spinBox_serviceRadius.setMaximum(100000)
+        self.spinBox_serviceRadius.setProperty("value", 2000)
+        self.spinBox_serviceRadius.setObjectName("spinBox_serviceRadius")
+        self.checkBox_proposeSites = QtWidgets.QCheckBox(additionalSchoolsDialog)
+        self.checkBox_proposeSites.setGeometry(QtCore.QRect(510, 150, 120, 25))
+        self.checkBox_proposeSites.setObjectName("checkBox_proposeSites")
+        self.label_candidatesLayer = QtWidgets.QLabel(additionalSchoolsDialog)
+        self.label_candidatesLayer.setGeometry(QtCore.QRect(400, 175, 230, 20))
+        self.label_candidatesLayer.setObjectName("label_candidatesLayer")
+        self.comboBox_candidatesLayer = QtWidgets.QComboBox(additionalSchoolsDialog)
+        self.comboBox_candidatesLayer.setGeometry(QtCore.QRect(400, 195, 230, 25))
+        self.comboBox_candidatesLayer.setObjectName("comboBox_candidatesLayer")
+        self.checkBox_capturePlans = QtWidgets.QCheckBox(additionalSchoolsDialog)
+        self.checkBox_capturePlans.setGeometry(QtCore.QRect(120, 150, 260, 25))
+        self.checkBox_capturePlans.setObjectName("checkBox_capturePlans")
+        self.label_chunkSize = QtWidgets.QLabel(additionalSchoolsDialog)
+        self.label_chunkSize.setGeometry(QtCore.QRect(400, 225, 230, 20))
+        self.label_chunkSize.setObjectName("label_chunkSize")
+        self.spinBox_chunkSize = QtWidgets.QSpinBox(additionalSchoolsDialog)
+        self.spinBox_chunkSize.setGeometry(QtCore.QRect(400, 245, 100, 25))
+        self.spinBox_chunkSize.setMinimum(0)
+        self.spinBox_chunkSize.setMaximum(100000)
+        self.spinBox_chunkSize.setProperty("value", 0)
+        self.spinBox_chunkSize.setObjectName("spinBox_chunkSize")
+        self.checkBox_resume = QtWidgets.QCheckBox(additionalSchoolsDialog)
+        self.checkBox_resume.setGeometry(QtCore.QRect(510, 245, 120, 25))
+        self.checkBox_resume.setChecked(True)
+        self.checkBox_resume.setObjectName("checkBox_resume")
+        self.label_workers = QtWidgets.QLabel(additionalSchoolsDialog)
+        self.label_workers.setGeometry(QtCore.QRect(10, 240, 380, 20))
+        self.label_workers.setObjectName("label_workers")
+        self.spinBox_workers = QtWidgets.QSpinBox(additionalSchoolsDialog)
+        self.spinBox_workers.setGeometry(QtCore.QRect(10, 260, 100, 25))
+        self.spinBox_workers.setMinimum(1)
+        self.spinBox_workers.setMaximum(64)
+        self.spinBox_workers.setProperty("value", 1)
+        self.spinBox_workers.setObjectName("spinBox_workers")
+        self.label_maxVertices = QtWidgets.QLabel(additionalSchoolsDialog)
+        self.label_maxVertices.setGeometry(QtCore.QRect(10, 290, 380, 20))
+        self.label_maxVertices.setObjectName("label_maxVertices")
+        self.spinBox_maxVertices = QtWidgets.QSpinBox(additionalSchoolsDialog)
+        self.spinBox_maxVertices.setGeometry(QtCore.QRect(10, 310, 100, 25))
+        self.spinBox_maxVertices.setMinimum(5)
+        self.spinBox_maxVertices.setMaximum(100000)
+        self.spinBox_maxVertices.setProperty("value", 256)
+        self.spinBox_maxVertices.setObjectName("spinBox_maxVertices")
+        self.checkBox_subdivide = QtWidgets.QCheckBox(additionalSchoolsDialog)
+        self.checkBox_subdivide.setGeometry(QtCore.QRect(120, 310, 260, 25))
+        self.checkBox_subdivide.setObjectName("checkBox_subdivide")
+        self.checkBox_perArea = QtWidgets.QCheckBox(additionalSchoolsDialog)
+        self.checkBox_perArea.setGeometry(QtCore.QRect(120, 175, 260, 25))
+        self.checkBox_perArea.setObjectName("checkBox_perArea")
+        self.button_history = QtWidgets.QPushButton(additionalSchoolsDialog)
+        self.button_history.setGeometry(QtCore.QRect(260, 200, 100, 30))
+        self.button_history.setObjectName("button_history")
+        self.label_dataSource = QtWidgets.QLabel(additionalSchoolsDialog)
+        self.label_dataSource.setGeometry(QtCore.QRect(10, 340, 380, 20))
+        self.label_dataSource.setObjectName("label_dataSource")
+        self.comboBox_dataSource = QtWidgets.QComboBox(additionalSchoolsDialog)
+        self.comboBox_dataSource.setGeometry(QtCore.QRect(10, 360, 380, 25))
+        self.comboBox_dataSource.setObjectName("comboBox_dataSource")
+        self.label_duplicateTolerance = QtWidgets.QLabel(additionalSchoolsDialog)
+        self.label_duplicateTolerance.setGeometry(QtCore.QRect(400, 275, 230, 20))
+        self.label_duplicateTolerance.setObjectName("label_duplicateTolerance")
+        self.spinBox_duplicateTolerance = QtWidgets.QSpinBox(additionalSchoolsDialog)
+        self.spinBox_duplicateTolerance.setGeometry(QtCore.QRect(400, 295, 100, 25))
+        self.spinBox_duplicateTolerance.setMinimum(0)
+        self.spinBox_duplicateTolerance.setMaximum(10000)
+        self.spinBox_duplicateTolerance.setProperty("value", 0)
+        self.spinBox_duplicateTolerance.setObjectName("spinBox_duplicateTolerance")
+        self.label_schoolNameField = QtWidgets.QLabel(additionalSchoolsDialog)
+        self.label_schoolNameField.setGeometry(QtCore.QRect(400, 325, 230, 20))
+        self.label_schoolNameField.setObjectName("label_schoolNameField")
+        self.comboBox_schoolNameField = QtWidgets.QComboBox(additionalSchoolsDialog)
+        self.comboBox_schoolNameField.setGeometry(QtCore.QRect(400, 345, 230, 25))
+        self.comboBox_schoolNameField.setObjectName("comboBox_schoolNameField")
+        self.checkBox_projection = QtWidgets.QCheckBox(additionalSchoolsDialog)
+        self.checkBox_projection.setGeometry(QtCore.QRect(10, 395, 380, 25))
+        self.checkBox_projection.setObjectName("checkBox_projection")
+        self.label_projectionYears = QtWidgets.QLabel(additionalSchoolsDialog)
+        self.label_projectionYears.setGeometry(QtCore.QRect(10, 420, 180, 20))
+        self.label_projectionYears.setObjectName("label_projectionYears")
+        self.spinBox_projectionYears = QtWidgets.QSpinBox(additionalSchoolsDialog)
+        self.spinBox_projectionYears.setGeometry(QtCore.QRect(10, 440, 100, 25))
+        self.spinBox_projectionYears.setMinimum(1)
+        self.spinBox_projectionYears.setMaximum(50)
+        self.spinBox_projectionYears.setProperty("value", 10)
+        self.spinBox_projectionYears.setObjectName("spinBox_projectionYears")
+        self.label_growthRate = QtWidgets.QLabel(additionalSchoolsDialog)
+        self.label_growthRate.setGeometry(QtCore.QRect(200, 420, 190, 20))
+        self.label_growthRate.setObjectName("label_growthRate")
+        self.doubleSpinBox_growthRate = QtWidgets.QDoubleSpinBox(additionalSchoolsDialog)
+        self.doubleSpinBox_growthRate.setGeometry(QtCore.QRect(200, 440, 100, 25))
+        self.doubleSpinBox_growthRate.setMinimum(-10.0)
+        self.doubleSpinBox_growthRate.setMaximum(20.0)
+        self.doubleSpinBox_growthRate.setProperty("value", 3.0)
+        self.doubleSpinBox_growthRate.setObjectName("doubleSpinBox_growthRate")
+        self.label_growthRateField = QtWidgets.QLabel(additionalSchoolsDialog)
+        self.label_growthRateField.setGeometry(QtCore.QRect(400, 380, 230, 20))
+        self.label_growthRateField.setObjectName("label_growthRateField")
+        self.comboBox_growthRateField = QtWidgets.QComboBox(additionalSchoolsDialog)
+        self.comboBox_growthRateField.setGeometry(QtCore.QRect(400, 400, 230, 25))
+        self.comboBox_growthRateField.setObjectName("comboBox_growthRateField")
+        self.label_growthRateTable = QtWidgets.QLabel(additionalSchoolsDialog)
+        self.label_growthRateTable.setGeometry(QtCore.QRect(400, 430, 230, 20))
+        self.label_growthRateTable.setObjectName("label_growthRateTable")
+        self.comboBox_growthRateTable = QtWidgets.QComboBox(additionalSchoolsDialog)
+        self.comboBox_growthRateTable.setGeometry(QtCore.QRect(400, 450, 230, 25))
+        self.comboBox_growthRateTable.setObjectName("comboBox_growthRateTable")
+        self.checkBox_resultsLayer = QtWidgets.QCheckBox(additionalSchoolsDialog)
+        self.checkBox_resultsLayer.setGeometry(QtCore.QRect(10, 475, 180, 25))
+        self.checkBox_resultsLayer.setChecked(True)
+        self.checkBox_resultsLayer.setObjectName("checkBox_resultsLayer")
+        self.label_classes = QtWidgets.QLabel(additionalSchoolsDialog)
+        self.label_classes.setGeometry(QtCore.QRect(200, 475, 80, 25))
+        self.label_classes.setObjectName("label_classes")
+        self.spinBox_classes = QtWidgets.QSpinBox(additionalSchoolsDialog)
+        self.spinBox_classes.setGeometry(QtCore.QRect(290, 475, 100, 25))
+        self.spinBox_classes.setMinimum(2)
+        self.spinBox_classes.setMaximum(10)
+        self.spinBox_classes.setProperty("value", 5)
+        self.spinBox_classes.setObjectName("spinBox_classes")
+        self.comboBox_gridShape = QtWidgets.QComboBox(additionalSchoolsDialog)
+        self.comboBox_gridShape.setGeometry(QtCore.QRect(10, 505, 180, 25))
+        self.comboBox_gridShape.setObjectName("comboBox_gridShape")
+        self.label_cellSize = QtWidgets.QLabel(additionalSchoolsDialog)
+        self.label_cellSize.setGeometry(QtCore.QRect(200, 505, 80, 25))
+        self.label_cellSize.setObjectName("label_cellSize")
+        self.spinBox_cellSize = QtWidgets.QSpinBox(additionalSchoolsDialog)
+        self.spinBox_cellSize.setGeometry(QtCore.QRect(290, 505, 100, 25))
+        self.spinBox_cellSize.setMinimum(50)
+        self.spinBox_cellSize.setMaximum(100000)
+        self.spinBox_cellSize.setProperty("value", 1000)
+        self.spinBox_cellSize.setObjectName("spinBox_cellSize")
+        self.checkBox_autoPlan = QtWidgets.QCheckBox(additionalSchoolsDialog)
+        self.checkBox_autoPlan.setGeometry(QtCore.QRect(10, 535, 380, 25))
+        self.checkBox_autoPlan.setObjectName("checkBox_autoPlan")
+        self.checkBox_sharded = QtWidgets.QCheckBox(additionalSchoolsDialog)
+        self.checkBox_sharded.setGeometry(QtCore.QRect(400, 535, 230, 25))
+        self.checkBox_sharded.setObjectName("checkBox_sharded")
+        self.comboBox_columnarFormat = QtWidgets.QComboBox(additionalSchoolsDialog)
+        self.comboBox_columnarFormat.setGeometry(QtCore.QRect(10, 565, 180, 25))
+        self.comboBox_columnarFormat.setObjectName("comboBox_columnarFormat")
+        self.checkBox_exportGeometry = QtWidgets.QCheckBox(additionalSchoolsDialog)
+        self.checkBox_exportGeometry.setGeometry(QtCore.QRect(200, 565, 190, 25))
+        self.checkBox_exportGeometry.setChecked(True)
+        self.checkBox_exportGeometry.setObjectName("checkBox_exportGeometry")
+        self.checkBox_catchments = QtWidgets.QCheckBox(additionalSchoolsDialog)
+        self.checkBox_catchments.setGeometry(QtCore.QRect(400, 565, 230, 25))
+        self.checkBox_catchments.setObjectName("checkBox_catchments")
+        self.checkBox_accessibility = QtWidgets.QCheckBox(additionalSchoolsDialog)
+        self.checkBox_accessibility.setGeometry(QtCore.QRect(10, 595, 180, 25))
+        self.checkBox_accessibility.setObjectName("checkBox_accessibility")
+        self.label_travelMinutes = QtWidgets.QLabel(additionalSchoolsDialog)
+        self.label_travelMinutes.setGeometry(QtCore.QRect(200, 595, 80, 25))
+        self.label_travelMinutes.setObjectName("label_travelMinutes")
+        self.spinBox_travelMinutes = QtWidgets.QSpinBox(additionalSchoolsDialog)
+        self.spinBox_travelMinutes.setGeometry(QtCore.QRect(290, 595, 100, 25))
+        self.spinBox_travelMinutes.setMinimum(1)
+        self.spinBox_travelMinutes.setMaximum(600)
+        self.spinBox_travelMinutes.setProperty("value", 30)
+        self.spinBox_travelMinutes.setObjectName("spinBox_travelMinutes")
+        self.label_travelSpeed = QtWidgets.QLabel(additionalSchoolsDialog)
+        self.label_travelSpeed.setGeometry(QtCore.QRect(400, 595, 120, 25))
+        self.label_travelSpeed.setObjectName("label_travelSpeed")
+        self.spinBox_travelSpeed = QtWidgets.QSpinBox(additionalSchoolsDialog)
+        self.spinBox_travelSpeed.setGeometry(QtCore.QRect(520, 595, 110, 25))
+        self.spinBox_travelSpeed.setMinimum(1)
+        self.spinBox_travelSpeed.setMaximum(120)
+        self.spinBox_travelSpeed.setProperty("value", 5)
+        self.spinBox_travelSpeed.setObjectName("spinBox_travelSpeed")
+        self.checkBox_uncertainty = QtWidgets.QCheckBox(additionalSchoolsDialog)
+        self.checkBox_uncertainty.setGeometry(QtCore.QRect(10, 625, 150, 25))
+        self.checkBox_uncertainty.setObjectName("checkBox_uncertainty")
+        self.spinBox_draws = QtWidgets.QSpinBox(additionalSchoolsDialog)
+        self.spinBox_draws.setGeometry(QtCore.QRect(160, 625, 80, 25))
+        self.spinBox_draws.setMinimum(100)
+        self.spinBox_draws.setMaximum(100000)
+        self.spinBox_draws.setSingleStep(1000)
+        self.spinBox_draws.setProperty("value", 10000)
+        self.spinBox_draws.setObjectName("spinBox_draws")
+        self.comboBox_uncertaintyDistribution = QtWidgets.QComboBox(additionalSchoolsDialog)
+        self.comboBox_uncertaintyDistribution.setGeometry(QtCore.QRect(250, 625, 110, 25))
+        self.comboBox_uncertaintyDistribution.setObjectName("comboBox_uncertaintyDistribution")
+        self.label_populationError = QtWidgets.QLabel(additionalSchoolsDialog)
+        self.label_populationError.setGeometry(QtCore.QRect(370, 625, 60, 25))
+        self.label_populationError.setObjectName("label_populationError")
+        self.doubleSpinBox_populationError = QtWidgets.QDoubleSpinBox(additionalSchoolsDialog)
+        self.doubleSpinBox_populationError.setGeometry(QtCore.QRect(430, 625, 60, 25))
+        self.doubleSpinBox_populationError.setMaximum(100.0)
+        self.doubleSpinBox_populationError.setProperty("value", 10.0)
+        self.doubleSpinBox_populationError.setObjectName("doubleSpinBox_populationError")
+        self.label_ratioError = QtWidgets.QLabel(additionalSchoolsDialog)
+        self.label_ratioError.setGeometry(QtCore.QRect(500, 625, 60, 25))
+        self.label_ratioError.setObjectName("label_ratioError")
+        self.doubleSpinBox_ratioError = QtWidgets.QDoubleSpinBox(additionalSchoolsDialog)
+        self.doubleSpinBox_ratioError.setGeometry(QtCore.QRect(560, 625, 70, 25))
+        self.doubleSpinBox_ratioError.setMaximum(100.0)
+        self.doubleSpinBox_ratioError.setProperty("value", 0.0)
+        self.doubleSpinBox_ratioError.setObjectName("doubleSpinBox_ratioError")
+        self.checkBox_surface = QtWidgets.QCheckBox(additionalSchoolsDialog)
+        self.checkBox_surface.setGeometry(QtCore.QRect(10, 655, 150, 25))
+        self.checkBox_surface.setObjectName("checkBox_surface")
+        self.comboBox_surfaceMode = QtWidgets.QComboBox(additionalSchoolsDialog)
+        self.comboBox_surfaceMode.setGeometry(QtCore.QRect(160, 655, 200, 25))
+        self.comboBox_surfaceMode.setObjectName("comboBox_surfaceMode")
+        self.label_bandwidth = QtWidgets.QLabel(additionalSchoolsDialog)
+        self.label_bandwidth.setGeometry(QtCore.QRect(370, 655, 110, 25))
+        self.label_bandwidth.setObjectName("label_bandwidth")
+        self.spinBox_bandwidth = QtWidgets.QSpinBox(additionalSchoolsDialog)
+        self.spinBox_bandwidth.setGeometry(QtCore.QRect(480, 655, 150, 25))
+        self.spinBox_bandwidth.setMinimum(100)
+        self.spinBox_bandwidth.setMaximum(100000)
+        self.spinBox_bandwidth.setSingleStep(500)
+        self.spinBox_bandwidth.setProperty("value", 2000)
+        self.spinBox_bandwidth.setObjectName("spinBox_bandwidth")
         self.button_execute = QtWidgets.QPushButton(additionalSchoolsDialog)
         self.button_execute.setGeometry(QtCore.QRect(150, 200, 100, 30))
         self.button_execute.setObjectName("button_execute")
@@ -54,5 +294,42 @@ class Ui_additionalSchoolsDialog(object):
         self.label_cityLayer.setText(_translate("additionalSchoolsDialog", "City Layer"))
         self.label_schoolsLayer.setText(_translate("additionalSchoolsDialog", "Schools Layer"))
         self.label_population.setText(_translate("additionalSchoolsDialog", "Population Field"))
+        self.label_areaField.setText(_translate("additionalSchoolsDialog", "Area Field"))
+        self.label_level1Field.setText(_translate("additionalSchoolsDialog", "Region Field (optional)"))
+        self.label_level2Field.setText(_translate("additionalSchoolsDialog", "District Field (optional)"))
         self.label_peoplePerSchool.setText(_translate("additionalSchoolsDialog", "People Per School"))
+        self.label_serviceRadius.setText(_translate("additionalSchoolsDialog", "Service Radius (m)"))
+        self.checkBox_proposeSites.setText(_translate("additionalSchoolsDialog", "Propose Sites"))
+        self.label_candidatesLayer.setText(_translate("additionalSchoolsDialog", "Candidate Sites Layer (optional)"))
+        self.checkBox_capturePlans.setText(_translate("additionalSchoolsDialog", "Capture Query Plans"))
+        self.label_chunkSize.setText(_translate("additionalSchoolsDialog", "Areas per Commit (0 = single transaction)"))
+        self.checkBox_resume.setText(_translate("additionalSchoolsDialog", "Resume Run"))
+        self.label_workers.setText(_translate("additionalSchoolsDialog", "Parallel Connections (1 = off)"))
+        self.label_maxVertices.setText(_translate("additionalSchoolsDialog", "Max Vertices per Subdivided Piece"))
+        self.checkBox_subdivide.setText(_translate("additionalSchoolsDialog", "Subdivide Areas"))
+        self.checkBox_perArea.setText(_translate("additionalSchoolsDialog", "Per-Area Queries (parity check)"))
+        self.button_history.setText(_translate("additionalSchoolsDialog", "Run History"))
+        self.label_dataSource.setText(_translate("additionalSchoolsDialog", "Data Source"))
+        self.label_duplicateTolerance.setText(_translate("additionalSchoolsDialog", "Merge Schools Within Metres (0 = off)"))
+        self.label_schoolNameField.setText(_translate("additionalSchoolsDialog", "Duplicates Must Share the Name In"))
+        self.checkBox_projection.setText(_translate("additionalSchoolsDialog", "Project Deficits for Future Years"))
+        self.label_projectionYears.setText(_translate("additionalSchoolsDialog", "Years Ahead"))
+        self.label_growthRate.setText(_translate("additionalSchoolsDialog", "Annual Growth (%)"))
+        self.label_growthRateField.setText(_translate("additionalSchoolsDialog", "Growth Rate Field (% per year)"))
+        self.label_growthRateTable.setText(_translate("additionalSchoolsDialog", "Growth Rates per Level Table"))
+        self.checkBox_resultsLayer.setText(_translate("additionalSchoolsDialog", "Add Styled Results Layer"))
+        self.label_classes.setText(_translate("additionalSchoolsDialog", "Classes"))
+        self.label_cellSize.setText(_translate("additionalSchoolsDialog", "Cell Size (m)"))
+        self.checkBox_autoPlan.setText(_translate("additionalSchoolsDialog", "Choose Strategy from Table Statistics"))
+        self.checkBox_sharded.setText(_translate("additionalSchoolsDialog", "Run on Every Regional Database"))
+        self.checkBox_exportGeometry.setText(_translate("additionalSchoolsDialog", "Export Geometry"))
+        self.checkBox_catchments.setText(_translate("additionalSchoolsDialog", "Report Overloaded Schools"))
+        self.checkBox_accessibility.setText(_translate("additionalSchoolsDialog", "Travel Time on Roads"))
+        self.label_travelMinutes.setText(_translate("additionalSchoolsDialog", "Minutes"))
+        self.label_travelSpeed.setText(_translate("additionalSchoolsDialog", "Speed (km/h)"))
+        self.checkBox_uncertainty.setText(_translate("additionalSchoolsDialog", "Uncertainty Draws"))
+        self.label_populationError.setText(_translate("additionalSchoolsDialog", "Pop. ±%"))
+        self.label_ratioError.setText(_translate("additionalSchoolsDialog", "Ratio ±%"))
+        self.checkBox_surface.setText(_translate("additionalSchoolsDialog", "Coverage Surface"))
+        self.label_bandwidth.setText(_translate("additionalSchoolsDialog", "Bandwidth (m)"))
         self.button_execute.setText(_translate("additionalSchoolsDialog", "Calculate Schools"))
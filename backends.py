@@ -0,0 +1,98 @@
+import sqlite3
+
+from psycopg2 import sql
+
+from . import deduplicate, engine, geopackage, history, shards, subdivide
+
+
+def internal_table(name):
+    """Return whether ``name`` is a cache or history table the plugin keeps for itself rather than a layer."""
+    return (
+        name in (engine.CHECKPOINT_TABLE, shards.COMPLETED_SHARDS_TABLE, history.RUNS_TABLE, history.HISTORY_TABLE)
+        or name.startswith(f"{history.HISTORY_TABLE}_")
+        or name.endswith((subdivide.SUBDIVIDED_SUFFIX, deduplicate.DEDUPLICATED_SUFFIX))
+    )
+
+
+class PostgisBackend:
+    """Backend reading the layers of a PostGIS database and counting schools in it."""
+
+    name = 'PostGIS'
+    # Runs go through the dialog's database router with subdivision, chunking, replicas and the other database options
+    database_options = True
+
+    def __init__(self, connect):
+        """
+        Constructor method.
+        :param connect: Callable returning a new psycopg2 connection
+        """
+        self.connect = connect
+
+    def layer_names(self):
+        """Return the tables of the public schema, leaving out those of :func:`internal_table`."""
+        connection = self.connect()
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = 'public'")
+            return [row[0] for row in cursor.fetchall() if not internal_table(row[0])]
+        finally:
+            connection.close()
+
+    def field_names(self, layer_name):
+        """Return the columns of ``layer_name``."""
+        connection = self.connect()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(sql.SQL("SELECT column_name FROM information_schema.columns WHERE table_name = %s"), [layer_name])
+            return [row[0] for row in cursor.fetchall()]
+        finally:
+            connection.close()
+
+
+class GeoPackageBackend:
+    """Backend reading the layers of a local GeoPackage and counting schools with its R-tree indexes."""
+
+    name = 'GeoPackage'
+    # Runs count offline with the R-tree, so the database options do not apply
+    database_options = False
+
+    def __init__(self, path):
+        """
+        Constructor method.
+        :param path: Path of the GeoPackage file
+        """
+        self.path = path
+
+    def connect(self):
+        """Open the GeoPackage."""
+        return sqlite3.connect(self.path)
+
+    def layer_names(self):
+        """Return the feature tables of the GeoPackage."""
+        connection = self.connect()
+        try:
+            rows = connection.execute("SELECT table_name FROM gpkg_contents WHERE data_type = 'features'").fetchall()
+            return [row[0] for row in rows]
+        finally:
+            connection.close()
+
+    def field_names(self, layer_name):
+        """Return the columns of ``layer_name``."""
+        connection = self.connect()
+        try:
+            return [row[1] for row in connection.execute(f'PRAGMA table_info("{layer_name}")').fetchall()]
+        finally:
+            connection.close()
+
+    def calculate_deficits(self, city_layer, schools_layer, population_field, people_per_school,
+                           area_field=geopackage.DEFAULT_AREA_FIELD, parent_fields=()):
+        """Calculate and store the deficits at every admin level in one transaction."""
+        connection = self.connect()
+        try:
+            with connection:
+                return geopackage.calculate_deficits(
+                    connection, city_layer, schools_layer, population_field, people_per_school,
+                    area_field=area_field, parent_fields=parent_fields
+                )
+        finally:
+            connection.close()
@@ -0,0 +1,135 @@
+import io
+
+import numpy as np
+from psycopg2 import sql
+
+from .placement import nearest_points
+
+CATCHMENT_TABLE = 'school_catchments'
+
+
+def fetch_area_points(cursor, city_layer, population_field, srid):
+    """Return a point inside every area in ``srid`` as an (n, 2) array, and the area populations."""
+    cursor.execute(sql.SQL("""
+        SELECT ST_X(p), ST_Y(p), population
+        FROM (
+            SELECT ST_Transform(ST_PointOnSurface(geom), %(srid)s) AS p, {population_field}::float8 AS population
+            FROM {city_layer}
+            WHERE {population_field} IS NOT NULL AND geom IS NOT NULL
+        ) area
+    """).format(
+        population_field=sql.Identifier(population_field),
+        city_layer=sql.Identifier(city_layer),
+    ), {'srid': srid})
+    rows = np.array(cursor.fetchall(), dtype=float).reshape(-1, 3)
+    return rows[:, :2], rows[:, 2]
+
+
+def fetch_schools(cursor, schools_layer, srid, name_field=None):
+    """
+    Return every school of ``schools_layer`` as (row ids, names, coordinates in ``srid``, longitude/latitude).
+
+    Row ids are the ``ctid`` of the schools, which identify them for
+    :func:`write_catchments` within the same transaction.
+    """
+    cursor.execute(sql.SQL("""
+        SELECT ctid::text, name, ST_X(p), ST_Y(p), ST_X(ST_Transform(p, 4326)), ST_Y(ST_Transform(p, 4326))
+        FROM (
+            SELECT ctid, {name_column} AS name, ST_Transform(ST_PointOnSurface(geom), %(srid)s) AS p
+            FROM {schools_layer}
+            WHERE geom IS NOT NULL
+        ) s
+    """).format(
+        name_column=sql.SQL("{field}::text").format(field=sql.Identifier(name_field)) if name_field else sql.SQL("NULL::text"),
+        schools_layer=sql.Identifier(schools_layer),
+    ), {'srid': srid})
+    rows = cursor.fetchall()
+    coordinates = np.array([row[2:] for row in rows], dtype=float).reshape(-1, 4)
+    return [row[0] for row in rows], [row[1] for row in rows], coordinates[:, :2], coordinates[:, 2:]
+
+
+def school_loads(schools, points, population, people_per_school):
+    """
+    Assign every population point to its nearest school and return the population served and load of each school.
+
+    The load is the population served divided by ``people_per_school``; a
+    school with a load above 1 serves more people than one school should.
+    Points are assigned with :func:`placement.nearest_points`, so the
+    catchments are the Voronoi cells of the schools.
+    """
+    nearest, _ = nearest_points(schools, points)
+    population = np.asarray(population, dtype=float)
+    served = np.bincount(nearest[nearest >= 0], weights=population[nearest >= 0], minlength=len(schools))
+    return served, served / people_per_school
+
+
+def write_catchments(cursor, city_layer, schools_layer, school_ids, names, served, load, srid,
+                     catchment_table=CATCHMENT_TABLE):
+    """
+    Replace ``catchment_table`` with the catchments of the overloaded schools, clipped to the areas.
+
+    Catchments are the ``ST_VoronoiPolygons`` cells of all schools of the
+    layer in ``srid``, the regions :func:`school_loads` assigned population
+    from, intersected with the areas of the city layer. Only the cells of
+    schools with a load above 1 are clipped and stored, so the polygons of
+    the many schools with spare places are never built.
+    """
+    identifiers = {
+        'table': sql.Identifier(catchment_table),
+        'city_layer': sql.Identifier(city_layer),
+        'schools_layer': sql.Identifier(schools_layer),
+    }
+    cursor.execute(sql.SQL("DROP TABLE IF EXISTS {table}").format(**identifiers))
+    cursor.execute(sql.SQL("""
+        CREATE TABLE {table} (
+            id serial PRIMARY KEY,
+            school text NOT NULL,
+            name text,
+            population_served numeric,
+            load numeric,
+            geom geometry(MultiPolygon, {srid})
+        )
+    """).format(srid=sql.Literal(srid), **identifiers))
+    cursor.execute("CREATE TEMP TABLE school_loads (school tid, name text, population float8, load float8) ON COMMIT DROP")
+    buffer = io.StringIO()
+    for i in np.flatnonzero(np.asarray(load) > 1):
+        name = '\\N' if names[i] is None else names[i].replace('\\', '\\\\').replace('\t', ' ').replace('\n', ' ').replace('\r', ' ')
+        buffer.write(f"{school_ids[i]}\t{name}\t{float(served[i])}\t{float(load[i])}\n")
+    buffer.seek(0)
+    cursor.copy_expert("COPY school_loads FROM STDIN", buffer)
+
+    # The cells are indexed so each school finds its own without scanning all of them
+    cursor.execute(sql.SQL("""
+        CREATE TEMP TABLE voronoi_cells ON COMMIT DROP AS
+        SELECT (ST_Dump(ST_VoronoiPolygons(ST_Collect(ST_Transform(ST_PointOnSurface(geom), %(srid)s))))).geom AS geom
+        FROM {schools_layer}
+        WHERE geom IS NOT NULL
+    """).format(**identifiers), {'srid': srid})
+    cursor.execute("CREATE INDEX ON voronoi_cells USING GIST (geom)")
+    cursor.execute(sql.SQL("""
+        INSERT INTO {table} (school, name, population_served, load, geom)
+        SELECT l.school::text, l.name, l.population, l.load, ST_Multi(ST_CollectionExtract(clip.geom, 3))
+        FROM school_loads l
+        JOIN {schools_layer} s ON s.ctid = l.school
+        CROSS JOIN LATERAL (
+            SELECT v.geom FROM voronoi_cells v
+            WHERE ST_Intersects(v.geom, ST_Transform(ST_PointOnSurface(s.geom), %(srid)s))
+            LIMIT 1
+        ) cell
+        CROSS JOIN LATERAL (
+            SELECT ST_Union(ST_Intersection(cell.geom, ST_Transform(c.geom, %(srid)s))) AS geom
+            FROM {city_layer} c
+            WHERE ST_Intersects(c.geom, ST_Transform(cell.geom, Find_SRID('public', {city_name}, 'geom')))
+        ) clip
+    """).format(city_name=sql.Literal(city_layer), **identifiers), {'srid': srid})
+    cursor.execute(sql.SQL("CREATE INDEX ON {table} USING GIST (geom)").format(**identifiers))
+
+
+def overloaded_schools(names, lonlat, served, load):
+    """Return (name, longitude, latitude, population served, load) of every overloaded school, most loaded first."""
+    overloaded = np.flatnonzero(np.asarray(load) > 1)
+    overloaded = overloaded[np.argsort(-np.asarray(load)[overloaded], kind='stable')]
+    return [
+        (names[i], float(lonlat[i, 0]), float(lonlat[i, 1]), float(served[i]), float(load[i]))
+        for i in overloaded
+    ]
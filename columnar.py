@@ -0,0 +1,198 @@
+import json
+import os
+import threading
+
+import numpy as np
+from psycopg2 import sql
+
+PARQUET = 'parquet'
+ARROW = 'arrow'
+EXTENSIONS = {PARQUET: '.parquet', ARROW: '.arrow'}
+DEFAULT_COMPRESSION = 'zstd'
+ROW_GROUP_SIZE = 128 * 1024
+# Bytes of COPY output parsed into each record batch
+BLOCK_SIZE = 4 * 1024 * 1024
+GEOMETRY_COLUMN = 'geometry'
+
+RESULT_COLUMNS = [
+    ('admin_level', 'string'), ('area_name', 'string'), ('required_schools', 'int32'),
+    ('available_schools', 'int32'), ('schools_to_add', 'int32'), ('parent_path', 'string'),
+]
+GRID_COLUMNS = [
+    ('cell_id', 'int64'), ('i', 'int32'), ('j', 'int32'), ('population', 'float64'), ('required_schools', 'int32'),
+    ('available_schools', 'int32'), ('schools_to_add', 'int32'),
+]
+
+# Value of every hexadecimal digit by its ASCII code
+HEX_VALUES = np.zeros(256, dtype=np.uint8)
+HEX_VALUES[np.frombuffer(b'0123456789', dtype=np.uint8)] = np.arange(10)
+HEX_VALUES[np.frombuffer(b'abcdef', dtype=np.uint8)] = np.arange(10, 16)
+HEX_VALUES[np.frombuffer(b'ABCDEF', dtype=np.uint8)] = np.arange(10, 16)
+
+
+def import_pyarrow():
+    """Import pyarrow, which is only needed for columnar exports and so is not a dependency of the plugin."""
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("Columnar export needs the pyarrow package installed in the Python environment of QGIS")
+    return pyarrow
+
+
+def decode_hex(data, offsets):
+    """
+    Decode concatenated hexadecimal strings to bytes in one array operation.
+
+    ``data`` holds the ASCII digits of all strings back to back and
+    ``offsets`` where each string starts, plus the end, as in an Arrow
+    string array. Returns the decoded bytes and their offsets.
+    """
+    nibbles = HEX_VALUES[np.asarray(data, dtype=np.uint8)]
+    return (nibbles[0::2] << 4) | nibbles[1::2], np.asarray(offsets) // 2
+
+
+def wkb_array(strings):
+    """Convert an Arrow array of hex encoded WKB, empty for no geometry, to a binary array without a Python loop."""
+    pa = import_pyarrow()
+    import pyarrow.compute as pc
+
+    _, offsets_buffer, data_buffer = strings.buffers()
+    offsets = np.frombuffer(offsets_buffer, dtype=np.int32)[strings.offset:strings.offset + len(strings) + 1]
+    data = np.frombuffer(data_buffer, dtype=np.uint8)[offsets[0]:offsets[-1]] if data_buffer else np.zeros(0, np.uint8)
+    wkb, wkb_offsets = decode_hex(data, offsets - offsets[0])
+    binary = pa.Array.from_buffers(pa.binary(), len(strings), [
+        None, pa.py_buffer(wkb_offsets.astype(np.int32)), pa.py_buffer(wkb)
+    ])
+    return pc.if_else(pc.equal(pc.binary_length(binary), 0), pa.scalar(None, pa.binary()), binary)
+
+
+def geo_metadata(srid, geometry_types=()):
+    """
+    Return the GeoParquet metadata of the WKB geometry column in ``srid``.
+
+    EPSG:4326 in longitude, latitude order is the GeoParquet default CRS, so
+    it is left out; other systems are identified by their EPSG code.
+    """
+    column = {'encoding': 'WKB', 'geometry_types': list(geometry_types)}
+    if srid != 4326:
+        column['crs'] = {'id': {'authority': 'EPSG', 'code': srid}}
+    return {'version': '1.0.0', 'primary_column': GEOMETRY_COLUMN, 'columns': {GEOMETRY_COLUMN: column}}
+
+
+def export_schema(columns, srid=None, geometry_types=()):
+    """Build the Arrow schema of ``columns``, (name, Arrow type name) pairs, with a WKB geometry column when ``srid`` is given."""
+    pa = import_pyarrow()
+
+    fields = [pa.field(name, getattr(pa, type_name)()) for name, type_name in columns]
+    if srid is None:
+        return pa.schema(fields)
+    metadata = geo_metadata(srid, geometry_types)
+    # GeoArrow readers find the geometry from the field, GeoParquet readers from the schema
+    fields.append(pa.field(GEOMETRY_COLUMN, pa.binary(), metadata={
+        'ARROW:extension:name': 'geoarrow.wkb',
+        'ARROW:extension:metadata': json.dumps({'crs': metadata['columns'][GEOMETRY_COLUMN].get('crs')}),
+    }))
+    return pa.schema(fields, metadata={'geo': json.dumps(metadata)})
+
+
+def export_query(source, columns, geometry=False):
+    """Build the query selecting ``columns`` of the table ``source``, with its geometry as hex encoded WKB."""
+    selected = [sql.Identifier(name) for name, _ in columns]
+    if geometry:
+        selected.append(sql.SQL("COALESCE(encode(ST_AsBinary(geom), 'hex'), '') AS {column}").format(
+            column=sql.Identifier(GEOMETRY_COLUMN)
+        ))
+    return sql.SQL("SELECT {columns} FROM {source}").format(columns=sql.SQL(', ').join(selected),
+                                                            source=sql.Identifier(source))
+
+
+def record_batches(connection, query, schema):
+    """
+    Stream the rows of ``query`` as Arrow record batches of ``schema``.
+
+    The rows are copied out of PostgreSQL as CSV through a pipe and parsed
+    by the multithreaded Arrow CSV reader, so values are never converted to
+    Python objects and only a few batches are held in memory at once.
+    """
+    pa = import_pyarrow()
+    from pyarrow import csv
+
+    read_fd, write_fd = os.pipe()
+    errors = []
+
+    def copy():
+        with os.fdopen(write_fd, 'wb') as sink:
+            try:
+                connection.cursor().copy_expert(
+                    sql.SQL("COPY ({query}) TO STDOUT WITH (FORMAT csv)").format(query=query), sink
+                )
+            except Exception as error:
+                errors.append(error)
+
+    copier = threading.Thread(target=copy, daemon=True)
+    copier.start()
+    with os.fdopen(read_fd, 'rb') as source:
+        reader = csv.open_csv(
+            source,
+            read_options=csv.ReadOptions(column_names=schema.names, block_size=BLOCK_SIZE),
+            convert_options=csv.ConvertOptions(column_types={
+                field.name: pa.string() if field.name == GEOMETRY_COLUMN else field.type for field in schema
+            }),
+        )
+        for batch in reader:
+            if GEOMETRY_COLUMN in schema.names:
+                index = schema.get_field_index(GEOMETRY_COLUMN)
+                batch = batch.set_column(index, schema.field(index), wkb_array(batch.column(index)))
+            yield batch.replace_schema_metadata(schema.metadata)
+    copier.join()
+    if errors:
+        raise errors[0]
+
+
+def write_batches(batches, schema, path, file_format=PARQUET, compression=DEFAULT_COMPRESSION,
+                  row_group_size=ROW_GROUP_SIZE):
+    """
+    Write record batches to a GeoParquet or Arrow IPC file and return the number of rows written.
+
+    Parquet row groups hold ``row_group_size`` rows, so readers can skip
+    and parallelise over them; small batches are gathered until a row group
+    is full. Arrow IPC files are written batch by batch.
+    """
+    pa = import_pyarrow()
+
+    rows = 0
+    if file_format == ARROW:
+        options = pa.ipc.IpcWriteOptions(compression=compression)
+        with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, schema, options=options) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+                rows += batch.num_rows
+        return rows
+
+    import pyarrow.parquet as pq
+    with pq.ParquetWriter(path, schema, compression=compression) as writer:
+        pending = []
+        pending_rows = 0
+        for batch in batches:
+            pending.append(batch)
+            pending_rows += batch.num_rows
+            if pending_rows >= row_group_size:
+                writer.write_table(pa.Table.from_batches(pending, schema), row_group_size=row_group_size)
+                rows += pending_rows
+                pending, pending_rows = [], 0
+        if pending:
+            writer.write_table(pa.Table.from_batches(pending, schema), row_group_size=row_group_size)
+            rows += pending_rows
+    return rows
+
+
+def export_table(connection, table, columns, path, file_format=PARQUET, srid=None, geometry_types=(),
+                 compression=DEFAULT_COMPRESSION, row_group_size=ROW_GROUP_SIZE):
+    """
+    Export ``columns`` of ``table`` to a columnar file, with its geometry as WKB in ``srid`` when one is given.
+
+    Returns the number of rows written. ``connection`` is only read from.
+    """
+    schema = export_schema(columns, srid, geometry_types)
+    batches = record_batches(connection, export_query(table, columns, geometry=srid is not None), schema)
+    return write_batches(batches, schema, path, file_format, compression, row_group_size)
@@ -0,0 +1,254 @@
+import random
+import time
+
+import psycopg2
+
+DEFAULT_DSN = "dbname='additional schools' user=postgres password=fargo host=localhost port=5432"
+DEFAULT_STATEMENT_TIMEOUT = 300
+CONNECT_TIMEOUT = 10
+
+# Serialization failures, deadlocks and server shutdowns succeed when the transaction is simply run again
+TRANSIENT_ERRORS = {'40001', '40P01', '57P01', '57P02', '57P03'}
+
+
+class DatabaseUnavailableError(Exception):
+    """Raised without trying to connect while recent connections to the database have failed."""
+
+
+def is_transient(error):
+    """Return whether running the failed transaction again may succeed."""
+    if error.pgcode is None:
+        # Errors without a server code come from the connection itself being lost or refused
+        return isinstance(error, psycopg2.OperationalError)
+    return error.pgcode in TRANSIENT_ERRORS or error.pgcode.startswith('08')
+
+
+def is_connection_failure(error):
+    """Return whether ``error`` means the server could not be reached."""
+    return is_transient(error) and (error.pgcode is None or error.pgcode.startswith('08') or error.pgcode.startswith('57P'))
+
+
+class CircuitBreaker:
+    """Fail fast after repeated connection failures instead of waiting on a database that is down."""
+
+    def __init__(self, failure_threshold=3, reset_after=30):
+        """
+        Constructor method.
+        :param failure_threshold: Consecutive failures after which the circuit opens
+        :param reset_after: Seconds after which an open circuit lets one attempt through again
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+
+    def check(self):
+        """Raise :class:`DatabaseUnavailableError` while the circuit is open."""
+        if self.opened_at is not None and time.monotonic() - self.opened_at < self.reset_after:
+            raise DatabaseUnavailableError(
+                f"The database failed {self.failures} times in a row; not retrying for {self.reset_after} seconds"
+            )
+
+    def record_success(self):
+        """Close the circuit."""
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        """Count a failure and open the circuit once there were too many in a row."""
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+def rollback(connection):
+    """Roll back the open transaction of ``connection``, ignoring a connection that is already lost."""
+    try:
+        if not connection.closed:
+            connection.rollback()
+    except psycopg2.Error:
+        pass
+
+
+def current_lsn(connection):
+    """Return the current write-ahead log position of the primary behind ``connection``."""
+    cursor = connection.cursor()
+    cursor.execute("SELECT pg_current_wal_lsn()::text")
+    lsn = cursor.fetchone()[0]
+    cursor.close()
+    return lsn
+
+
+def replica_lag(connection):
+    """
+    Return how many seconds the server behind ``connection`` lags its primary.
+
+    A primary, or a standby that has replayed everything it received, has no
+    lag; otherwise the lag is the age of the last replayed transaction.
+    """
+    cursor = connection.cursor()
+    cursor.execute("""
+        SELECT CASE
+            WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 'Infinity')
+        END
+    """)
+    lag = float(cursor.fetchone()[0])
+    connection.rollback()
+    cursor.close()
+    return lag
+
+
+def wait_for_replay(connection, lsn, timeout):
+    """Wait up to ``timeout`` seconds for the server behind ``connection`` to replay ``lsn``; return whether it did."""
+    cursor = connection.cursor()
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            cursor.execute("""
+                SELECT NOT pg_is_in_recovery() OR pg_last_wal_replay_lsn() >= %s::pg_lsn
+            """, [lsn])
+            replayed = cursor.fetchone()[0]
+            connection.rollback()
+            if replayed or time.monotonic() >= deadline:
+                return replayed
+            time.sleep(0.2)
+    finally:
+        cursor.close()
+
+
+def parse_shards(text):
+    """
+    Parse regional databases given as one ``name: connection string`` per line.
+
+    Blank lines and lines starting with # are skipped. Returns a dict of
+    shard name to libpq connection string in the order given.
+    """
+    shards = {}
+    for line in (text or "").splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        name, separator, dsn = line.partition(':')
+        if not separator or not name.strip() or not dsn.strip():
+            raise ValueError(f"Expected 'name: connection string', got {line!r}")
+        shards[name.strip()] = dsn.strip()
+    return shards
+
+
+class DatabaseRouter:
+    """Open connections to the primary for writes and to a read replica for the heavy read queries."""
+
+    def __init__(self, write_dsn=DEFAULT_DSN, read_dsn=None, max_lag_seconds=0, replay_timeout=10,
+                 statement_timeout=DEFAULT_STATEMENT_TIMEOUT):
+        """
+        Constructor method.
+        :param write_dsn: libpq connection string of the primary
+        :param read_dsn: libpq connection string of the read replica, None to read from the primary
+        :param max_lag_seconds: Read from the primary when the replica lags more than this, 0 to never check
+        :param replay_timeout: Seconds to wait for the replica to replay a position of the primary
+        :param statement_timeout: Seconds after which the server cancels a statement, 0 for no limit
+        """
+        self.write_dsn = write_dsn
+        self.read_dsn = read_dsn or write_dsn
+        self.max_lag_seconds = max_lag_seconds
+        self.replay_timeout = replay_timeout
+        self.statement_timeout = statement_timeout
+        # One breaker per server, so a replica that is down does not stop writes to the primary
+        self.breakers = {}
+
+    @property
+    def has_replica(self):
+        """Whether reads are sent to a different server than writes."""
+        return self.read_dsn != self.write_dsn
+
+    def connect(self, dsn):
+        """
+        Connect to ``dsn`` through the circuit breaker.
+
+        Connecting gives up after CONNECT_TIMEOUT seconds and every statement
+        of the connection is cancelled after ``statement_timeout``, so a
+        hung server or query cannot block QGIS indefinitely. The timeout also
+        applies to the single roll-up statement of an unchunked run, so runs
+        over large layers must be chunked, or the
+        ``additional_schools/statement_timeout`` setting raised, to finish.
+        """
+        breaker = self.breakers.setdefault(dsn, CircuitBreaker())
+        breaker.check()
+        try:
+            connection = psycopg2.connect(
+                dsn, connect_timeout=CONNECT_TIMEOUT, options=f"-c statement_timeout={int(self.statement_timeout * 1000)}"
+            )
+        except psycopg2.OperationalError:
+            breaker.record_failure()
+            raise
+        breaker.record_success()
+        return connection
+
+    def connect_write(self):
+        """Connect to the primary."""
+        return self.connect(self.write_dsn)
+
+    def run(self, operation, attempts=3, backoff=0.5):
+        """
+        Run ``operation(connection)`` in a transaction on the primary and commit it.
+
+        Transient failures, including failing to connect, roll the transaction
+        back and run it again, up to ``attempts`` times with exponential
+        backoff and jitter; other errors, including statement timeouts, are
+        raised at once after the rollback. Lost connections count towards
+        opening the circuit breaker.
+        """
+        for attempt in range(attempts):
+            connection = None
+            try:
+                connection = self.connect_write()
+                result = operation(connection)
+                connection.commit()
+                return result
+            except psycopg2.Error as error:
+                # A failed connect was already counted by the breaker in connect()
+                if connection is not None:
+                    rollback(connection)
+                    if is_connection_failure(error):
+                        self.breakers[self.write_dsn].record_failure()
+                if not is_transient(error) or attempt == attempts - 1:
+                    raise
+                time.sleep(backoff * 2 ** attempt * (1 + random.random()))
+            except Exception:
+                if connection is not None:
+                    rollback(connection)
+                raise
+            finally:
+                if connection is not None:
+                    connection.close()
+
+    def read_endpoint(self, min_lsn=None):
+        """
+        Return the connection string reads should use now.
+
+        The replica is used unless it is unreachable, lags more than
+        ``max_lag_seconds`` or has not replayed ``min_lsn`` (see
+        :func:`current_lsn`) within ``replay_timeout``, in which case reads
+        fall back to the primary.
+        Resolve the endpoint once per run so every read of the run sees the
+        same server.
+        """
+        if not self.has_replica:
+            return self.write_dsn
+        try:
+            connection = self.connect(self.read_dsn)
+        except (DatabaseUnavailableError, psycopg2.OperationalError):
+            return self.write_dsn
+        try:
+            if self.max_lag_seconds and replica_lag(connection) > self.max_lag_seconds:
+                return self.write_dsn
+            if min_lsn and not wait_for_replay(connection, min_lsn, self.replay_timeout):
+                return self.write_dsn
+            return self.read_dsn
+        finally:
+            connection.close()
+
+    def connect_read(self, min_lsn=None):
+        """Connect to the server returned by :meth:`read_endpoint`."""
+        return self.connect(self.read_endpoint(min_lsn))
@@ -0,0 +1,79 @@
+from psycopg2 import sql
+
+from .placement import metric_srid
+
+DEFAULT_TOLERANCE = 50
+DEDUPLICATED_SUFFIX = '_deduplicated'
+
+
+def deduplicated_table(schools_layer):
+    """Return the name of the table holding the de-duplicated schools of ``schools_layer``."""
+    return f"{schools_layer}{DEDUPLICATED_SUFFIX}"
+
+
+def refresh_deduplicated(cursor, schools_layer, tolerance=DEFAULT_TOLERANCE, name_field=None):
+    """
+    Write the schools of ``schools_layer`` without duplicates to their own table.
+
+    Schools closer than ``tolerance`` metres, measured in the UTM zone of the
+    layer, are clustered with ``ST_ClusterDBSCAN``; with ``name_field`` only
+    schools whose names match, ignoring case and surrounding spaces, are
+    clustered together, and schools without a name are never merged. Clusters
+    chain, so a row of schools each within the tolerance of the next becomes
+    one school. Each cluster keeps its first school, with the number and
+    names of the schools it merged. The table keeps the SRID of the layer and
+    a spatial index, so it can be counted against in place of the layer.
+    Returns the name of the table.
+    """
+    table = deduplicated_table(schools_layer)
+    cursor.execute("SELECT Find_SRID('public', %s, 'geom')", [schools_layer])
+    srid = cursor.fetchone()[0]
+    name = sql.SQL("s.{name_field}::text").format(name_field=sql.Identifier(name_field)) if name_field else sql.SQL("NULL::text")
+    identifiers = {'table': sql.Identifier(table), 'schools_layer': sql.Identifier(schools_layer)}
+
+    cursor.execute(sql.SQL("DROP TABLE IF EXISTS {table}").format(**identifiers))
+    cursor.execute(sql.SQL("""
+        CREATE TABLE {table} (
+            geom geometry(Geometry, {srid}) NOT NULL,
+            name text,
+            merged integer NOT NULL,
+            merged_names text[]
+        )
+    """).format(srid=sql.Literal(srid), **identifiers))
+    if name_field:
+        name_key = sql.SQL("NULLIF(lower(trim({name})), '')").format(name=name)
+        # Each unnamed school is a partition of its own
+        unnamed = sql.SQL("CASE WHEN {name_key} IS NULL THEN s.ctid END").format(name_key=name_key)
+    else:
+        name_key = sql.SQL("NULL::text")
+        unnamed = sql.SQL("NULL::tid")
+    cursor.execute(sql.SQL("""
+        INSERT INTO {table} (geom, name, merged, merged_names)
+        SELECT DISTINCT ON (name_key, unnamed, cluster) geom, name,
+               COUNT(*) OVER cluster_members, array_agg(name) OVER cluster_members
+        FROM (
+            SELECT s.ctid AS id, s.geom, {name} AS name, {name_key} AS name_key, {unnamed} AS unnamed,
+                   ST_ClusterDBSCAN(ST_Transform(s.geom, %(metric_srid)s), %(tolerance)s, 1)
+                       OVER (PARTITION BY {name_key}, {unnamed}) AS cluster
+            FROM {schools_layer} s
+            WHERE s.geom IS NOT NULL
+        ) clustered
+        WINDOW cluster_members AS (
+            PARTITION BY name_key, unnamed, cluster ORDER BY id ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
+        )
+        ORDER BY name_key, unnamed, cluster, id
+    """).format(name=name, name_key=name_key, unnamed=unnamed, **identifiers),
+        {'metric_srid': metric_srid(cursor, schools_layer), 'tolerance': tolerance})
+    cursor.execute(sql.SQL("CREATE INDEX ON {table} USING GIST (geom)").format(**identifiers))
+    cursor.execute(sql.SQL("ANALYZE {table}").format(**identifiers))
+    return table
+
+
+def merged_duplicates(cursor, table):
+    """Return (name, longitude, latitude, merged, merged names) of every kept school that merged duplicates."""
+    cursor.execute(sql.SQL("""
+        SELECT name, ST_X(p), ST_Y(p), merged, array_to_string(merged_names, '; ')
+        FROM (SELECT name, merged, merged_names, ST_Transform(ST_PointOnSurface(geom), 4326) AS p FROM {table} WHERE merged > 1) kept
+        ORDER BY merged DESC, name
+    """).format(table=sql.Identifier(table)))
+    return cursor.fetchall()
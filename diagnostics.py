@@ -0,0 +1,189 @@
+import json
+import re
+
+import psycopg2
+from psycopg2 import sql
+
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'VALUES', 'EXECUTE')
+SCAN_NODES = ('Seq Scan', 'Index Scan', 'Index Only Scan', 'Bitmap Heap Scan')
+# Longest statement text kept in the report, so inlined geometries do not bloat it
+MAX_STATEMENT_LENGTH = 2000
+
+
+def bulk_key(text):
+    """Return the part of a bulk statement before its inlined rows, which is the same for every page."""
+    match = re.search(r'\bVALUES\b', text, re.IGNORECASE) or re.search(r'\(', text)
+    return text[:match.end()] + ' ...' if match else text
+
+
+def truncate_statement(text, length=MAX_STATEMENT_LENGTH):
+    """Return ``text`` stripped and cut to ``length`` characters."""
+    text = text.strip()
+    return text if len(text) <= length else text[:length] + ' ...'
+
+
+class ExplainCursor:
+    """
+    Cursor wrapper that captures ``EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)`` plans.
+
+    Statements are grouped by their text before parameters are bound, so the
+    same per-area statement run a thousand times is one entry, and only the
+    first ``samples_per_statement`` executions of each entry are explained.
+    Pages of rows sent by ``execute_values`` and ``execute_batch`` arrive
+    with their values inlined as bytes; they are grouped by :func:`bulk_key`
+    and never explained. Each plan is captured inside a savepoint that is
+    rolled back afterwards, so explained writes are not applied twice.
+    """
+
+    def __init__(self, cursor, samples_per_statement=1):
+        self.wrapped = cursor
+        self.samples_per_statement = samples_per_statement
+        self.statements = {}
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+
+    def __iter__(self):
+        return iter(self.wrapped)
+
+    def execute(self, query, vars=None):
+        """Execute ``query``, explaining it first if it still needs a sample."""
+        template = query.as_string(self.wrapped) if isinstance(query, sql.Composable) else query
+        bulk = isinstance(template, bytes)
+        if bulk:
+            template = bulk_key(template.decode())
+        entry = self.statements.setdefault(
+            template, {'statement': truncate_statement(template), 'executions': 0, 'plans': []}
+        )
+        entry['executions'] += 1
+        if (not bulk and len(entry['plans']) < self.samples_per_statement
+                and template.lstrip().upper().startswith(EXPLAINABLE)):
+            entry['plans'].append(self._explain(template, vars))
+        return self.wrapped.execute(query, vars)
+
+    def _explain(self, template, vars):
+        """Run EXPLAIN ANALYZE on ``template`` and undo whatever it changed."""
+        self.wrapped.execute("SAVEPOINT explain_capture")
+        try:
+            self.wrapped.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + template, vars)
+            plan = self.wrapped.fetchone()[0]
+        except psycopg2.Error as error:
+            plan = {'error': str(error).strip()}
+        self.wrapped.execute("ROLLBACK TO SAVEPOINT explain_capture")
+        self.wrapped.execute("RELEASE SAVEPOINT explain_capture")
+        return plan
+
+
+def plan_nodes(node):
+    """Yield ``node`` and every node below it in an EXPLAIN JSON plan."""
+    yield node
+    for child in node.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def find_issues(cursor, statements, large_table_rows=10000):
+    """
+    Flag sequential scans on large tables and geometry columns without a spatial index.
+
+    ``statements`` is the ``statements`` dict of an :class:`ExplainCursor`.
+    Returns a list of dicts with the relation, the problem and the statement.
+    """
+    issues = []
+    checked = set()
+    for entry in statements.values():
+        for plan in entry['plans']:
+            if 'error' in plan:
+                continue
+            for node in plan_nodes(plan[0]['Plan']):
+                relation = node.get('Relation Name')
+                if node.get('Node Type') not in SCAN_NODES or not relation:
+                    continue
+                rows = relation_rows(cursor, relation)
+                if node['Node Type'] == 'Seq Scan' and rows >= large_table_rows:
+                    issues.append({
+                        'relation': relation,
+                        'issue': f"sequential scan on a table of about {rows} rows",
+                        'statement': entry['statement'],
+                    })
+                if relation in checked:
+                    continue
+                checked.add(relation)
+                for column in unindexed_geometry_columns(cursor, relation):
+                    issues.append({
+                        'relation': relation,
+                        'issue': f"geometry column {column} has no spatial index",
+                        'statement': entry['statement'],
+                    })
+    return issues
+
+
+def relation_rows(cursor, relation):
+    """
+    Return the planner's row estimate for ``relation``.
+
+    A table that was never analysed has no estimate, so it is analysed
+    first, which samples a bounded number of rows however large it is.
+    """
+    query = "SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(quote_ident(%s))"
+    cursor.execute(query, [relation])
+    row = cursor.fetchone()
+    if row and row[0] < 0:
+        cursor.execute(sql.SQL("ANALYZE {relation}").format(relation=sql.Identifier(relation)))
+        cursor.execute(query, [relation])
+        row = cursor.fetchone()
+    return max(row[0], 0) if row else 0
+
+
+def unindexed_geometry_columns(cursor, relation):
+    """Return the geometry columns of ``relation`` not covered by a GiST, SP-GiST or BRIN index."""
+    cursor.execute("""
+        SELECT a.attname FROM pg_attribute a
+        WHERE a.attrelid = to_regclass(quote_ident(%s))
+        AND a.atttypid = to_regtype('geometry') AND a.attnum > 0 AND NOT a.attisdropped
+        AND NOT EXISTS (
+            SELECT 1 FROM pg_index i
+            JOIN pg_class ic ON ic.oid = i.indexrelid
+            JOIN pg_am am ON am.oid = ic.relam
+            WHERE i.indrelid = a.attrelid AND a.attnum = ANY(i.indkey)
+            AND am.amname IN ('gist', 'spgist', 'brin')
+        )
+    """, [relation])
+    return [row[0] for row in cursor.fetchall()]
+
+
+def geometry_complexity(cursor, relation, sample_rows=200):
+    """
+    Return the mean and largest vertex count of about ``sample_rows`` sampled geometries of ``relation``.
+
+    At most ``sample_rows`` geometries are read, also when the row estimate
+    is too low, such as when the table could not be analysed.
+    """
+    rows = relation_rows(cursor, relation)
+    percent = 100 if rows <= sample_rows else 100 * sample_rows / rows
+    cursor.execute(sql.SQL("""
+        SELECT COALESCE(avg(ST_NPoints(geom)), 0)::float8, COALESCE(max(ST_NPoints(geom)), 0)
+        FROM (SELECT geom FROM {relation} TABLESAMPLE BERNOULLI (%s) WHERE geom IS NOT NULL LIMIT %s) sampled
+    """).format(relation=sql.Identifier(relation)), [percent, sample_rows])
+    return cursor.fetchone()
+
+
+def table_statistics(cursor, city_layer, schools_layer):
+    """Gather the cheap statistics :func:`planner.choose_plan` decides on, without reading the layers in full."""
+    mean_vertices, max_vertices = geometry_complexity(cursor, city_layer)
+    return {
+        'city_rows': relation_rows(cursor, city_layer),
+        'schools_rows': relation_rows(cursor, schools_layer),
+        'schools_indexed': 'geom' not in unindexed_geometry_columns(cursor, schools_layer),
+        'mean_vertices': mean_vertices,
+        'max_vertices': max_vertices,
+    }
+
+
+def write_report(path, statements, issues):
+    """Save the captured plans and the issues found in them as JSON."""
+    report = {
+        'statements': list(statements.values()),
+        'issues': issues,
+    }
+    with open(path, 'w') as report_file:
+        json.dump(report, report_file, indent=2, default=str)
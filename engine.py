@@ -0,0 +1,600 @@
+import hashlib
+import json
+
+import numpy as np
+from psycopg2 import sql
+from psycopg2.extras import execute_batch, execute_values
+
+DEFAULT_AREA_FIELD = 'adm3_en'
+DEFAULT_RESULTS_TABLE = 'results_table'
+CHECKPOINT_TABLE = 'additional_schools_checkpoint'
+MERGE_TABLE = 'merged_counts'
+UNSERVED_TABLE = 'unserved_population'
+TOTAL_LEVEL = 'total'
+# Joins the names of the levels above a result row, which tell apart areas of the same name
+PATH_SEPARATOR = ' / '
+
+
+def area_counts_query(city_layer, schools_layer, population_field, area_field=DEFAULT_AREA_FIELD, parent_fields=(),
+                      area_subset=False, pieces_table=None):
+    """
+    Build the query that counts the schools inside every area in one spatial join.
+
+    Each row carries the parent level values (level_1 .. level_n), the area key,
+    the population, the area geometry in EPSG:4326 and the number of schools.
+    The area geometry is transformed to the SRID of the schools layer, not the
+    other way round, so the spatial index on the schools layer can be used.
+    With ``area_subset`` only the areas in the ``area_keys`` parameter are counted.
+
+    With ``pieces_table`` (see :func:`subdivide.refresh_subdivided`) schools are
+    tested against the small subdivided pieces of each area instead of the
+    whole polygon. A school on a cut line touches two pieces, so those are
+    checked against the parent polygon and counted once per area.
+    """
+    parent_columns = [
+        sql.SQL("COALESCE(c.{field}::text, '') AS {alias}").format(field=sql.Identifier(field), alias=sql.Identifier(f"level_{i}"))
+        for i, field in enumerate(parent_fields, start=1)
+    ]
+    return sql.SQL("""
+        SELECT {parent_columns}c.{area_field}::text AS area_key,
+               c.{population_field}::numeric AS population,
+               ST_Transform(c.geom, 4326) AS geom,
+               sc.available_schools
+        FROM {city_layer} c
+        CROSS JOIN LATERAL ({count}) sc
+        WHERE c.{area_field} IS NOT NULL{subset}
+    """).format(
+        parent_columns=sql.SQL('').join(column + sql.SQL(', ') for column in parent_columns),
+        count=_schools_count(schools_layer, pieces_table),
+        subset=sql.SQL(" AND c.{area_field}::text = ANY(%(area_keys)s)").format(
+            area_field=sql.Identifier(area_field)
+        ) if area_subset else sql.SQL(''),
+        area_field=sql.Identifier(area_field),
+        population_field=sql.Identifier(population_field),
+        city_layer=sql.Identifier(city_layer),
+    )
+
+
+def _schools_count(schools_layer, pieces_table=None):
+    """Build the lateral subquery counting the schools inside the area ``c``."""
+    if pieces_table is None:
+        return sql.SQL("""
+            SELECT COUNT(*) AS available_schools FROM {schools_layer} s
+            WHERE ST_Within(s.geom, ST_Transform(c.geom, Find_SRID('public', {schools_name}, 'geom')))
+        """).format(schools_layer=sql.Identifier(schools_layer), schools_name=sql.Literal(schools_layer))
+    return sql.SQL("""
+        SELECT COUNT(DISTINCT s.ctid) AS available_schools
+        FROM {pieces_table} p
+        JOIN {schools_layer} s ON ST_Intersects(s.geom, p.piece)
+        WHERE p.source_hash = md5(ST_AsEWKB(c.geom))
+        AND (
+            ST_Within(s.geom, p.piece)
+            OR ST_Within(s.geom, ST_Transform(c.geom, Find_SRID('public', {schools_name}, 'geom')))
+        )
+    """).format(
+        pieces_table=sql.Identifier(pieces_table),
+        schools_layer=sql.Identifier(schools_layer),
+        schools_name=sql.Literal(schools_layer),
+    )
+
+
+def rollup_query(source, area_field=DEFAULT_AREA_FIELD, parent_fields=(), to_add=None):
+    """
+    Build the query that aggregates per-area counts to every admin level at once.
+
+    ``source`` is a query returning the columns of :func:`area_counts_query`
+    with one row per area key, such as :func:`grouped_counts_query`, so every
+    strategy computes the schools to add of an area split over several
+    features from its summed counts alike. Required schools are derived from the summed population of the level,
+    while schools to add are summed from the areas, so a surplus in one area
+    does not hide a deficit in its neighbour. ``to_add`` replaces the
+    expression of the schools an area needs, by default the schools its
+    population requires less the schools it has. Each row carries the
+    names of the levels above it joined by :data:`PATH_SEPARATOR` as its
+    parent path, empty for the total and the top level.
+    """
+    levels = [(sql.Identifier(f"level_{i}"), field) for i, field in enumerate(parent_fields, start=1)]
+    levels.append((sql.Identifier('area_key'), area_field))
+    level_cases = sql.SQL(' ').join(
+        sql.SQL("WHEN GROUPING({column}) = 0 THEN {name}").format(column=column, name=sql.Literal(field))
+        for column, field in reversed(levels)
+    )
+    name_cases = sql.SQL(' ').join(
+        sql.SQL("WHEN GROUPING({column}) = 0 THEN {column}").format(column=column)
+        for column, field in reversed(levels)
+    )
+    path_cases = [
+        sql.SQL("WHEN GROUPING({column}) = 0 THEN concat_ws({separator}, {parents})").format(
+            column=levels[depth][0],
+            separator=sql.Literal(PATH_SEPARATOR),
+            parents=sql.SQL(', ').join(column for column, field in levels[:depth]),
+        )
+        for depth in range(len(levels) - 1, 0, -1)
+    ]
+    parent_path = sql.SQL("CASE {cases} ELSE '' END").format(cases=sql.SQL(' ').join(path_cases)) if path_cases else sql.SQL("''")
+    return sql.SQL("""
+        WITH area_counts AS ({source})
+        SELECT CASE {level_cases} ELSE {total} END AS admin_level,
+               CASE {name_cases} ELSE {total} END AS area_name,
+               round(SUM(population) / %(people_per_school)s)::integer AS required_schools,
+               SUM(available_schools)::integer AS available_schools,
+               SUM(GREATEST(0, {to_add}))::integer AS schools_to_add,
+               ST_Multi(ST_CollectionExtract(ST_Collect(geom), 3)) AS geom,
+               {parent_path} AS parent_path
+        FROM area_counts
+        GROUP BY ROLLUP ({columns})
+    """).format(
+        source=source,
+        to_add=to_add or sql.SQL("round(population / %(people_per_school)s) - available_schools"),
+        level_cases=level_cases,
+        name_cases=name_cases,
+        parent_path=parent_path,
+        total=sql.Literal(TOTAL_LEVEL),
+        columns=sql.SQL(', ').join(column for column, field in levels),
+    )
+
+
+def ensure_results_table(cursor, results_table=DEFAULT_RESULTS_TABLE, area_field=DEFAULT_AREA_FIELD):
+    """Create the results table, or upgrade an existing one to store one row per admin level."""
+    table = sql.Identifier(results_table)
+    cursor.execute(sql.SQL("""
+        CREATE TABLE IF NOT EXISTS {table} (
+            admin_level text NOT NULL,
+            area_name text NOT NULL,
+            required_schools integer,
+            available_schools integer,
+            schools_to_add integer,
+            geom geometry(Geometry, 4326)
+        )
+    """).format(table=table))
+    # Tables created before admin levels existed only held rows of the area level
+    cursor.execute(sql.SQL("ALTER TABLE {table} ADD COLUMN IF NOT EXISTS admin_level text NOT NULL DEFAULT {area_field}").format(
+        table=table, area_field=sql.Literal(area_field)
+    ))
+    cursor.execute(sql.SQL("ALTER TABLE {table} ADD COLUMN IF NOT EXISTS parent_path text NOT NULL DEFAULT ''").format(
+        table=table
+    ))
+    # QGIS needs a unique integer key to load the table as a layer
+    cursor.execute(sql.SQL("ALTER TABLE {table} ADD COLUMN IF NOT EXISTS id serial UNIQUE").format(table=table))
+    # The original table was keyed by area name alone, which would reject the rows of every level but one
+    cursor.execute(sql.SQL("""
+        SELECT c.conname, i.indexrelid::regclass::text
+        FROM pg_index i
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+        LEFT JOIN pg_constraint c ON c.conindid = i.indexrelid AND c.conrelid = i.indrelid
+        WHERE i.indrelid = {name}::regclass AND i.indisunique AND i.indnatts = 1 AND a.attname = 'area_name'
+    """).format(name=sql.Literal(table.as_string(cursor.connection))))
+    for constraint, index in cursor.fetchall():
+        if constraint:
+            cursor.execute(sql.SQL("ALTER TABLE {table} DROP CONSTRAINT {constraint}").format(
+                table=table, constraint=sql.Identifier(constraint)
+            ))
+        else:
+            cursor.execute(sql.SQL("DROP INDEX {index}").format(index=sql.SQL(index)))
+    # Areas of the same name under different parents are different rows
+    cursor.execute(sql.SQL("CREATE UNIQUE INDEX IF NOT EXISTS {index} ON {table} (admin_level, parent_path, area_name)").format(
+        index=sql.Identifier(f"{results_table}_level_path_area_idx"), table=table
+    ))
+
+
+def upsert_query(source, results_table=DEFAULT_RESULTS_TABLE):
+    """Build the statement that writes the rows of ``source`` into the results table and returns them."""
+    return sql.SQL("""
+        INSERT INTO {table} (admin_level, area_name, required_schools, available_schools, schools_to_add, geom, parent_path)
+        {source}
+        ON CONFLICT (admin_level, parent_path, area_name) DO UPDATE SET
+        required_schools = EXCLUDED.required_schools,
+        available_schools = EXCLUDED.available_schools,
+        schools_to_add = EXCLUDED.schools_to_add,
+        geom = EXCLUDED.geom
+        RETURNING admin_level, area_name, required_schools, available_schools, schools_to_add, parent_path
+    """).format(table=sql.Identifier(results_table), source=source)
+
+
+def grouped_counts_query(city_layer, schools_layer, population_field, area_field=DEFAULT_AREA_FIELD, parent_fields=(),
+                         area_subset=False, pieces_table=None, geometry=False):
+    """
+    Build a query summing :func:`area_counts_query` per area key, so duplicated keys are merged.
+
+    Rows are (level_1 .. level_n, area key, population, available schools)
+    as loaded by :func:`load_counts`; with ``geometry`` the merged area
+    multipolygon in EPSG:4326 is appended, and the rows can be the source
+    of :func:`rollup_query`.
+    """
+    levels = [sql.Identifier(f"level_{i}") for i in range(1, len(parent_fields) + 1)]
+    group = sql.SQL(', ').join(levels + [sql.Identifier('area_key')])
+    return sql.SQL("""
+        SELECT {group}, SUM(population) AS population, SUM(available_schools) AS available_schools{geom}
+        FROM ({counts}) area_counts
+        GROUP BY {group}
+    """).format(
+        group=group,
+        geom=sql.SQL(", ST_Multi(ST_CollectionExtract(ST_Collect(geom), 3)) AS geom") if geometry else sql.SQL(''),
+        counts=area_counts_query(city_layer, schools_layer, population_field, area_field, parent_fields,
+                                 area_subset=area_subset, pieces_table=pieces_table),
+    )
+
+
+def create_counts_table(cursor, parent_fields=(), geometry=False):
+    """Create the temporary table that per-area counts computed outside one query are merged into."""
+    levels = [sql.SQL("{level} text").format(level=sql.Identifier(f"level_{i}")) for i in range(1, len(parent_fields) + 1)]
+    cursor.execute(sql.SQL("""
+        CREATE TEMP TABLE {merge_table} ({levels}area_key text, population numeric, available_schools bigint{geom})
+        ON COMMIT DROP
+    """).format(
+        merge_table=sql.Identifier(MERGE_TABLE),
+        levels=sql.SQL('').join(level + sql.SQL(', ') for level in levels),
+        geom=sql.SQL(", geom geometry") if geometry else sql.SQL(''),
+    ))
+
+
+def load_counts(cursor, rows, parent_fields=(), geometry=False):
+    """
+    Merge (level_1 .. level_n, area key, population, available schools) rows into the counts table.
+
+    With ``geometry`` each row also ends with the area geometry, as returned
+    by :func:`grouped_counts_query`.
+    """
+    create_counts_table(cursor, parent_fields, geometry)
+    execute_values(cursor, sql.SQL("INSERT INTO {merge_table} VALUES %s").format(
+        merge_table=sql.Identifier(MERGE_TABLE)
+    ).as_string(cursor.connection), rows, page_size=1000)
+
+
+def loaded_counts_query(parent_fields=()):
+    """Build a query returning counts loaded with their geometry, with the columns of :func:`area_counts_query`."""
+    levels = [sql.Identifier(f"level_{i}") for i in range(1, len(parent_fields) + 1)]
+    return sql.SQL("SELECT {levels}area_key, population, geom, available_schools FROM {merge_table}").format(
+        levels=sql.SQL('').join(level + sql.SQL(', ') for level in levels),
+        merge_table=sql.Identifier(MERGE_TABLE),
+    )
+
+
+def merged_counts_query(city_layer, area_field=DEFAULT_AREA_FIELD, parent_fields=()):
+    """
+    Build a query returning the merged counts, summed per area key, with the columns of :func:`area_counts_query`.
+
+    The geometry of each area is collected per parent levels and area key
+    too, so an area keeps only its own features, once.
+    """
+    levels = [sql.Identifier(f"level_{i}") for i in range(1, len(parent_fields) + 1)]
+    group = sql.SQL(', ').join(levels + [sql.Identifier('area_key')])
+    return sql.SQL("""
+        SELECT {levels}t.area_key, t.population, g.geom, t.available_schools
+        FROM (
+            SELECT {group}, SUM(population) AS population, SUM(available_schools) AS available_schools
+            FROM {merge_table} GROUP BY {group}
+        ) t
+        JOIN (
+            SELECT {parent_columns}{area_field}::text AS area_key,
+                   ST_Multi(ST_CollectionExtract(ST_Collect(ST_Transform(geom, 4326)), 3)) AS geom
+            FROM {city_layer} WHERE {area_field} IS NOT NULL
+            GROUP BY {group}
+        ) g USING ({group})
+    """).format(
+        levels=sql.SQL('').join(sql.SQL("t.{level}, ").format(level=level) for level in levels),
+        group=group,
+        parent_columns=sql.SQL('').join(
+            sql.SQL("COALESCE({field}::text, '') AS {alias}, ").format(field=sql.Identifier(field), alias=alias)
+            for field, alias in zip(parent_fields, levels)
+        ),
+        merge_table=sql.Identifier(MERGE_TABLE),
+        area_field=sql.Identifier(area_field),
+        city_layer=sql.Identifier(city_layer),
+    )
+
+
+def round_half_up(values):
+    """Round a number or an array like PostgreSQL's numeric round(), halves away from zero; numbers round to ints."""
+    values = np.asarray(values, dtype=float)
+    rounded = np.sign(values) * np.floor(np.abs(values) + 0.5)
+    return int(rounded) if rounded.ndim == 0 else rounded
+
+
+def sort_results(rows, area_field=DEFAULT_AREA_FIELD, parent_fields=()):
+    """Order result rows from the top admin level down to the areas, then by name and parent path."""
+    rank = {TOTAL_LEVEL: 0}
+    rank.update({field: i for i, field in enumerate(list(parent_fields) + [area_field], start=1)})
+    return sorted(rows, key=lambda row: (rank.get(row[0], len(rank)), row[1], row[5]))
+
+
+def calculate_deficits(cursor, city_layer, schools_layer, population_field, people_per_school,
+                       area_field=DEFAULT_AREA_FIELD, parent_fields=(), results_table=DEFAULT_RESULTS_TABLE,
+                       pieces_table=None):
+    """
+    Calculate required, available and missing schools at every admin level and store them.
+
+    The schools are joined to the areas once and summed per area key; every
+    admin level is then produced by a single ROLLUP over those counts. The
+    caller owns the transaction. Returns the stored rows as lists ordered by
+    :func:`sort_results`.
+    """
+    parent_fields = [field for field in parent_fields if field]
+    ensure_results_table(cursor, results_table, area_field)
+    source = grouped_counts_query(city_layer, schools_layer, population_field, area_field, parent_fields,
+                                  pieces_table=pieces_table, geometry=True)
+    cursor.execute(
+        upsert_query(rollup_query(source, area_field, parent_fields), results_table),
+        {'people_per_school': people_per_school},
+    )
+    return sort_results([list(row) for row in cursor.fetchall()], area_field, parent_fields)
+
+
+def fetch_area_counts(cursor, city_layer, schools_layer, population_field, area_field=DEFAULT_AREA_FIELD,
+                      parent_fields=(), pieces_table=None):
+    """
+    Count the schools inside every area and return the rows with their geometry.
+
+    Rows are (level_1 .. level_n, area key, population, available schools,
+    geometry) as taken by :func:`calculate_deficits_from_counts`. ``cursor``
+    only reads, so it may be on a read replica.
+    """
+    parent_fields = [field for field in parent_fields if field]
+    cursor.execute(
+        grouped_counts_query(city_layer, schools_layer, population_field, area_field, parent_fields,
+                             pieces_table=pieces_table, geometry=True)
+    )
+    return cursor.fetchall()
+
+
+def calculate_deficits_from_counts(cursor, rows, people_per_school, area_field=DEFAULT_AREA_FIELD, parent_fields=(),
+                                   results_table=DEFAULT_RESULTS_TABLE, unserved=None):
+    """
+    Calculate deficits like :func:`calculate_deficits` from counts returned by :func:`fetch_area_counts`.
+
+    Only the merged counts and geometries are sent to ``cursor``, which
+    writes every admin level in one statement, so the counts can come from
+    a read replica or be reused by other calculations of the run. With
+    ``unserved``, a dict of (level_1 .. level_n, area key) tuples ->
+    population without a school in reach, an area needs the schools that
+    population requires instead of the schools its whole population lacks.
+    The caller owns the transaction of ``cursor``.
+    """
+    parent_fields = [field for field in parent_fields if field]
+    load_counts(cursor, rows, parent_fields, geometry=True)
+
+    source = loaded_counts_query(parent_fields)
+    to_add = None
+    if unserved is not None:
+        # Keyed by every level, so areas of the same name under different parents keep their own population
+        keys = [sql.Identifier(f"level_{i}") for i in range(1, len(parent_fields) + 1)] + [sql.Identifier('area_key')]
+        cursor.execute(sql.SQL("""
+            CREATE TEMP TABLE {table} ({columns}, population numeric, PRIMARY KEY ({keys})) ON COMMIT DROP
+        """).format(
+            table=sql.Identifier(UNSERVED_TABLE),
+            columns=sql.SQL(', ').join(sql.SQL("{key} text").format(key=key) for key in keys),
+            keys=sql.SQL(', ').join(keys),
+        ))
+        execute_values(cursor, sql.SQL("INSERT INTO {table} VALUES %s").format(
+            table=sql.Identifier(UNSERVED_TABLE)
+        ).as_string(cursor.connection), [list(key) + [population] for key, population in unserved.items()], page_size=1000)
+        source = sql.SQL("""
+            SELECT counts.*, COALESCE(u.population, 0) AS unserved_population
+            FROM ({source}) counts LEFT JOIN {table} u USING ({keys})
+        """).format(source=source, table=sql.Identifier(UNSERVED_TABLE), keys=sql.SQL(', ').join(keys))
+        to_add = sql.SQL("round(unserved_population / %(people_per_school)s)")
+
+    ensure_results_table(cursor, results_table, area_field)
+    cursor.execute(
+        upsert_query(rollup_query(source, area_field, parent_fields, to_add), results_table),
+        {'people_per_school': people_per_school},
+    )
+    return sort_results([list(row) for row in cursor.fetchall()], area_field, parent_fields)
+
+
+def data_fingerprint(cursor, city_layer, schools_layer):
+    """
+    Return values that change whenever the rows counted by a run change.
+
+    The city layer is fingerprinted by its row count and newest ``xmin``,
+    which every insert or update raises. The schools table may be rebuilt
+    with the same schools by :func:`deduplicate.refresh_deduplicated`, so
+    it is fingerprinted by its row count and exact coordinate sums instead.
+    """
+    cursor.execute(sql.SQL("""
+        SELECT (SELECT COUNT(*) FROM {city_layer}),
+               (SELECT MAX(xmin::text::bigint) FROM {city_layer}),
+               COUNT(*), SUM(ST_X(ST_Centroid(geom))::numeric)::text, SUM(ST_Y(ST_Centroid(geom))::numeric)::text
+        FROM {schools_layer}
+        WHERE geom IS NOT NULL
+    """).format(city_layer=sql.Identifier(city_layer), schools_layer=sql.Identifier(schools_layer)))
+    return list(cursor.fetchone())
+
+
+def run_key(city_layer, schools_layer, population_field, area_field, parent_fields, fingerprint=None):
+    """
+    Return the id under which the checkpoints of a run with these inputs are stored.
+
+    The id starts with a hash of the inputs, followed after a colon by a hash
+    of the :func:`data_fingerprint` of the layers, so checkpoints counted
+    from earlier data are never resumed.
+    """
+    inputs = [city_layer, schools_layer, population_field, area_field, list(parent_fields)]
+    key = hashlib.md5(json.dumps(inputs).encode()).hexdigest()
+    return f"{key}:{hashlib.md5(json.dumps(fingerprint).encode()).hexdigest()}"
+
+
+def lock_key(run_id):
+    """Return the advisory lock key of ``run_id``, a signed 64-bit integer."""
+    return int(hashlib.md5(run_id.encode()).hexdigest()[:16], 16) - (1 << 63)
+
+
+def ensure_checkpoint_table(cursor):
+    """Create the table holding the per-area counts of unfinished runs."""
+    cursor.execute(sql.SQL("""
+        CREATE TABLE IF NOT EXISTS {table} (
+            run_id text NOT NULL,
+            area_key text NOT NULL,
+            parents text[] NOT NULL,
+            population numeric,
+            geom geometry(Geometry, 4326),
+            available_schools bigint
+        )
+    """).format(table=sql.Identifier(CHECKPOINT_TABLE)))
+    cursor.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {index} ON {table} (run_id, area_key)").format(
+        index=sql.Identifier(f"{CHECKPOINT_TABLE}_run_idx"), table=sql.Identifier(CHECKPOINT_TABLE)
+    ))
+
+
+def checkpoint_query(parent_fields=()):
+    """Build a query returning the checkpointed counts of a run, summed per area key, with the columns of :func:`area_counts_query`."""
+    parent_columns = [
+        sql.SQL("parents[{i}] AS {alias}, ").format(i=sql.Literal(i), alias=sql.Identifier(f"level_{i}"))
+        for i in range(1, len(parent_fields) + 1)
+    ]
+    group = sql.SQL('').join(sql.SQL("parents[{i}], ").format(i=sql.Literal(i)) for i in range(1, len(parent_fields) + 1))
+    return sql.SQL("""
+        SELECT {parent_columns}area_key, SUM(population) AS population,
+               ST_Multi(ST_CollectionExtract(ST_Collect(geom), 3)) AS geom, SUM(available_schools) AS available_schools
+        FROM {table} WHERE run_id = %(run_id)s
+        GROUP BY {group}area_key
+    """).format(parent_columns=sql.SQL('').join(parent_columns), group=group, table=sql.Identifier(CHECKPOINT_TABLE))
+
+
+def pending_areas(cursor, city_layer, area_field, run_id):
+    """Return the area keys of the city layer that have no checkpointed counts for ``run_id`` yet."""
+    cursor.execute(sql.SQL("""
+        SELECT DISTINCT {area_field}::text AS area_key FROM {city_layer} WHERE {area_field} IS NOT NULL
+        EXCEPT
+        SELECT area_key FROM {table} WHERE run_id = %(run_id)s
+        ORDER BY area_key
+    """).format(
+        area_field=sql.Identifier(area_field),
+        city_layer=sql.Identifier(city_layer),
+        table=sql.Identifier(CHECKPOINT_TABLE),
+    ), {'run_id': run_id})
+    return [row[0] for row in cursor.fetchall()]
+
+
+def checkpoint_areas(cursor, city_layer, schools_layer, population_field, area_field, parent_fields, run_id, area_keys,
+                     pieces_table=None):
+    """Count the schools of ``area_keys`` and store the counts as checkpoints of ``run_id``."""
+    counts = area_counts_query(city_layer, schools_layer, population_field, area_field, parent_fields, area_subset=True,
+                               pieces_table=pieces_table)
+    parents = sql.SQL(', ').join(sql.Identifier(f"level_{i}") for i in range(1, len(parent_fields) + 1))
+    cursor.execute(sql.SQL("""
+        INSERT INTO {table} (run_id, area_key, parents, population, geom, available_schools)
+        SELECT %(run_id)s, area_key, ARRAY[{parents}]::text[], population, geom, available_schools
+        FROM ({counts}) area_counts
+    """).format(table=sql.Identifier(CHECKPOINT_TABLE), parents=parents, counts=counts),
+        {'run_id': run_id, 'area_keys': list(area_keys)})
+
+
+def calculate_deficits_in_chunks(cursor, city_layer, schools_layer, population_field, people_per_school,
+                                 area_field=DEFAULT_AREA_FIELD, parent_fields=(), results_table=DEFAULT_RESULTS_TABLE,
+                                 chunk_size=500, resume=True, pieces_table=None):
+    """
+    Calculate deficits like :func:`calculate_deficits`, committing every ``chunk_size`` areas.
+
+    The counts of each chunk are committed as checkpoints of the run, so an
+    interrupted run can be resumed from the last committed chunk by calling
+    this again with the same inputs and ``resume``. The results table is only
+    touched by the final roll-up, which reads the checkpoints rather than
+    joining the layers and so holds its locks briefly. Only the checkpoints
+    are committed here: the caller commits the roll-up together with the
+    removal of the run's checkpoints, so a failure before that commit
+    leaves the checkpoints to resume from. Checkpoints are keyed by the
+    inputs and the :func:`data_fingerprint` of the layers, and concurrent
+    runs of the same key are serialised with an advisory lock.
+    """
+    parent_fields = [field for field in parent_fields if field]
+    connection = cursor.connection
+    run_id = run_key(city_layer, schools_layer, population_field, area_field, parent_fields,
+                     data_fingerprint(cursor, city_layer, schools_layer))
+    # Runs with the same inputs and data wait for each other rather than share checkpoints. The lock outlives the
+    # chunk commits and is released when the connection closes; the roll-up also holds it until the caller commits
+    cursor.execute("SELECT pg_advisory_lock(%s)", [lock_key(run_id)])
+    ensure_checkpoint_table(cursor)
+    # Checkpoints of the same inputs counted from earlier data can never be resumed
+    cursor.execute(sql.SQL("DELETE FROM {table} WHERE run_id LIKE %s AND run_id <> %s").format(
+        table=sql.Identifier(CHECKPOINT_TABLE)
+    ), [run_id.split(':')[0] + ':%', run_id])
+    if not resume:
+        cursor.execute(sql.SQL("DELETE FROM {table} WHERE run_id = %s").format(table=sql.Identifier(CHECKPOINT_TABLE)), [run_id])
+    connection.commit()
+
+    area_keys = pending_areas(cursor, city_layer, area_field, run_id)
+    for start in range(0, len(area_keys), chunk_size):
+        checkpoint_areas(
+            cursor, city_layer, schools_layer, population_field, area_field, parent_fields, run_id,
+            area_keys[start:start + chunk_size], pieces_table
+        )
+        connection.commit()
+
+    cursor.execute("SELECT pg_advisory_xact_lock(%(key)s), pg_advisory_unlock(%(key)s)", {'key': lock_key(run_id)})
+    ensure_results_table(cursor, results_table, area_field)
+    cursor.execute(
+        upsert_query(rollup_query(checkpoint_query(parent_fields), area_field, parent_fields), results_table),
+        {'people_per_school': people_per_school, 'run_id': run_id},
+    )
+    results = sort_results([list(row) for row in cursor.fetchall()], area_field, parent_fields)
+    cursor.execute(sql.SQL("DELETE FROM {table} WHERE run_id = %s").format(table=sql.Identifier(CHECKPOINT_TABLE)), [run_id])
+    return results
+
+
+def prepare_statement(cursor, name, statement, types):
+    """
+    PREPARE ``statement`` on the cursor's connection unless it already is, and return its handle.
+
+    The handle includes a hash of the statement text, so statements built for
+    other layers never collide with it on a reused connection.
+    """
+    text = statement.as_string(cursor.connection) if isinstance(statement, sql.Composable) else statement
+    handle = f"{name}_{hashlib.md5(text.encode()).hexdigest()[:12]}"
+    cursor.execute("SELECT 1 FROM pg_prepared_statements WHERE name = %s", [handle])
+    if cursor.fetchone() is None:
+        cursor.execute(sql.SQL("PREPARE {handle} ({types}) AS {statement}").format(
+            handle=sql.Identifier(handle),
+            types=sql.SQL(', ').join(sql.SQL(data_type) for data_type in types),
+            statement=sql.SQL(text),
+        ))
+    return handle
+
+
+def calculate_deficits_per_area(cursor, city_layer, schools_layer, population_field, people_per_school,
+                                area_field=DEFAULT_AREA_FIELD, parent_fields=(), results_table=DEFAULT_RESULTS_TABLE):
+    """
+    Calculate deficits like :func:`calculate_deficits`, counting each area with its own statement.
+
+    This is the original per-area algorithm, kept for debugging and parity
+    checks. The count and insert statements are prepared once per connection
+    and executed by handle, and the inserts are sent in pages, so each area
+    costs one round trip instead of a parse and plan.
+    """
+    parent_fields = [field for field in parent_fields if field]
+    count = prepare_statement(cursor, 'count_schools', sql.SQL("""
+        SELECT COUNT(*) FROM {schools_layer}
+        WHERE ST_Within(geom, ST_Transform($1, Find_SRID('public', {schools_name}, 'geom')))
+    """).format(schools_layer=sql.Identifier(schools_layer), schools_name=sql.Literal(schools_layer)), ['geometry'])
+    create_counts_table(cursor, parent_fields)
+    columns = len(parent_fields) + 3
+    insert = prepare_statement(cursor, 'insert_count', sql.SQL("INSERT INTO {merge_table} VALUES ({params})").format(
+        merge_table=sql.Identifier(MERGE_TABLE),
+        params=sql.SQL(', ').join(sql.SQL(f"${i}") for i in range(1, columns + 1)),
+    ), ['text'] * (columns - 2) + ['numeric', 'bigint'])
+
+    parent_columns = [sql.SQL("COALESCE({field}::text, ''), ").format(field=sql.Identifier(field)) for field in parent_fields]
+    cursor.execute(sql.SQL("""
+        SELECT {parent_columns}{area_field}::text, {population_field}::numeric, geom
+        FROM {city_layer} WHERE {area_field} IS NOT NULL
+    """).format(
+        parent_columns=sql.SQL('').join(parent_columns),
+        area_field=sql.Identifier(area_field),
+        population_field=sql.Identifier(population_field),
+        city_layer=sql.Identifier(city_layer),
+    ))
+    rows = []
+    for *levels, area_key, population, geom in cursor.fetchall():
+        cursor.execute(sql.SQL("EXECUTE {count} (%s)").format(count=sql.Identifier(count)), [geom])
+        rows.append(levels + [area_key, population, cursor.fetchone()[0]])
+    execute_batch(cursor, sql.SQL("EXECUTE {insert} ({params})").format(
+        insert=sql.Identifier(insert),
+        params=sql.SQL(', ').join(sql.Placeholder() * columns),
+    ).as_string(cursor.connection), rows, page_size=1000)
+
+    ensure_results_table(cursor, results_table, area_field)
+    cursor.execute(
+        upsert_query(rollup_query(merged_counts_query(city_layer, area_field, parent_fields), area_field, parent_fields), results_table),
+        {'people_per_school': people_per_school},
+    )
+    return sort_results([list(row) for row in cursor.fetchall()], area_field, parent_fields)
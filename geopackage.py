@@ -0,0 +1,443 @@
+import hashlib
+import json
+import math
+import os
+import shutil
+import struct
+import tempfile
+
+import numpy as np
+
+# The query service imports this module outside the plugin package
+if __package__:
+    from .engine import DEFAULT_AREA_FIELD, DEFAULT_RESULTS_TABLE, PATH_SEPARATOR, TOTAL_LEVEL, round_half_up
+else:
+    from engine import DEFAULT_AREA_FIELD, DEFAULT_RESULTS_TABLE, PATH_SEPARATOR, TOTAL_LEVEL, round_half_up
+
+# Bytes of the envelope that follows the GeoPackage header, by envelope indicator
+ENVELOPE_SIZES = {0: 0, 1: 32, 2: 48, 3: 48, 4: 64}
+WKB_POINT = 1
+WKB_LINESTRING = 2
+WKB_POLYGON = 3
+WKB_MULTIPOINT = 4
+WKB_MULTILINESTRING = 5
+WKB_MULTIPOLYGON = 6
+INDEX_DIRECTORY = os.path.join(tempfile.gettempdir(), 'additional_schools_indexes')
+POINTS_PER_CELL = 16
+# Most point x edge pairs tested at once, bounds the temporaries of points_in_polygons
+CHUNK_ELEMENTS = 1 << 20
+
+
+def wkb_offset(blob):
+    """Return the byte offset of the WKB geometry inside a GeoPackage geometry blob."""
+    if blob[:2] != b'GP':
+        raise ValueError("Not a GeoPackage geometry blob")
+    flags = blob[3]
+    return 8 + ENVELOPE_SIZES[(flags >> 1) & 0x07]
+
+
+def parse_wkb(data, offset=0):
+    """
+    Parse a WKB point, line, polygon or their multi types starting at ``offset``.
+
+    Points are returned as an (x, y) tuple, multipoints as a list of them,
+    and polygonal geometries as a list of polygons, each a list of (n, 2)
+    ring arrays, so both kinds can be fed to :func:`points_in_polygons`.
+    Lines are returned as a list of (n, 2)
+    vertex arrays. Z and M ordinates are dropped. Returns the geometry and
+    the offset just past it.
+    """
+    endian = '<' if data[offset] == 1 else '>'
+    geometry_type, = struct.unpack_from(endian + 'I', data, offset + 1)
+    offset += 5
+    dimensions = {0: 2, 1: 3, 2: 3, 3: 4}[geometry_type // 1000]
+    geometry_type %= 1000
+    if geometry_type == WKB_POINT:
+        x, y = struct.unpack_from(endian + 'dd', data, offset)
+        return (x, y), offset + 8 * dimensions
+    if geometry_type == WKB_LINESTRING:
+        point_count, = struct.unpack_from(endian + 'I', data, offset)
+        offset += 4
+        line = np.frombuffer(data, dtype=endian + 'f8', count=point_count * dimensions, offset=offset)
+        return [line.reshape(point_count, dimensions)[:, :2]], offset + 8 * point_count * dimensions
+    if geometry_type == WKB_POLYGON:
+        ring_count, = struct.unpack_from(endian + 'I', data, offset)
+        offset += 4
+        rings = []
+        for _ in range(ring_count):
+            point_count, = struct.unpack_from(endian + 'I', data, offset)
+            offset += 4
+            ring = np.frombuffer(data, dtype=endian + 'f8', count=point_count * dimensions, offset=offset)
+            rings.append(ring.reshape(point_count, dimensions)[:, :2])
+            offset += 8 * point_count * dimensions
+        return [rings], offset
+    if geometry_type == WKB_MULTIPOINT:
+        point_count, = struct.unpack_from(endian + 'I', data, offset)
+        offset += 4
+        points = []
+        for _ in range(point_count):
+            point, offset = parse_wkb(data, offset)
+            points.append(point)
+        return points, offset
+    if geometry_type in (WKB_MULTILINESTRING, WKB_MULTIPOLYGON):
+        part_count, = struct.unpack_from(endian + 'I', data, offset)
+        offset += 4
+        parts = []
+        for _ in range(part_count):
+            part, offset = parse_wkb(data, offset)
+            parts.extend(part)
+        return parts, offset
+    raise ValueError(f"Unsupported WKB geometry type {geometry_type}")
+
+
+def read_geometry(blob):
+    """Return the geometry stored in a GeoPackage geometry blob, see :func:`parse_wkb`."""
+    blob = bytes(blob)
+    return parse_wkb(blob, wkb_offset(blob))[0]
+
+
+def geometry_blob(polygons, srs_id):
+    """Encode polygons (lists of ring arrays) as a little-endian GeoPackage MultiPolygon blob."""
+    parts = [struct.pack('<BII', 1, WKB_MULTIPOLYGON, len(polygons))]
+    for rings in polygons:
+        parts.append(struct.pack('<BII', 1, WKB_POLYGON, len(rings)))
+        for ring in rings:
+            ring = np.ascontiguousarray(ring, dtype='<f8')
+            parts.append(struct.pack('<I', len(ring)))
+            parts.append(ring.tobytes())
+    coordinates = np.concatenate([np.empty((0, 2))] + [ring for rings in polygons for ring in rings])
+    if not len(coordinates):
+        coordinates = np.zeros((1, 2))
+    minx, miny = coordinates.min(axis=0)
+    maxx, maxy = coordinates.max(axis=0)
+    # Version 0, little-endian, with an xy envelope
+    header = b'GP' + struct.pack('<BBi4d', 0, 0x03, srs_id, minx, maxx, miny, maxy)
+    return header + b''.join(parts)
+
+
+def chunk_shape(point_count, edge_count, max_elements=CHUNK_ELEMENTS):
+    """
+    Return the (points, edges) block size for testing points against edges.
+
+    Both sides are cut so that a block never pairs more than ``max_elements``
+    points with edges, however many vertices a polygon has.
+    """
+    edge_block = max(1, min(edge_count, max_elements))
+    point_block = max(1, min(point_count, max_elements // edge_block))
+    return point_block, edge_block
+
+
+def points_in_polygons(points, polygons, max_elements=CHUNK_ELEMENTS):
+    """
+    Return a boolean mask of the ``points`` lying inside any of ``polygons``.
+
+    Uses the even-odd rule over all rings of a polygon, so holes are
+    excluded. Points and edges are both tested in blocks of at most
+    ``max_elements`` pairs to bound memory for polygons with many vertices.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    inside = np.zeros(len(points), dtype=bool)
+    for rings in polygons:
+        edges = np.concatenate([np.hstack([ring[:-1], ring[1:]]) for ring in rings if len(ring) > 1])
+        point_block, edge_block = chunk_shape(len(points), len(edges), max_elements)
+        polygon_inside = np.zeros(len(points), dtype=bool)
+        for start in range(0, len(points), point_block):
+            px = points[start:start + point_block, 0][:, None]
+            py = points[start:start + point_block, 1][:, None]
+            crossings = np.zeros(len(px), dtype=np.int64)
+            for edge_start in range(0, len(edges), edge_block):
+                x1, y1, x2, y2 = edges[edge_start:edge_start + edge_block].T
+                spans = (y1 > py) != (y2 > py)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    crossing_x = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+                crossings += np.count_nonzero(spans & (px < crossing_x), axis=1)
+            polygon_inside[start:start + point_block] = crossings % 2 == 1
+        inside |= polygon_inside
+    return inside
+
+
+def rollup_counts(rows, people_per_school, area_field=DEFAULT_AREA_FIELD, parent_fields=()):
+    """
+    Aggregate per-area counts to every admin level, like the PostGIS ROLLUP.
+
+    ``rows`` are (level_1 .. level_n, area key, population, available
+    schools, polygons) tuples. Returns (admin level, area name, required,
+    available, to add, parent path, polygons) rows, with the same level
+    semantics and parent paths as :func:`engine.rollup_query`. Rows of the
+    same area key are summed first, as :func:`engine.grouped_counts_query`
+    does.
+    """
+    levels = list(parent_fields) + [area_field]
+    areas = {}
+    for row in rows:
+        area = areas.setdefault(tuple(row[:len(levels)]), [0, 0, []])
+        area[0] += row[len(levels)]
+        area[1] += row[len(levels) + 1]
+        area[2].extend(row[len(levels) + 2])
+    groups = {}
+    for keys, (population, available, polygons) in areas.items():
+        to_add = max(0, round_half_up(population / people_per_school) - available)
+        for depth in range(len(levels) + 1):
+            if depth:
+                key = (levels[depth - 1], keys[depth - 1], PATH_SEPARATOR.join(keys[:depth - 1]))
+            else:
+                key = (TOTAL_LEVEL, TOTAL_LEVEL, '')
+            group = groups.setdefault(key, [0, 0, 0, []])
+            group[0] += population
+            group[1] += available
+            group[2] += to_add
+            group[3].extend(polygons)
+    return [
+        [level, name, round_half_up(population / people_per_school), available, to_add, parent_path, polygons]
+        for (level, name, parent_path), (population, available, to_add, polygons) in groups.items()
+    ]
+
+
+def geometry_column(connection, table):
+    """Return the geometry column name and SRS id of a GeoPackage feature table."""
+    row = connection.execute(
+        "SELECT column_name, srs_id FROM gpkg_geometry_columns WHERE table_name = ?", [table]
+    ).fetchone()
+    if row is None:
+        raise ValueError(f"{table} is not a feature table of the GeoPackage")
+    return row
+
+
+def has_rtree(connection, table, column):
+    """Return whether the GeoPackage R-tree spatial index of ``table`` exists."""
+    return connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", [f"rtree_{table}_{column}"]
+    ).fetchone() is not None
+
+
+def read_points(connection, table, column):
+    """Return the point geometries of ``table`` as an (n, 2) array, with every point of a multipoint, skipping empty rows."""
+    coordinates = []
+    for blob, in connection.execute(f'SELECT "{column}" FROM "{table}" WHERE "{column}" IS NOT NULL'):
+        offset = wkb_offset(blob)
+        endian = '<' if blob[offset] == 1 else '>'
+        if struct.unpack_from(endian + 'I', blob, offset + 1)[0] % 1000 == WKB_POINT:
+            coordinates.append(struct.unpack_from(endian + 'dd', blob, offset + 5))
+        else:
+            coordinates.extend(read_geometry(blob))
+    return np.array(coordinates, dtype=float).reshape(-1, 2)
+
+
+class PointIndex:
+    """Points sorted by the cell of a regular grid they fall in, so a bounding box reads a few contiguous runs."""
+
+    def __init__(self, points, offsets, grid):
+        """
+        Constructor method.
+        :param points: (n, 2) array of the points ordered by cell, row by row
+        :param offsets: Index of the first point of every cell, plus the number of points
+        :param grid: Array of the grid origin x and y, cell size and number of columns and rows
+        """
+        self.points = points
+        self.offsets = offsets
+        self.grid = grid
+
+    @classmethod
+    def build(cls, points, points_per_cell=POINTS_PER_CELL):
+        """Index ``points`` on a grid holding about ``points_per_cell`` points per cell."""
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        if not len(points):
+            return cls(points, np.zeros(2, dtype=np.int64), np.array([0, 0, 1, 1, 1], dtype=float))
+        origin = points.min(axis=0)
+        width, height = points.max(axis=0) - origin
+        cells = max(1, len(points) // points_per_cell)
+        size = math.sqrt(width * height / cells) if width and height else max(width, height) / cells
+        size = size or 1.0
+        columns, rows = int(width // size) + 1, int(height // size) + 1
+        cell = cls._cells(points, origin, size, columns, rows)
+        order = np.argsort(cell, kind='stable')
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(cell, minlength=columns * rows))]).astype(np.int64)
+        return cls(points[order], offsets, np.array([*origin, size, columns, rows], dtype=float))
+
+    @staticmethod
+    def _cells(points, origin, size, columns, rows):
+        """Return the row-major cell number of every point."""
+        i = np.clip(((points[:, 0] - origin[0]) // size).astype(np.int64), 0, columns - 1)
+        j = np.clip(((points[:, 1] - origin[1]) // size).astype(np.int64), 0, rows - 1)
+        return j * columns + i
+
+    def save(self, directory):
+        """Write the index to ``directory`` as .npy files that :meth:`load` can memory-map."""
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, 'points.npy'), self.points)
+        np.save(os.path.join(directory, 'offsets.npy'), self.offsets)
+        np.save(os.path.join(directory, 'grid.npy'), self.grid)
+
+    @classmethod
+    def load(cls, directory):
+        """Memory-map an index written by :meth:`save`; only the cells that are queried are read from disk."""
+        return cls(
+            np.load(os.path.join(directory, 'points.npy'), mmap_mode='r'),
+            np.load(os.path.join(directory, 'offsets.npy'), mmap_mode='r'),
+            np.load(os.path.join(directory, 'grid.npy')),
+        )
+
+    def query(self, bounds):
+        """Return the points inside ``bounds`` (minx, miny, maxx, maxy) as an (n, 2) array."""
+        minx, miny, maxx, maxy = bounds
+        origin_x, origin_y, size, columns, rows = self.grid
+        columns, rows = int(columns), int(rows)
+        i0, j0 = math.floor((minx - origin_x) / size), math.floor((miny - origin_y) / size)
+        i1, j1 = math.floor((maxx - origin_x) / size), math.floor((maxy - origin_y) / size)
+        if i1 < 0 or j1 < 0 or i0 >= columns or j0 >= rows or not len(self.points):
+            return np.zeros((0, 2))
+        i0, j0, i1, j1 = max(i0, 0), max(j0, 0), min(i1, columns - 1), min(j1, rows - 1)
+        # The cells of one grid row within the box are adjacent, so each row is a single slice
+        candidates = np.concatenate([
+            self.points[self.offsets[j * columns + i0]:self.offsets[j * columns + i1 + 1]] for j in range(j0, j1 + 1)
+        ])
+        inside = ((candidates[:, 0] >= minx) & (candidates[:, 0] <= maxx)
+                  & (candidates[:, 1] >= miny) & (candidates[:, 1] <= maxy))
+        return candidates[inside]
+
+
+def index_fingerprint(connection, table, column):
+    """
+    Return values that change whenever the points of ``table`` do.
+
+    The R-tree of the layer is updated by triggers on every insert, delete
+    and move, so its row count and coordinate sums fingerprint the points
+    without decoding them; the modification time of the file would also
+    change whenever results are written to it.
+    """
+    path = next((row[2] for row in connection.execute("PRAGMA database_list") if row[1] == 'main'), '')
+    aggregate = connection.execute(
+        f'SELECT count(*), max(id), total(minx), total(miny), total(maxx), total(maxy) FROM "rtree_{table}_{column}"'
+    ).fetchone()
+    return [os.path.abspath(path) if path else '', table, column, *aggregate]
+
+
+def point_index(connection, table, column, index_directory=INDEX_DIRECTORY):
+    """
+    Return the :class:`PointIndex` of the points of ``table``, loading it from ``index_directory`` when cached.
+
+    Building decodes every point once; later runs memory-map the cached
+    index while the layer is unchanged. Caching a new index removes those
+    of earlier versions of the same layer. In-memory databases, and any
+    database when ``index_directory`` is None, are indexed without caching.
+    """
+    fingerprint = index_fingerprint(connection, table, column) if index_directory is not None else None
+    if not fingerprint or not fingerprint[0]:
+        return PointIndex.build(read_points(connection, table, column))
+    # Named by the layer and then by its version, so the indexes of one layer share a prefix
+    source = hashlib.md5(json.dumps(fingerprint[:3]).encode()).hexdigest()
+    key = hashlib.md5(json.dumps(fingerprint).encode()).hexdigest()
+    cached = os.path.join(index_directory, f"{source}_{key}")
+    if os.path.isdir(cached):
+        return PointIndex.load(cached)
+    index = PointIndex.build(read_points(connection, table, column))
+    # Write to a directory of its own and rename it, so a crash never leaves a partial index behind
+    partial = f"{cached}.{os.getpid()}"
+    index.save(partial)
+    try:
+        os.replace(partial, cached)
+    except OSError:
+        # Another run cached the same index first
+        shutil.rmtree(partial, ignore_errors=True)
+    # Earlier versions of the layer are never read again; partial indexes of other runs are theirs to rename
+    for name in os.listdir(index_directory):
+        if name.startswith(f"{source}_") and name != os.path.basename(cached) and '.' not in name:
+            shutil.rmtree(os.path.join(index_directory, name), ignore_errors=True)
+    return PointIndex.load(cached)
+
+
+def area_counts(connection, city_layer, schools_layer, population_field, area_field=DEFAULT_AREA_FIELD, parent_fields=(),
+                index_directory=INDEX_DIRECTORY):
+    """
+    Count the schools inside every area of a GeoPackage.
+
+    Candidate schools come from the :func:`point_index` of the schools
+    layer using the bounding box of each area; only those are tested
+    point-in-polygon. Areas without a geometry, or with an empty one, are
+    skipped. Returns rows for :func:`rollup_counts`.
+    """
+    city_column, city_srs = geometry_column(connection, city_layer)
+    schools_column, schools_srs = geometry_column(connection, schools_layer)
+    if city_srs != schools_srs:
+        raise ValueError(f"{city_layer} and {schools_layer} must use the same coordinate reference system")
+    if not has_rtree(connection, schools_layer, schools_column):
+        raise ValueError(f"{schools_layer} has no spatial index; create one before running offline")
+
+    index = point_index(connection, schools_layer, schools_column, index_directory)
+    fields = ', '.join(f'"{field}"' for field in list(parent_fields) + [area_field, population_field, city_column])
+    rows = []
+    for record in connection.execute(f'SELECT {fields} FROM "{city_layer}" WHERE "{area_field}" IS NOT NULL'):
+        *keys, population, blob = record
+        if blob is None:
+            continue
+        polygons = [rings for rings in read_geometry(blob) if rings and len(rings[0])]
+        if not polygons:
+            continue
+        coordinates = np.concatenate([rings[0] for rings in polygons])
+        bounds = (*coordinates.min(axis=0), *coordinates.max(axis=0))
+        points = index.query(bounds)
+        available = int(np.count_nonzero(points_in_polygons(points, polygons)))
+        keys = ['' if key is None else str(key) for key in keys]
+        rows.append((*keys, population or 0, available, polygons))
+    return rows
+
+
+def ensure_results_table(connection, results_table, srs_id):
+    """Create the results feature table in the GeoPackage and register it so QGIS can load it."""
+    connection.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{results_table}" (
+            fid INTEGER PRIMARY KEY AUTOINCREMENT,
+            geom BLOB,
+            admin_level TEXT NOT NULL,
+            area_name TEXT NOT NULL,
+            required_schools INTEGER,
+            available_schools INTEGER,
+            schools_to_add INTEGER,
+            parent_path TEXT NOT NULL DEFAULT '',
+            UNIQUE (admin_level, parent_path, area_name)
+        )
+    """)
+    connection.execute(
+        "INSERT OR IGNORE INTO gpkg_contents (table_name, data_type, identifier, srs_id) VALUES (?, 'features', ?, ?)",
+        [results_table, results_table, srs_id]
+    )
+    connection.execute(
+        "INSERT OR IGNORE INTO gpkg_geometry_columns (table_name, column_name, geometry_type_name, srs_id, z, m) "
+        "VALUES (?, 'geom', 'MULTIPOLYGON', ?, 0, 0)",
+        [results_table, srs_id]
+    )
+
+
+def calculate_deficits(connection, city_layer, schools_layer, population_field, people_per_school,
+                       area_field=DEFAULT_AREA_FIELD, parent_fields=(), results_table=DEFAULT_RESULTS_TABLE,
+                       index_directory=INDEX_DIRECTORY):
+    """
+    Calculate deficits at every admin level in a GeoPackage and store them in ``results_table``.
+
+    Produces the same rows and table columns as :func:`engine.calculate_deficits`,
+    entirely on the local file. The schools index is cached in
+    ``index_directory``, see :func:`point_index`. The caller owns the
+    transaction.
+    """
+    parent_fields = [field for field in parent_fields if field]
+    rows = rollup_counts(
+        area_counts(connection, city_layer, schools_layer, population_field, area_field, parent_fields,
+                    index_directory),
+        people_per_school, area_field, parent_fields
+    )
+    srs_id = geometry_column(connection, city_layer)[1]
+    ensure_results_table(connection, results_table, srs_id)
+    connection.executemany(f"""
+        INSERT INTO "{results_table}" (admin_level, area_name, required_schools, available_schools, schools_to_add,
+                                       parent_path, geom)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (admin_level, parent_path, area_name) DO UPDATE SET
+        required_schools = excluded.required_schools,
+        available_schools = excluded.available_schools,
+        schools_to_add = excluded.schools_to_add,
+        geom = excluded.geom
+    """, [row[:6] + [geometry_blob(row[6], srs_id)] for row in rows])
+
+    rank = {TOTAL_LEVEL: 0}
+    rank.update({field: i for i, field in enumerate(parent_fields + [area_field], start=1)})
+    return sorted((row[:6] for row in rows), key=lambda row: (rank.get(row[0], len(rank)), row[1], row[5]))
@@ -0,0 +1,191 @@
+import io
+import math
+
+import numpy as np
+from psycopg2 import sql
+
+HEXAGON = 'hexagon'
+SQUARE = 'square'
+GRID_TABLE = 'grid_results'
+FETCH_SIZE = 100000
+
+# 24 bytes per cell, so millions of cells fit in laptop memory
+CELL_DTYPE = np.dtype([
+    ('i', '<i4'), ('j', '<i4'), ('population', '<f4'),
+    ('required_schools', '<i4'), ('available_schools', '<i4'), ('schools_to_add', '<i4'),
+])
+
+
+def hexagon_cells(points, size):
+    """
+    Return the (i, j) indices of the ``ST_HexagonGrid`` cells of side ``size`` containing ``points``.
+
+    PostGIS lays flat-topped hexagons out in columns: the centre of cell
+    (i, j) is (1.5 size i, sqrt(3) size (j + 0.5 (i mod 2))). Points are
+    converted to axial coordinates and rounded to the nearest hexagon centre.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    q = (2 / 3) * points[:, 0] / size
+    r = (-points[:, 0] / 3 + math.sqrt(3) / 3 * points[:, 1]) / size
+    x, z = q, r
+    y = -x - z
+    rx, ry, rz = np.round(x), np.round(y), np.round(z)
+    dx, dy, dz = np.abs(rx - x), np.abs(ry - y), np.abs(rz - z)
+    fix_x = (dx > dy) & (dx > dz)
+    fix_z = ~fix_x & (dz >= dy)
+    rx = np.where(fix_x, -ry - rz, rx)
+    rz = np.where(fix_z, -rx - ry, rz)
+    i = rx.astype(np.int64)
+    j = rz.astype(np.int64) + (i - (i & 1)) // 2
+    return i, j
+
+
+def square_cells(points, size):
+    """Return the (i, j) indices of the ``ST_SquareGrid`` cells of side ``size`` containing ``points``."""
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    cells = np.floor(points / size).astype(np.int64)
+    return cells[:, 0], cells[:, 1]
+
+
+def cell_centres(i, j, size, shape):
+    """Return the centres of cells (i, j) of side ``size`` as an (n, 2) array, the inverse of :func:`hexagon_cells` and :func:`square_cells`."""
+    i = np.asarray(i, dtype=float)
+    j = np.asarray(j, dtype=float)
+    if shape == HEXAGON:
+        return np.column_stack([1.5 * size * i, math.sqrt(3) * size * (j + 0.5 * (i.astype(np.int64) & 1))])
+    return np.column_stack([(i + 0.5) * size, (j + 0.5) * size])
+
+
+def cell_keys(i, j):
+    """Hash cell indices into one int64 key per cell."""
+    return (np.asarray(i, dtype=np.int64) << 32) | (np.asarray(j, dtype=np.int64) & 0xFFFFFFFF)
+
+
+def grid_deficits(cell_i, cell_j, population, schools, size, shape, people_per_school):
+    """
+    Count the schools of every populated cell and return the cells' deficits as a :data:`CELL_DTYPE` array.
+
+    Each school is hashed to the key of its cell and the counts are matched
+    to the populated cells by sorted key lookup, so no geometry is compared.
+    Schools in unpopulated cells are ignored.
+    """
+    cells = np.zeros(len(cell_i), dtype=CELL_DTYPE)
+    cells['i'] = cell_i
+    cells['j'] = cell_j
+    cells['population'] = population
+    cells['required_schools'] = np.floor(np.asarray(population, dtype=float) / people_per_school + 0.5)
+
+    school_i, school_j = (hexagon_cells if shape == HEXAGON else square_cells)(schools, size)
+    school_keys, counts = np.unique(cell_keys(school_i, school_j), return_counts=True)
+    keys = cell_keys(cell_i, cell_j)
+    order = np.argsort(keys)
+    position = np.searchsorted(keys, school_keys, sorter=order)
+    found = position < len(keys)
+    found[found] = keys[order[position[found]]] == school_keys[found]
+    cells['available_schools'][order[position[found]]] = counts[found]
+    cells['schools_to_add'] = np.maximum(0, cells['required_schools'] - cells['available_schools'])
+    return cells
+
+
+def iter_cell_population(connection, city_layer, population_field, srid, size, shape):
+    """
+    Spread the population of every area over the grid cells it overlaps, in proportion to the overlap area.
+
+    Cells come from ``ST_HexagonGrid`` or ``ST_SquareGrid`` in ``srid``, which
+    share one origin so cells of neighbouring areas line up and are summed.
+    Rows are streamed through a server-side cursor and yielded as (n, 3)
+    arrays of cell i, cell j and population, at most FETCH_SIZE at a time.
+    """
+    cursor = connection.cursor(name='grid_cells')
+    cursor.itersize = FETCH_SIZE
+    cursor.execute(sql.SQL("""
+        WITH area AS (
+            SELECT {population_field}::numeric AS population, ST_Transform(geom, %(srid)s) AS geom
+            FROM {city_layer}
+            WHERE {population_field} IS NOT NULL AND geom IS NOT NULL
+        )
+        SELECT g.i, g.j, SUM(a.population * ST_Area(ST_Intersection(a.geom, g.geom)) / NULLIF(ST_Area(a.geom), 0))::float8
+        FROM area a
+        CROSS JOIN LATERAL {grid}(%(size)s, a.geom) g
+        WHERE ST_Intersects(a.geom, g.geom)
+        GROUP BY g.i, g.j
+    """).format(
+        population_field=sql.Identifier(population_field),
+        city_layer=sql.Identifier(city_layer),
+        grid=sql.SQL('ST_HexagonGrid' if shape == HEXAGON else 'ST_SquareGrid'),
+    ), {'srid': srid, 'size': size})
+    try:
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            cells = np.array(rows, dtype=float)
+            cells[:, 2] = np.nan_to_num(cells[:, 2])
+            yield cells
+    finally:
+        cursor.close()
+
+
+def fetch_cell_population(connection, city_layer, population_field, srid, size, shape):
+    """Return the cell (i, j) index arrays and the population array of :func:`iter_cell_population`."""
+    chunks = list(iter_cell_population(connection, city_layer, population_field, srid, size, shape))
+    cells = np.concatenate(chunks) if chunks else np.zeros((0, 3))
+    return cells[:, 0].astype(np.int32), cells[:, 1].astype(np.int32), cells[:, 2]
+
+
+def fetch_school_points(cursor, schools_layer, srid):
+    """Return the schools as an (n, 2) array of coordinates in ``srid``."""
+    cursor.execute(sql.SQL("""
+        SELECT ST_X(p), ST_Y(p)
+        FROM (SELECT ST_Transform(ST_PointOnSurface(geom), %(srid)s) AS p FROM {schools_layer} WHERE geom IS NOT NULL) s
+    """).format(schools_layer=sql.Identifier(schools_layer)), {'srid': srid})
+    return np.array(cursor.fetchall(), dtype=float).reshape(-1, 2)
+
+
+def cell_polygon(shape):
+    """Build the expression of the polygon of cell (i, j) of side %(size)s in %(srid)s."""
+    if shape == HEXAGON:
+        return sql.SQL("""
+            ST_SetSRID(ST_Translate(ST_Scale(
+                'POLYGON((-1 0, -0.5 -0.8660254037844387, 0.5 -0.8660254037844387, 1 0, 0.5 0.8660254037844387, -0.5 0.8660254037844387, -1 0))'::geometry,
+                %(size)s, %(size)s
+            ), 1.5 * %(size)s * i, sqrt(3) * %(size)s * (j + 0.5 * (i & 1))), %(srid)s)
+        """)
+    return sql.SQL("ST_MakeEnvelope(i * %(size)s, j * %(size)s, (i + 1) * %(size)s, (j + 1) * %(size)s, %(srid)s)")
+
+
+def write_grid(cursor, cells, size, shape, srid, grid_table=GRID_TABLE):
+    """
+    Replace ``grid_table`` with the cells and their polygons.
+
+    The cells are streamed in with COPY and their polygons are rebuilt on
+    the server from the cell indices, so no geometry is sent.
+    """
+    identifiers = {'table': sql.Identifier(grid_table)}
+    cursor.execute(sql.SQL("DROP TABLE IF EXISTS {table}").format(**identifiers))
+    cursor.execute(sql.SQL("""
+        CREATE TABLE {table} (
+            cell_id bigint PRIMARY KEY,
+            i integer NOT NULL,
+            j integer NOT NULL,
+            population numeric,
+            required_schools integer,
+            available_schools integer,
+            schools_to_add integer,
+            geom geometry(Polygon, {srid})
+        )
+    """).format(srid=sql.Literal(srid), **identifiers))
+    cursor.execute("CREATE TEMP TABLE grid_cells (i integer, j integer, population numeric, required_schools integer, "
+                   "available_schools integer, schools_to_add integer) ON COMMIT DROP")
+    buffer = io.StringIO()
+    np.savetxt(buffer, cells, fmt=['%d', '%d', '%.1f', '%d', '%d', '%d'], delimiter='\t')
+    buffer.seek(0)
+    cursor.copy_expert("COPY grid_cells FROM STDIN", buffer)
+    cursor.execute(sql.SQL("""
+        INSERT INTO {table} (cell_id, i, j, population, required_schools, available_schools, schools_to_add, geom)
+        SELECT (i::bigint << 32) | (j::bigint & 4294967295), i, j, population, required_schools, available_schools,
+               schools_to_add, {polygon}
+        FROM grid_cells
+    """).format(polygon=cell_polygon(shape), **identifiers), {'size': size, 'srid': srid})
+    cursor.execute(sql.SQL("CREATE INDEX ON {table} USING GIST (geom)").format(**identifiers))
+    cursor.execute(sql.SQL("ANALYZE {table}").format(**identifiers))
@@ -0,0 +1,122 @@
+import json
+
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
+RUNS_TABLE = 'additional_schools_runs'
+HISTORY_TABLE = 'additional_schools_history'
+
+
+def ensure_history_tables(cursor):
+    """Create the run register and the run-partitioned history table."""
+    cursor.execute(sql.SQL("""
+        CREATE TABLE IF NOT EXISTS {runs} (
+            run_id serial PRIMARY KEY,
+            created_at timestamptz NOT NULL DEFAULT now(),
+            parameters jsonb NOT NULL
+        )
+    """).format(runs=sql.Identifier(RUNS_TABLE)))
+    cursor.execute(sql.SQL("""
+        CREATE TABLE IF NOT EXISTS {history} (
+            run_id integer NOT NULL,
+            admin_level text NOT NULL,
+            area_name text NOT NULL,
+            required_schools integer,
+            available_schools integer,
+            schools_to_add integer,
+            parent_path text NOT NULL DEFAULT '',
+            PRIMARY KEY (run_id, admin_level, parent_path, area_name)
+        ) PARTITION BY LIST (run_id)
+    """).format(history=sql.Identifier(HISTORY_TABLE)))
+
+
+def partition_name(run_id):
+    """Return the name of the history partition holding ``run_id``."""
+    return f"{HISTORY_TABLE}_{run_id}"
+
+
+def record_run(cursor, parameters, results):
+    """
+    Store the result rows of a run in its own history partition.
+
+    ``parameters`` is a JSON-serialisable dict describing the run and
+    ``results`` the rows returned by the engine. Rows carry no geometry,
+    which stays in the results table. Returns the new run id.
+    """
+    ensure_history_tables(cursor)
+    cursor.execute(sql.SQL("INSERT INTO {runs} (parameters) VALUES (%s) RETURNING run_id").format(
+        runs=sql.Identifier(RUNS_TABLE)
+    ), [json.dumps(parameters)])
+    run_id = cursor.fetchone()[0]
+    cursor.execute(sql.SQL("CREATE TABLE {partition} PARTITION OF {history} FOR VALUES IN ({run_id})").format(
+        partition=sql.Identifier(partition_name(run_id)),
+        history=sql.Identifier(HISTORY_TABLE),
+        run_id=sql.Literal(run_id),
+    ))
+    execute_values(cursor, sql.SQL("""
+        INSERT INTO {partition} (run_id, admin_level, area_name, required_schools, available_schools, schools_to_add,
+                                 parent_path)
+        VALUES %s
+    """).format(partition=sql.Identifier(partition_name(run_id))).as_string(cursor.connection),
+        [[run_id] + list(row[:6]) for row in results], page_size=1000)
+    return run_id
+
+
+def list_runs(cursor):
+    """Return (run id, creation time, parameters) of every recorded run, newest first."""
+    ensure_history_tables(cursor)
+    cursor.execute(sql.SQL("SELECT run_id, created_at, parameters FROM {runs} ORDER BY run_id DESC").format(
+        runs=sql.Identifier(RUNS_TABLE)
+    ))
+    return cursor.fetchall()
+
+
+def diff_runs(cursor, old_run, new_run):
+    """
+    Compare two runs on the server and return the areas whose figures changed.
+
+    Each row is (admin level, area name, old required, new required,
+    old available, new available, old to add, new to add, parent path); an
+    area missing from one of the runs has None for that run's figures.
+    """
+    cursor.execute(sql.SQL("""
+        SELECT admin_level, area_name,
+               o.required_schools, n.required_schools,
+               o.available_schools, n.available_schools,
+               o.schools_to_add, n.schools_to_add,
+               parent_path
+        FROM (SELECT * FROM {history} WHERE run_id = %(old_run)s) o
+        FULL OUTER JOIN (SELECT * FROM {history} WHERE run_id = %(new_run)s) n USING (admin_level, parent_path, area_name)
+        WHERE (o.required_schools, o.available_schools, o.schools_to_add)
+              IS DISTINCT FROM (n.required_schools, n.available_schools, n.schools_to_add)
+        ORDER BY admin_level, area_name, parent_path
+    """).format(history=sql.Identifier(HISTORY_TABLE)), {'old_run': old_run, 'new_run': new_run})
+    return cursor.fetchall()
+
+
+def prune_runs(cursor, keep_last=None, older_than_days=None):
+    """
+    Drop the runs outside the retention policy and return their ids.
+
+    A run is dropped when it is not among the ``keep_last`` newest runs or is
+    older than ``older_than_days``. Dropping a partition is a catalog change,
+    so pruning does not rewrite the history of the remaining runs.
+    """
+    conditions = []
+    if keep_last:
+        conditions.append(sql.SQL("run_id NOT IN (SELECT run_id FROM {runs} ORDER BY run_id DESC LIMIT %(keep_last)s)").format(
+            runs=sql.Identifier(RUNS_TABLE)
+        ))
+    if older_than_days:
+        conditions.append(sql.SQL("created_at < now() - make_interval(days => %(older_than_days)s)"))
+    if not conditions:
+        return []
+    ensure_history_tables(cursor)
+    cursor.execute(sql.SQL("SELECT run_id FROM {runs} WHERE {conditions}").format(
+        runs=sql.Identifier(RUNS_TABLE), conditions=sql.SQL(' OR ').join(conditions)
+    ), {'keep_last': keep_last, 'older_than_days': older_than_days})
+    run_ids = [row[0] for row in cursor.fetchall()]
+    for run_id in run_ids:
+        cursor.execute(sql.SQL("DROP TABLE IF EXISTS {partition}").format(partition=sql.Identifier(partition_name(run_id))))
+    cursor.execute(sql.SQL("DELETE FROM {runs} WHERE run_id = ANY(%s)").format(runs=sql.Identifier(RUNS_TABLE)), [run_ids])
+    return run_ids
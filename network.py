@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+
+import numpy as np
+
+from .geopackage import geometry_column, read_geometry
+from .placement import fetch_demand, nearest_points
+from .roadgraph import DEFAULT_SPEED, RoadGraph, build_graph, distances, shortest_times
+
+DEFAULT_THRESHOLD = 30
+CACHE_DIRECTORY = os.path.join(tempfile.gettempdir(), 'additional_schools_graphs')
+
+
+def road_srid(connection, srs_id):
+    """Return the EPSG code and whether coordinates are longitude/latitude for a GeoPackage SRS id."""
+    row = connection.execute(
+        "SELECT organization, organization_coordsys_id, definition FROM gpkg_spatial_ref_sys WHERE srs_id = ?", [srs_id]
+    ).fetchone()
+    if row is None:
+        return srs_id, srs_id == 4326
+    organization, code, definition = row
+    srid = code if (organization or '').upper() == 'EPSG' else srs_id
+    return srid, (definition or '').lstrip().upper().startswith(('GEOGCS', 'GEOGCRS'))
+
+
+def read_roads(path, layer):
+    """Return the lines of a road layer of a GeoPackage with their EPSG code and whether they are longitude/latitude."""
+    connection = sqlite3.connect(path)
+    try:
+        column, srs_id = geometry_column(connection, layer)
+        lines = []
+        for blob, in connection.execute(f'SELECT "{column}" FROM "{layer}" WHERE "{column}" IS NOT NULL'):
+            lines.extend(read_geometry(blob))
+        return (lines, *road_srid(connection, srs_id))
+    finally:
+        connection.close()
+
+
+def cache_path(path, layer, cache_directory=CACHE_DIRECTORY):
+    """Return where the graph of ``layer`` of the GeoPackage at ``path`` is cached; editing the file changes the path."""
+    status = os.stat(path)
+    # Named by the layer and then by its version, so the graphs of one layer share a prefix
+    source = hashlib.md5(json.dumps([os.path.abspath(path), layer]).encode()).hexdigest()
+    key = hashlib.md5(json.dumps([status.st_mtime_ns, status.st_size]).encode()).hexdigest()
+    return os.path.join(cache_directory, f"{source}_{key}.npz")
+
+
+def load_graph(path, layer, cache_directory=CACHE_DIRECTORY):
+    """
+    Return the graph of a GeoPackage road layer, building and caching it on the first use.
+
+    Caching a new graph removes those of earlier versions of the same layer.
+    """
+    cached = cache_path(path, layer, cache_directory)
+    if os.path.exists(cached):
+        return RoadGraph.load(cached)
+    graph = build_graph(*read_roads(path, layer))
+    os.makedirs(cache_directory, exist_ok=True)
+    # Write next to the cache file and rename, so a crash never leaves a truncated graph behind
+    partial = cached[:-len('.npz')] + f'.{os.getpid()}.npz'
+    graph.save(partial)
+    os.replace(partial, cached)
+    # Earlier versions of the layer are never read again; partial graphs of other runs are theirs to rename
+    name = os.path.basename(cached)
+    source = name.split('_')[0]
+    for other in os.listdir(cache_directory):
+        if other.startswith(f"{source}_") and other != name and other.count('.') == 1:
+            try:
+                os.remove(os.path.join(cache_directory, other))
+            except OSError:
+                pass
+    return graph
+
+
+def travel_times(graph, schools, points, speed=DEFAULT_SPEED, limit=np.inf):
+    """
+    Return the travel time in seconds from the nearest school to every point.
+
+    Schools and points join the network at their nearest node and cover the
+    distance to it in a straight line at the same speed. Points that cannot
+    reach a school within ``limit`` seconds get infinity.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    schools = np.asarray(schools, dtype=float).reshape(-1, 2)
+    if not len(graph.nodes) or not len(schools):
+        return np.full(len(points), np.inf)
+    metres_per_second = speed / 3.6
+    school_nodes, _ = nearest_points(graph.nodes, schools)
+    school_offsets = distances(schools, graph.nodes[school_nodes], graph.geographic) / metres_per_second
+    times = shortest_times(graph, school_nodes, school_offsets, speed, limit)
+    point_nodes, _ = nearest_points(graph.nodes, points)
+    point_times = times[point_nodes] + distances(points, graph.nodes[point_nodes], graph.geographic) / metres_per_second
+    point_times[point_times > limit] = np.inf
+    return point_times
+
+
+def fetch_demand_points(cursor, city_layer, population_field, area_field, metric_srid, srid, cell_size,
+                        parent_fields=()):
+    """
+    Spread the population of every area over a square grid clipped to the area with :func:`placement.fetch_demand`.
+
+    Cells are laid out in ``metric_srid`` and their points returned in
+    ``srid``, the system of the road network. Returns the (level_1 ..
+    level_n, area key) tuple of every point, which tells apart areas of the
+    same name like the counts of :func:`engine.area_counts_query`, the (n, 2)
+    point array and the population of each point; areas without a
+    population have none.
+    """
+    demand = fetch_demand(cursor, city_layer, population_field, area_field, None, metric_srid, cell_size,
+                          parent_fields=list(parent_fields), point_srid=srid)
+    if not demand:
+        return [], np.empty((0, 2)), np.empty(0)
+    area_keys = [key for key, (points, _) in demand.items() for _ in range(len(points))]
+    points = np.concatenate([points for points, _ in demand.values()])
+    population = np.nan_to_num(np.concatenate([weights for _, weights in demand.values()]), nan=0.0)
+    return area_keys, points, population
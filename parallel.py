@@ -0,0 +1,106 @@
+import math
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+from psycopg2 import sql
+
+from .engine import (
+    DEFAULT_AREA_FIELD, DEFAULT_RESULTS_TABLE, ensure_results_table, grouped_counts_query, load_counts,
+    merged_counts_query, rollup_query, sort_results, upsert_query
+)
+
+
+def export_snapshot(connection):
+    """Start a REPEATABLE READ transaction on ``connection`` and export its snapshot."""
+    connection.set_session(isolation_level='REPEATABLE READ', readonly=True)
+    cursor = connection.cursor()
+    cursor.execute("SELECT pg_export_snapshot()")
+    snapshot = cursor.fetchone()[0]
+    cursor.close()
+    return snapshot
+
+
+def count_chunk(pool, snapshot, city_layer, schools_layer, population_field, area_field, parent_fields, area_keys,
+                pieces_table=None):
+    """
+    Count the schools of ``area_keys`` on a pooled connection that sees the exported snapshot.
+
+    Pooled connections are REPEATABLE READ, so the snapshot can be imported as
+    the first statement of the transaction psycopg2 opens. Rows are summed per
+    area key so duplicated keys in the city layer are merged here already.
+    """
+    connection = pool.get()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SET TRANSACTION SNAPSHOT %s", [snapshot])
+        cursor.execute(
+            grouped_counts_query(city_layer, schools_layer, population_field, area_field, parent_fields,
+                                 area_subset=True, pieces_table=pieces_table),
+            {'area_keys': list(area_keys)}
+        )
+        rows = cursor.fetchall()
+        connection.rollback()
+        cursor.close()
+        return rows
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        pool.put(connection)
+
+
+def calculate_deficits_in_parallel(cursor, connect, city_layer, schools_layer, population_field, people_per_school,
+                                   area_field=DEFAULT_AREA_FIELD, parent_fields=(), results_table=DEFAULT_RESULTS_TABLE,
+                                   workers=4, pieces_table=None):
+    """
+    Calculate deficits like :func:`engine.calculate_deficits`, counting on ``workers`` connections at once.
+
+    ``connect`` opens a new database connection. A coordinator connection
+    exports its snapshot and every worker imports it, so all chunks are
+    counted against the same data even while the layers are being edited.
+    The worker counts are merged into a temporary table on ``cursor``, which
+    then writes every admin level in one statement. The caller owns the
+    transaction of ``cursor``.
+    """
+    parent_fields = [field for field in parent_fields if field]
+    coordinator = connect()
+    connections = []
+    try:
+        snapshot = export_snapshot(coordinator)
+        coordinator_cursor = coordinator.cursor()
+        coordinator_cursor.execute(sql.SQL("SELECT DISTINCT {area_field}::text FROM {city_layer} WHERE {area_field} IS NOT NULL").format(
+            area_field=sql.Identifier(area_field), city_layer=sql.Identifier(city_layer)
+        ))
+        area_keys = sorted(row[0] for row in coordinator_cursor.fetchall())
+
+        pool = queue.Queue()
+        for _ in range(workers):
+            connection = connect()
+            connection.set_session(isolation_level='REPEATABLE READ', readonly=True)
+            connections.append(connection)
+            pool.put(connection)
+
+        # A few chunks per worker keeps every connection busy when areas differ in cost
+        chunk_size = max(1, math.ceil(len(area_keys) / (workers * 4)))
+        chunks = [area_keys[start:start + chunk_size] for start in range(0, len(area_keys), chunk_size)]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(count_chunk, pool, snapshot, city_layer, schools_layer, population_field,
+                                area_field, parent_fields, chunk, pieces_table)
+                for chunk in chunks
+            ]
+            rows = [row for future in futures for row in future.result()]
+    finally:
+        coordinator.close()
+        for connection in connections:
+            connection.close()
+
+    load_counts(cursor, rows, parent_fields)
+
+    ensure_results_table(cursor, results_table, area_field)
+    source = merged_counts_query(city_layer, area_field, parent_fields)
+    cursor.execute(
+        upsert_query(rollup_query(source, area_field, parent_fields), results_table),
+        {'people_per_school': people_per_school},
+    )
+    return sort_results([list(row) for row in cursor.fetchall()], area_field, parent_fields)
@@ -0,0 +1,290 @@
+import heapq
+
+import numpy as np
+from psycopg2 import sql
+
+
+def pairs_within(centres, points, radius):
+    """
+    Find every (centre, point) pair closer than ``radius``.
+
+    Points are hashed into square cells of side ``radius``, so each centre
+    only has to be compared with the points of its own and the eight
+    neighbouring cells. Returns two index arrays of equal length.
+    """
+    centres = np.asarray(centres, dtype=float).reshape(-1, 2)
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    if not len(centres) or not len(points):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    origin = np.minimum(centres.min(axis=0), points.min(axis=0))
+    point_cells = np.floor((points - origin) / radius).astype(np.int64)
+    centre_cells = np.floor((centres - origin) / radius).astype(np.int64)
+    width = max(point_cells[:, 0].max(), centre_cells[:, 0].max()) + 3
+    point_keys = (point_cells[:, 1] + 1) * width + point_cells[:, 0] + 1
+    order = np.argsort(point_keys, kind='stable')
+    sorted_keys = point_keys[order]
+
+    centre_hits = []
+    point_hits = []
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            keys = (centre_cells[:, 1] + 1 + dy) * width + centre_cells[:, 0] + 1 + dx
+            starts = np.searchsorted(sorted_keys, keys, side='left')
+            counts = np.searchsorted(sorted_keys, keys, side='right') - starts
+            total = counts.sum()
+            if not total:
+                continue
+            centre_index = np.repeat(np.arange(len(centres)), counts)
+            offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            point_index = order[np.repeat(starts, counts) + offsets]
+            distance = np.hypot(*(points[point_index] - centres[centre_index]).T)
+            within = distance <= radius
+            centre_hits.append(centre_index[within])
+            point_hits.append(point_index[within])
+
+    if not centre_hits:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(centre_hits), np.concatenate(point_hits)
+
+
+def nearest_points(centres, points):
+    """
+    Find the nearest centre of every point.
+
+    Uses a KD-tree when scipy is installed. Otherwise the pairs closer than a
+    search radius are found with :func:`pairs_within` and the radius is
+    doubled for the points that have no centre within it yet; a point with
+    any centre within the radius has its nearest centre among them, so the
+    result is exact either way. Returns the index of the nearest centre of
+    every point, -1 without centres, and the distance to it.
+    """
+    centres = np.asarray(centres, dtype=float).reshape(-1, 2)
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    index = np.full(len(points), -1, dtype=np.int64)
+    distance = np.full(len(points), np.inf)
+    if not len(centres) or not len(points):
+        return index, distance
+
+    try:
+        from scipy.spatial import cKDTree
+    except ImportError:
+        pass
+    else:
+        distance, index = cKDTree(centres).query(points)
+        return index.astype(np.int64), distance
+
+    # Start from the spacing centres would have if spread evenly over the extent
+    extent = np.ptp(np.vstack([centres, points]), axis=0).max()
+    radius = max(extent / np.sqrt(len(centres)), 1e-6)
+    pending = np.arange(len(points))
+    while len(pending):
+        centre_index, point_index = pairs_within(centres, points[pending], radius)
+        if len(point_index):
+            gaps = np.hypot(*(points[pending[point_index]] - centres[centre_index]).T)
+            order = np.lexsort((gaps, point_index))
+            first = order[np.concatenate([[True], point_index[order][1:] != point_index[order][:-1]])]
+            index[pending[point_index[first]]] = centre_index[first]
+            distance[pending[point_index[first]]] = gaps[first]
+            found = np.zeros(len(pending), dtype=bool)
+            found[point_index[first]] = True
+            pending = pending[~found]
+        radius *= 2
+    return index, distance
+
+
+def coverage_matrix(candidates, demand, radius):
+    """Return the demand points covered by each candidate in CSR form (indptr, indices)."""
+    candidate_index, demand_index = pairs_within(candidates, demand, radius)
+    order = np.argsort(candidate_index, kind='stable')
+    counts = np.bincount(candidate_index, minlength=len(candidates))
+    indptr = np.concatenate([[0], np.cumsum(counts)])
+    return indptr, demand_index[order]
+
+
+def greedy_max_coverage(weights, indptr, indices, count, covered=None):
+    """
+    Pick ``count`` candidates that together cover the most demand weight.
+
+    Uses lazy greedy selection: a candidate's gain can only shrink as more
+    demand gets covered, so stale gains in the heap are upper bounds and only
+    the candidate on top needs re-evaluating. Once no candidate adds any
+    uncovered demand, coverage starts a new round so the remaining schools
+    still go where most people live. Demand of areas without a population
+    reads as NaN and carries no weight. Returns a list of (candidate, gain).
+    """
+    weights = np.nan_to_num(np.asarray(weights, dtype=float), nan=0.0)
+    covered = np.zeros(len(weights), dtype=bool) if covered is None else np.array(covered, dtype=bool)
+    candidates = len(indptr) - 1
+    owner = np.repeat(np.arange(candidates), np.diff(indptr))
+
+    def initial_heap():
+        gains = np.bincount(owner, weights=weights[indices] * ~covered[indices], minlength=candidates)
+        heap = [(-gain, candidate) for candidate, gain in enumerate(gains) if candidate not in chosen]
+        heapq.heapify(heap)
+        return heap
+
+    chosen = {}
+    selected = []
+    heap = initial_heap()
+    while heap and len(selected) < count:
+        _, candidate = heapq.heappop(heap)
+        covers = indices[indptr[candidate]:indptr[candidate + 1]]
+        gain = weights[covers][~covered[covers]].sum()
+        if heap and gain < -heap[0][0]:
+            heapq.heappush(heap, (-gain, candidate))
+            continue
+        if gain <= 0 and covered.any():
+            covered[:] = False
+            heap = initial_heap()
+            continue
+        covered[covers] = True
+        chosen[candidate] = gain
+        selected.append((candidate, gain))
+    return selected
+
+
+def metric_srid(cursor, city_layer):
+    """Return the UTM zone SRID that covers the centre of the city layer."""
+    cursor.execute(sql.SQL("""
+        SELECT CASE WHEN ST_Y(c) >= 0 THEN 32600 ELSE 32700 END + floor((ST_X(c) + 180) / 6)::integer + 1
+        FROM (
+            SELECT ST_Centroid(ST_Transform(ST_SetSRID(ST_Extent(geom)::geometry, Find_SRID('public', {city_name}, 'geom')), 4326)) AS c
+            FROM {city_layer}
+        ) extent
+    """).format(city_layer=sql.Identifier(city_layer), city_name=sql.Literal(city_layer)))
+    return cursor.fetchone()[0]
+
+
+def fetch_demand(cursor, city_layer, population_field, area_field, area_keys, srid, cell_size, parent_fields=None,
+                 point_srid=None):
+    """
+    Spread the population of each area over a square grid clipped to the area.
+
+    Each clipped cell becomes one demand point carrying the share of the
+    area population proportional to its surface. ``area_keys`` None takes
+    every area. Cells are laid out in ``srid`` and their points returned in
+    ``point_srid``, by default the same. Returns a dict of area key -> (xy
+    array, weight array); with ``parent_fields`` the keys are (level_1 ..
+    level_n, area key) tuples, which tell apart areas of the same name like
+    :func:`engine.area_counts_query`.
+    """
+    levels = len(parent_fields) if parent_fields is not None else 0
+    cursor.execute(sql.SQL("""
+        WITH area AS (
+            SELECT {parent_columns}{area_field}::text AS area_key, {population_field}::numeric AS population,
+                   ST_Transform(geom, %(srid)s) AS geom
+            FROM {city_layer}
+            WHERE {area_filter} AND geom IS NOT NULL
+        )
+        SELECT {parent_keys}a.area_key, ST_X(p.pt), ST_Y(p.pt),
+               (a.population * ST_Area(i.piece) / NULLIF(ST_Area(a.geom), 0))::float8
+        FROM area a
+        CROSS JOIN LATERAL ST_SquareGrid(%(cell_size)s, a.geom) g
+        CROSS JOIN LATERAL (SELECT ST_Intersection(g.geom, a.geom) AS piece) i
+        CROSS JOIN LATERAL (SELECT ST_Transform(ST_PointOnSurface(i.piece), %(point_srid)s) AS pt) p
+        WHERE ST_Intersects(g.geom, a.geom) AND NOT ST_IsEmpty(i.piece)
+    """).format(
+        parent_columns=sql.SQL('').join(
+            sql.SQL("COALESCE({field}::text, '') AS {alias}, ").format(field=sql.Identifier(field), alias=sql.Identifier(f"level_{i}"))
+            for i, field in enumerate(parent_fields or (), start=1)
+        ),
+        parent_keys=sql.SQL('').join(sql.SQL("a.{level}, ").format(level=sql.Identifier(f"level_{i}")) for i in range(1, levels + 1)),
+        area_filter=sql.SQL("{area_field}::text = ANY(%(area_keys)s)" if area_keys is not None else "{area_field} IS NOT NULL").format(
+            area_field=sql.Identifier(area_field)
+        ),
+        area_field=sql.Identifier(area_field),
+        population_field=sql.Identifier(population_field),
+        city_layer=sql.Identifier(city_layer),
+    ), {'srid': srid, 'point_srid': point_srid or srid, 'area_keys': list(area_keys or ()), 'cell_size': cell_size})
+    return _group_points(cursor.fetchall(), weighted=True, key_length=levels + 1 if parent_fields is not None else None)
+
+
+def fetch_candidates(cursor, city_layer, candidates_layer, area_field, area_keys, srid):
+    """Return the supplied candidate points inside each area as a dict of area key -> xy array."""
+    cursor.execute(sql.SQL("""
+        SELECT c.{area_field}::text, ST_X(p.pt), ST_Y(p.pt)
+        FROM {city_layer} c
+        JOIN {candidates_layer} k ON ST_Within(k.geom, ST_Transform(c.geom, Find_SRID('public', {candidates_name}, 'geom')))
+        CROSS JOIN LATERAL (SELECT ST_Transform(k.geom, %(srid)s) AS pt) p
+        WHERE c.{area_field}::text = ANY(%(area_keys)s)
+    """).format(
+        area_field=sql.Identifier(area_field),
+        city_layer=sql.Identifier(city_layer),
+        candidates_layer=sql.Identifier(candidates_layer),
+        candidates_name=sql.Literal(candidates_layer),
+    ), {'srid': srid, 'area_keys': list(area_keys)})
+    return {key: xy for key, (xy, weights) in _group_points(cursor.fetchall(), weighted=False).items()}
+
+
+def fetch_schools(cursor, city_layer, schools_layer, area_field, area_keys, srid, radius):
+    """Return the existing schools that can serve any of the areas, as an xy array."""
+    cursor.execute(sql.SQL("""
+        SELECT ST_X(p.pt), ST_Y(p.pt)
+        FROM {schools_layer} s
+        CROSS JOIN LATERAL (SELECT ST_Transform(s.geom, %(srid)s) AS pt) p
+        WHERE s.geom && (
+            SELECT ST_Transform(ST_Expand(ST_Extent(ST_Transform(geom, %(srid)s))::geometry, %(radius)s),
+                                Find_SRID('public', {schools_name}, 'geom'))
+            FROM {city_layer}
+            WHERE {area_field}::text = ANY(%(area_keys)s)
+        )
+    """).format(
+        schools_layer=sql.Identifier(schools_layer),
+        schools_name=sql.Literal(schools_layer),
+        city_layer=sql.Identifier(city_layer),
+        area_field=sql.Identifier(area_field),
+    ), {'srid': srid, 'radius': radius, 'area_keys': list(area_keys)})
+    return np.array(cursor.fetchall(), dtype=float).reshape(-1, 2)
+
+
+def _group_points(rows, weighted, key_length=None):
+    """Group (area key, x, y[, weight]) rows into per-area numpy arrays, keyed by the first ``key_length`` columns as a tuple if given."""
+    grouped = {}
+    for row in rows:
+        if key_length is None:
+            grouped.setdefault(row[0], []).append(row[1:])
+        else:
+            grouped.setdefault(tuple(row[:key_length]), []).append(row[key_length:])
+    result = {}
+    for key, values in grouped.items():
+        values = np.array(values, dtype=float)
+        result[key] = (values[:, :2], values[:, 2] if weighted else None)
+    return result
+
+
+def propose_sites(cursor, city_layer, schools_layer, population_field, area_field, schools_to_add,
+                  radius, cell_size=None, candidates_layer=None):
+    """
+    Propose locations for the missing schools of every area.
+
+    ``schools_to_add`` maps area keys to the number of schools to place.
+    Demand comes from the area population spread over a grid, existing
+    schools cover demand up front, and candidates are either the grid points
+    or the points of ``candidates_layer``. Returns the SRID of the proposed
+    coordinates and a list of (area key, rank, x, y, covered population).
+    """
+    area_keys = [key for key, count in schools_to_add.items() if count > 0]
+    if not area_keys:
+        return None, []
+    cell_size = cell_size or radius / 2
+    srid = metric_srid(cursor, city_layer)
+    demand = fetch_demand(cursor, city_layer, population_field, area_field, area_keys, srid, cell_size)
+    candidates = fetch_candidates(cursor, city_layer, candidates_layer, area_field, area_keys, srid) if candidates_layer else None
+    schools = fetch_schools(cursor, city_layer, schools_layer, area_field, area_keys, srid, radius)
+
+    proposals = []
+    for key in area_keys:
+        if key not in demand:
+            continue
+        demand_xy, weights = demand[key]
+        candidate_xy = demand_xy if candidates is None else candidates.get(key, np.empty((0, 2)))
+        covered = np.zeros(len(demand_xy), dtype=bool)
+        school_index, demand_index = pairs_within(schools, demand_xy, radius)
+        covered[demand_index] = True
+        indptr, indices = coverage_matrix(candidate_xy, demand_xy, radius)
+        selected = greedy_max_coverage(weights, indptr, indices, schools_to_add[key], covered)
+        for rank, (candidate, gain) in enumerate(selected, start=1):
+            x, y = candidate_xy[candidate]
+            proposals.append((key, rank, float(x), float(y), float(gain)))
+    return srid, proposals
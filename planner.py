@@ -0,0 +1,82 @@
+import math
+
+PLAIN = 'plain'
+PARALLEL = 'parallel'
+CHUNKED = 'chunked'
+# Counted with one statement per area, only ever chosen by hand
+PER_AREA = 'per_area'
+
+# Thresholds of the layer sizes at which a strategy starts paying off
+PARALLEL_AREAS = 5000
+PARALLEL_SCHOOLS = 1000000
+RESUMABLE_AREAS = 50000
+COMPLEX_MEAN_VERTICES = 1000
+COMPLEX_MAX_VERTICES = 10000
+SUBDIVIDE_VERTICES = 256
+MAX_WORKERS = 8
+MAX_CHUNK_SIZE = 5000
+
+
+class Plan:
+    """The execution strategy chosen for a run, with the reasons it was chosen."""
+
+    def __init__(self, strategy, chunk_size=0, workers=1, max_vertices=0, reasons=None):
+        """
+        Constructor method.
+        :param strategy: One of PLAIN, PARALLEL, CHUNKED or PER_AREA
+        :param chunk_size: Areas per checkpointed chunk, 0 when not chunked
+        :param workers: Connections counting at once
+        :param max_vertices: Vertices per subdivided piece, 0 to count against whole areas
+        :param reasons: Human readable reasons for the choices
+        """
+        self.strategy = strategy
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.max_vertices = max_vertices
+        self.reasons = reasons or []
+
+
+def choose_plan(statistics, cpu_count=1):
+    """
+    Choose how to count schools from the statistics of :func:`diagnostics.table_statistics`.
+
+    Few areas are counted in one set query. Many areas or schools are
+    counted on several connections, and so many areas that a run takes long
+    enough to be interrupted are counted in resumable chunks. Without a
+    spatial index every query scans all schools, so the schools are never
+    counted on several connections and chunks are as large as allowed.
+    Complex area geometries are subdivided whatever the strategy.
+    """
+    city_rows = statistics['city_rows']
+    schools_rows = statistics['schools_rows']
+    reasons = []
+
+    max_vertices = 0
+    if statistics['mean_vertices'] > COMPLEX_MEAN_VERTICES or statistics['max_vertices'] > COMPLEX_MAX_VERTICES:
+        max_vertices = SUBDIVIDE_VERTICES
+        reasons.append(
+            f"areas have {statistics['mean_vertices']:.0f} vertices on average and up to {statistics['max_vertices']}, "
+            f"so they are subdivided to {SUBDIVIDE_VERTICES} vertices"
+        )
+    if not statistics['schools_indexed']:
+        reasons.append("the schools layer has no spatial index on geom, so every area scans all schools; "
+                       "create one with CREATE INDEX ... USING GIST (geom)")
+    if not city_rows:
+        reasons.append("the city layer has no row estimate; run ANALYZE on it for a better plan")
+
+    if city_rows >= RESUMABLE_AREAS:
+        chunk_size = min(MAX_CHUNK_SIZE, max(500, math.ceil(city_rows / 50)))
+        if not statistics['schools_indexed']:
+            chunk_size = MAX_CHUNK_SIZE
+        reasons.append(f"{city_rows} areas take long enough to be worth resuming, so they are counted in chunks of {chunk_size}")
+        return Plan(CHUNKED, chunk_size=chunk_size, max_vertices=max_vertices, reasons=reasons)
+    if city_rows >= PARALLEL_AREAS or schools_rows >= PARALLEL_SCHOOLS:
+        if not statistics['schools_indexed']:
+            reasons.append(f"{city_rows} areas and {schools_rows} schools would be counted on several connections, "
+                           "but each would scan all schools, so they are counted in one set query")
+            return Plan(PLAIN, max_vertices=max_vertices, reasons=reasons)
+        workers = max(2, min(MAX_WORKERS, cpu_count, math.ceil(city_rows / 2500)))
+        reasons.append(f"{city_rows} areas and {schools_rows} schools are counted on {workers} connections")
+        return Plan(PARALLEL, workers=workers, max_vertices=max_vertices, reasons=reasons)
+    reasons.append(f"{city_rows} areas and {schools_rows} schools are counted in one set query")
+    return Plan(PLAIN, max_vertices=max_vertices, reasons=reasons)
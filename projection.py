@@ -0,0 +1,138 @@
+import numpy as np
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
+from .engine import PATH_SEPARATOR, TOTAL_LEVEL, round_half_up
+
+PROJECTION_TABLE = 'projection_table'
+
+
+def project_population(population, rates, years):
+    """Return the (areas, years) matrix of ``population`` grown by the annual ``rates`` (fractions) over ``years``."""
+    population = np.asarray(population, dtype=float)
+    rates = np.asarray(rates, dtype=float)
+    years = np.asarray(years, dtype=float)
+    return population[:, None] * (1 + rates[:, None]) ** years[None, :]
+
+
+def area_growth_rates(keys, default_rate, area_field, parent_fields=(), area_rates=None, level_rates=None):
+    """
+    Return the annual growth rate of every area as a fraction.
+
+    ``keys`` are (level_1 .. level_n, area key) tuples. A rate from
+    ``area_rates`` (area key -> rate) wins, then the rate of the most
+    specific admin level in ``level_rates`` ((admin level, area name) ->
+    rate), then ``default_rate``.
+    """
+    levels = list(parent_fields) + [area_field]
+    area_rates = area_rates or {}
+    level_rates = level_rates or {}
+    rates = np.full(len(keys), default_rate, dtype=float)
+    for i, key in enumerate(keys):
+        if area_rates.get(key[-1]) is not None:
+            rates[i] = area_rates[key[-1]]
+            continue
+        for depth in range(len(levels), -1, -1):
+            level = (levels[depth - 1], key[depth - 1]) if depth else (TOTAL_LEVEL, TOTAL_LEVEL)
+            if level_rates.get(level) is not None:
+                rates[i] = level_rates[level]
+                break
+    return rates
+
+
+def projection_rows(keys, population, available, rates, base_year, horizon, people_per_school,
+                    area_field, parent_fields=()):
+    """
+    Project the deficits of every area and admin level for ``base_year`` to ``base_year + horizon``.
+
+    All areas and years are projected in one array operation from the
+    current population and school counts. Each admin level sums the
+    projected population and the schools to add of its areas, like
+    :func:`engine.rollup_query`. Returns long-format (admin level, area name,
+    year, population, required, available, to add, parent path) rows.
+    """
+    levels = list(parent_fields) + [area_field]
+    available = np.asarray(available, dtype=float)
+    years = np.arange(horizon + 1)
+    projected = project_population(population, rates, years)
+    to_add = np.maximum(0, round_half_up(projected / people_per_school) - available[:, None])
+
+    columns = [[] for _ in range(8)]
+    for depth in range(len(levels) + 1):
+        labels = ['\x1f'.join(key[:depth]) for key in keys]
+        groups, first, inverse = np.unique(labels, return_index=True, return_inverse=True)
+        group_population = np.zeros((len(groups), len(years)))
+        group_to_add = np.zeros((len(groups), len(years)))
+        np.add.at(group_population, inverse, projected)
+        np.add.at(group_to_add, inverse, to_add)
+        group_available = np.bincount(inverse, weights=available, minlength=len(groups))
+
+        names = [keys[index][depth - 1] if depth else TOTAL_LEVEL for index in first]
+        columns[0].append(np.full(group_population.size, levels[depth - 1] if depth else TOTAL_LEVEL, dtype=object))
+        columns[1].append(np.repeat(np.array(names, dtype=object), len(years)))
+        columns[2].append(np.tile(base_year + years, len(groups)))
+        columns[3].append(round_half_up(group_population).ravel())
+        columns[4].append(round_half_up(group_population / people_per_school).ravel())
+        columns[5].append(np.repeat(group_available, len(years)))
+        columns[6].append(group_to_add.ravel())
+        paths = [PATH_SEPARATOR.join(keys[index][:depth - 1]) if depth else '' for index in first]
+        columns[7].append(np.repeat(np.array(paths, dtype=object), len(years)))
+
+    level, name, year, population, required, available, to_add, path = (np.concatenate(column) for column in columns)
+    return list(zip(
+        level.tolist(), name.tolist(), year.tolist(), population.tolist(),
+        required.astype(int).tolist(), available.astype(int).tolist(), to_add.astype(int).tolist(), path.tolist()
+    ))
+
+
+def fetch_area_rates(cursor, city_layer, population_field, area_field, rate_field):
+    """Return the population-weighted annual growth rate of every area from a percent-per-year field."""
+    cursor.execute(sql.SQL("""
+        SELECT {area_field}::text,
+               SUM({population_field}::numeric * {rate_field}::numeric) / NULLIF(SUM({population_field}::numeric), 0) / 100
+        FROM {city_layer}
+        WHERE {area_field} IS NOT NULL AND {rate_field} IS NOT NULL
+        GROUP BY 1
+    """).format(
+        area_field=sql.Identifier(area_field),
+        population_field=sql.Identifier(population_field),
+        rate_field=sql.Identifier(rate_field),
+        city_layer=sql.Identifier(city_layer),
+    ))
+    return {area_key: None if rate is None else float(rate) for area_key, rate in cursor.fetchall()}
+
+
+def fetch_level_rates(cursor, rates_table):
+    """Return the annual growth rates of a table of (admin_level, area_name, growth_rate in percent per year)."""
+    cursor.execute(sql.SQL("SELECT admin_level::text, area_name::text, growth_rate::numeric / 100 FROM {rates_table}").format(
+        rates_table=sql.Identifier(rates_table)
+    ))
+    return {(level, name): None if rate is None else float(rate) for level, name, rate in cursor.fetchall()}
+
+
+def write_projection(cursor, rows, projection_table=PROJECTION_TABLE):
+    """Store long-format projection rows, replacing earlier projections of the same areas and years."""
+    identifiers = {'table': sql.Identifier(projection_table)}
+    cursor.execute(sql.SQL("""
+        CREATE TABLE IF NOT EXISTS {table} (
+            admin_level text NOT NULL,
+            area_name text NOT NULL,
+            year integer NOT NULL,
+            population numeric,
+            required_schools integer,
+            available_schools integer,
+            schools_to_add integer,
+            parent_path text NOT NULL DEFAULT '',
+            PRIMARY KEY (admin_level, parent_path, area_name, year)
+        )
+    """).format(**identifiers))
+    execute_values(cursor, sql.SQL("""
+        INSERT INTO {table} (admin_level, area_name, year, population, required_schools, available_schools, schools_to_add,
+                             parent_path)
+        VALUES %s
+        ON CONFLICT (admin_level, parent_path, area_name, year) DO UPDATE SET
+        population = EXCLUDED.population,
+        required_schools = EXCLUDED.required_schools,
+        available_schools = EXCLUDED.available_schools,
+        schools_to_add = EXCLUDED.schools_to_add
+    """).format(**identifiers).as_string(cursor.connection), rows, page_size=1000)
@@ -0,0 +1,166 @@
+import heapq
+
+import numpy as np
+
+DEFAULT_SPEED = 5
+EARTH_RADIUS = 6371008.8
+# Vertices closer than this many metres, or degrees for geographic layers, become one node
+SNAP_DECIMALS = {False: 2, True: 7}
+
+
+class RoadGraph:
+    """A road network in compressed sparse row form, with edge lengths in metres."""
+
+    def __init__(self, nodes, indptr, indices, lengths, srid, geographic):
+        """
+        Constructor method.
+        :param nodes: (n, 2) array of node coordinates in ``srid``
+        :param indptr: Offsets of the edges leaving each node in ``indices`` and ``lengths``
+        :param indices: Node at the end of every edge
+        :param lengths: Length of every edge in metres
+        :param srid: EPSG code of the node coordinates
+        :param geographic: Whether the coordinates are longitude and latitude
+        """
+        self.nodes = nodes
+        self.indptr = indptr
+        self.indices = indices
+        self.lengths = lengths
+        self.srid = srid
+        self.geographic = geographic
+
+    def save(self, path):
+        """Write the graph to an uncompressed ``.npz`` file, which loads without parsing."""
+        np.savez(path, nodes=self.nodes, indptr=self.indptr, indices=self.indices, lengths=self.lengths,
+                 srid=self.srid, geographic=self.geographic)
+
+    @classmethod
+    def load(cls, path):
+        """Read a graph written by :meth:`save`."""
+        with np.load(path) as data:
+            return cls(data['nodes'], data['indptr'], data['indices'], data['lengths'], int(data['srid']),
+                       bool(data['geographic']))
+
+
+def distances(start, end, geographic):
+    """Return the distances in metres between rows of ``start`` and ``end``, great circle ones for longitude/latitude."""
+    start = np.asarray(start, dtype=float).reshape(-1, 2)
+    end = np.asarray(end, dtype=float).reshape(-1, 2)
+    if not geographic:
+        return np.hypot(*(end - start).T)
+    lon1, lat1, lon2, lat2 = np.radians([start[:, 0], start[:, 1], end[:, 0], end[:, 1]])
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1)))
+
+
+def build_graph(lines, srid, geographic):
+    """
+    Build the undirected :class:`RoadGraph` of ``lines``, a list of (n, 2) vertex arrays.
+
+    Every vertex is a node and vertices at the same rounded coordinates are
+    merged, so roads sharing a vertex are connected. Each segment becomes
+    an edge in both directions; of parallel edges only the shortest is kept.
+    """
+    lines = [line for line in lines if len(line) > 1]
+    if not lines:
+        empty = np.zeros(0, dtype=np.int32)
+        return RoadGraph(np.zeros((0, 2)), np.zeros(1, dtype=np.int64), empty, np.zeros(0, dtype=np.float32), srid,
+                         geographic)
+    vertices = np.concatenate(lines)
+    nodes, vertex_nodes = np.unique(np.round(vertices, SNAP_DECIMALS[geographic]), axis=0, return_inverse=True)
+    vertex_nodes = vertex_nodes.ravel()
+
+    # A segment joins each vertex to the next one, except across the end of a line
+    ends = np.cumsum([len(line) for line in lines])
+    starts = np.ones(len(vertices) - 1, dtype=bool)
+    starts[ends[:-1] - 1] = False
+    first = vertex_nodes[:-1][starts]
+    second = vertex_nodes[1:][starts]
+    lengths = distances(vertices[:-1][starts], vertices[1:][starts], geographic)
+    keep = first != second
+    source = np.concatenate([first[keep], second[keep]])
+    target = np.concatenate([second[keep], first[keep]])
+    lengths = np.concatenate([lengths[keep], lengths[keep]])
+
+    order = np.lexsort((lengths, target, source))
+    source, target, lengths = source[order], target[order], lengths[order]
+    first = np.concatenate([[True], (source[1:] != source[:-1]) | (target[1:] != target[:-1])])
+    source, target, lengths = source[first], target[first], lengths[first]
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(source, minlength=len(nodes)))]).astype(np.int64)
+    return RoadGraph(nodes, indptr, target.astype(np.int32), lengths.astype(np.float32), srid, geographic)
+
+
+def shortest_times(graph, sources, offsets, speed, limit=np.inf):
+    """
+    Return the travel time in seconds from the nearest of ``sources`` to every node at ``speed`` km/h.
+
+    All sources are searched at once, each starting after its ``offset``
+    seconds. Nodes further than ``limit`` seconds are left at infinity. Uses
+    scipy's Dijkstra when it is installed, with a virtual node joined to
+    every source, and a binary heap over the CSR arrays otherwise.
+    """
+    metres_per_second = speed / 3.6
+    node_count = len(graph.nodes)
+    sources = np.asarray(sources, dtype=np.int64)
+    offsets = np.asarray(offsets, dtype=float)
+    try:
+        from scipy.sparse import csr_matrix
+        from scipy.sparse.csgraph import dijkstra
+    except ImportError:
+        return _shortest_times(graph.indptr, graph.indices, graph.lengths / metres_per_second, sources, offsets,
+                               node_count, limit)
+
+    # The virtual node gets one edge per source node, weighted by the smallest offset at it
+    nodes, inverse = np.unique(sources, return_inverse=True)
+    node_offsets = np.full(len(nodes), np.inf)
+    np.minimum.at(node_offsets, inverse.ravel(), offsets)
+    virtual = node_count
+    indptr = np.concatenate([graph.indptr, [graph.indptr[-1] + len(nodes)]])
+    indices = np.concatenate([graph.indices, nodes])
+    # Zero weights would be dropped from the sparse matrix, so every weight is at least a microsecond
+    weights = np.maximum(np.concatenate([graph.lengths / metres_per_second, node_offsets]), 1e-6)
+    matrix = csr_matrix((weights, indices, indptr), shape=(node_count + 1, node_count + 1))
+    times = dijkstra(matrix, directed=True, indices=virtual, limit=limit)
+    return times[:node_count]
+
+
+def _shortest_times(indptr, indices, weights, sources, offsets, node_count, limit):
+    """Run a multi-source Dijkstra over CSR arrays with a binary heap."""
+    times = np.full(node_count, np.inf)
+    best = times.tolist()
+    heap = []
+    for source, offset in zip(sources.tolist(), offsets.tolist()):
+        if offset < best[source] and offset <= limit:
+            best[source] = offset
+            heap.append((offset, source))
+    heapq.heapify(heap)
+    indptr = indptr.tolist()
+    indices = indices.tolist()
+    weights = weights.tolist()
+    done = [False] * node_count
+    while heap:
+        time, node = heapq.heappop(heap)
+        if done[node]:
+            continue
+        done[node] = True
+        for edge in range(indptr[node], indptr[node + 1]):
+            neighbour = indices[edge]
+            arrival = time + weights[edge]
+            if arrival < best[neighbour] and arrival <= limit:
+                best[neighbour] = arrival
+                heapq.heappush(heap, (arrival, neighbour))
+    times[:] = best
+    return times
+
+
+def unserved_population(area_keys, times, population, threshold):
+    """
+    Return a dict of area key -> population further than ``threshold`` seconds from a school.
+
+    Keys are whatever identifies the area of each point, such as the
+    (level_1 .. level_n, area key) tuples of :func:`network.fetch_demand_points`.
+    """
+    index = {}
+    inverse = [index.setdefault(key, len(index)) for key in area_keys]
+    beyond = np.bincount(np.asarray(inverse, dtype=int), weights=np.where(np.asarray(times) > threshold, population, 0),
+                         minlength=len(index))
+    return {key: float(value) for key, value in zip(index, beyond)}
@@ -0,0 +1,86 @@
+from PyQt5.QtWidgets import QDialog, QTableWidgetItem
+import psycopg2
+from .history import diff_runs, list_runs, prune_runs
+from .run_history_dialog_ui import Ui_runHistoryDialog
+
+DIFF_HEADERS = [
+    'Level', 'Area', 'Required (old)', 'Required (new)', 'Available (old)', 'Available (new)',
+    'To Add (old)', 'To Add (new)', 'Parent Areas'
+]
+
+
+class RunHistoryDialog(QDialog, Ui_runHistoryDialog):
+    def __init__(self, connect, parent=None):
+        """Initialize the QDialog and set up the UI."""
+        super().__init__(parent)
+        self.setupUi(self)
+        self.connect = connect
+
+        self.tableWidget_diff.setColumnCount(len(DIFF_HEADERS))
+        self.tableWidget_diff.setHorizontalHeaderLabels(DIFF_HEADERS)
+
+        self.populate_runs()
+
+        self.button_compare.clicked.connect(self.compare_runs)
+        self.button_prune.clicked.connect(self.prune_runs)
+
+    def populate_runs(self):
+        """Populate both run combo boxes with the recorded runs."""
+        try:
+            connection = self.connect()
+            cursor = connection.cursor()
+            runs = list_runs(cursor)
+            connection.commit()
+            cursor.close()
+            connection.close()
+
+            self.comboBox_oldRun.clear()
+            self.comboBox_newRun.clear()
+            for run_id, created_at, parameters in runs:
+                label = f"#{run_id} {created_at:%Y-%m-%d %H:%M} {parameters.get('city_layer', '')}"
+                self.comboBox_oldRun.addItem(label, run_id)
+                self.comboBox_newRun.addItem(label, run_id)
+            if len(runs) > 1:
+                self.comboBox_oldRun.setCurrentIndex(1)
+        except (Exception, psycopg2.DatabaseError) as error:
+            self.show_error(f"Error retrieving runs: {error}")
+
+    def compare_runs(self):
+        """Show the areas whose figures changed between the two selected runs."""
+        try:
+            connection = self.connect()
+            cursor = connection.cursor()
+            rows = diff_runs(cursor, self.comboBox_oldRun.currentData(), self.comboBox_newRun.currentData())
+            cursor.close()
+            connection.close()
+
+            self.tableWidget_diff.setRowCount(len(rows))
+            for row_index, row in enumerate(rows):
+                for column_index, value in enumerate(row):
+                    self.tableWidget_diff.setItem(row_index, column_index, QTableWidgetItem("" if value is None else str(value)))
+        except (Exception, psycopg2.DatabaseError) as error:
+            self.show_error(f"Error comparing runs: {error}")
+
+    def prune_runs(self):
+        """Drop every run except the newest ones."""
+        try:
+            connection = self.connect()
+            cursor = connection.cursor()
+            pruned = prune_runs(cursor, keep_last=self.spinBox_keepRuns.value())
+            connection.commit()
+            cursor.close()
+            connection.close()
+            self.populate_runs()
+            self.show_info(f"{len(pruned)} runs have been pruned.")
+        except (Exception, psycopg2.DatabaseError) as error:
+            self.show_error(f"Error pruning runs: {error}")
+
+    def show_error(self, message):
+        """Show error message to the user."""
+        from PyQt5.QtWidgets import QMessageBox
+        QMessageBox.critical(self, "Error", message)
+
+    def show_info(self, message):
+        """Show informational message to the user."""
+        from PyQt5.QtWidgets import QMessageBox
+        QMessageBox.information(self, "Information", message)
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+# Form implementation generated from reading ui file 'run_history_dialog_base.ui'
+#
+# Created by: PyQt5 UI code generator 5.15.10
+#
+# WARNING: Any manual changes made to this file will be lost when pyuic5 is
+# run again.  Do not edit this file unless you know what you are doing.
+
+
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+
+class Ui_runHistoryDialog(object):
+    def setupUi(self, runHistoryDialog):
+        runHistoryDialog.setObjectName("runHistoryDialog")
+        runHistoryDialog.resize(641, 410)
+        self.label_oldRun = QtWidgets.QLabel(runHistoryDialog)
+        self.label_oldRun.setGeometry(QtCore.QRect(10, 0, 300, 20))
+        self.label_oldRun.setObjectName("label_oldRun")
+        self.comboBox_oldRun = QtWidgets.QComboBox(runHistoryDialog)
+        self.comboBox_oldRun.setGeometry(QtCore.QRect(10, 20, 300, 25))
+        self.comboBox_oldRun.setObjectName("comboBox_oldRun")
+        self.label_newRun = QtWidgets.QLabel(runHistoryDialog)
+        self.label_newRun.setGeometry(QtCore.QRect(330, 0, 300, 20))
+        self.label_newRun.setObjectName("label_newRun")
+        self.comboBox_newRun = QtWidgets.QComboBox(runHistoryDialog)
+        self.comboBox_newRun.setGeometry(QtCore.QRect(330, 20, 300, 25))
+        self.comboBox_newRun.setObjectName("comboBox_newRun")
+        self.button_compare = QtWidgets.QPushButton(runHistoryDialog)
+        self.button_compare.setGeometry(QtCore.QRect(10, 55, 100, 30))
+        self.button_compare.setObjectName("button_compare")
+        self.tableWidget_diff = QtWidgets.QTableWidget(runHistoryDialog)
+        self.tableWidget_diff.setGeometry(QtCore.QRect(10, 95, 620, 250))
+        self.tableWidget_diff.setObjectName("tableWidget_diff")
+        self.label_keepRuns = QtWidgets.QLabel(runHistoryDialog)
+        self.label_keepRuns.setGeometry(QtCore.QRect(10, 350, 300, 20))
+        self.label_keepRuns.setObjectName("label_keepRuns")
+        self.spinBox_keepRuns = QtWidgets.QSpinBox(runHistoryDialog)
+        self.spinBox_keepRuns.setGeometry(QtCore.QRect(10, 370, 100, 25))
+        self.spinBox_keepRuns.setMinimum(1)
+        self.spinBox_keepRuns.setMaximum(10000)
+        self.spinBox_keepRuns.setProperty("value", 20)
+        self.spinBox_keepRuns.setObjectName("spinBox_keepRuns")
+        self.button_prune = QtWidgets.QPushButton(runHistoryDialog)
+        self.button_prune.setGeometry(QtCore.QRect(120, 368, 100, 30))
+        self.button_prune.setObjectName("button_prune")
+
+        self.retranslateUi(runHistoryDialog)
+        QtCore.QMetaObject.connectSlotsByName(runHistoryDialog)
+
+    def retranslateUi(self, runHistoryDialog):
+        _translate = QtCore.QCoreApplication.translate
+        runHistoryDialog.setWindowTitle(_translate("runHistoryDialog", "Run History"))
+        self.label_oldRun.setText(_translate("runHistoryDialog", "Older Run"))
+        self.label_newRun.setText(_translate("runHistoryDialog", "Newer Run"))
+        self.button_compare.setText(_translate("runHistoryDialog", "Compare Runs"))
+        self.label_keepRuns.setText(_translate("runHistoryDialog", "Keep Last Runs"))
+        self.button_prune.setText(_translate("runHistoryDialog", "Prune Runs"))
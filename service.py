@@ -0,0 +1,357 @@
+"""
+Answer deficit queries over HTTP for tools that cannot run QGIS.
+
+Run it from the plugin directory, outside QGIS::
+
+    python service.py --dsn "dbname=schools user=planner" --city-layer districts --schools-layer schools \
+        --population-field population --parent-fields adm1_en,adm2_en
+
+and ask for the deficits of an area at a ratio of people per school::
+
+    GET /deficits?level=adm1_en&area=Northern&ratio=3000
+    GET /metrics
+
+The schools are counted per area once and kept for ``--ttl`` seconds;
+every ratio is then rolled up from those counts without another query.
+Responses are cached in a bounded LRU cache. The sibling modules are
+imported relatively inside the plugin package and as top-level modules
+when the service runs as a script.
+"""
+import argparse
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+
+if __package__:
+    from .database import CONNECT_TIMEOUT, DEFAULT_DSN, DEFAULT_STATEMENT_TIMEOUT
+    from .engine import DEFAULT_AREA_FIELD, TOTAL_LEVEL, grouped_counts_query, sort_results
+    from .geopackage import rollup_counts
+else:
+    from database import CONNECT_TIMEOUT, DEFAULT_DSN, DEFAULT_STATEMENT_TIMEOUT
+    from engine import DEFAULT_AREA_FIELD, TOTAL_LEVEL, grouped_counts_query, sort_results
+    from geopackage import rollup_counts
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_CACHE_SIZE = 256
+DEFAULT_TTL = 300
+# Latencies kept per route for the percentiles reported by /metrics
+LATENCY_WINDOW = 1000
+ROUTES = ('/deficits', '/metrics', '/health')
+RESULT_FIELDS = ['admin_level', 'area_name', 'required_schools', 'available_schools', 'schools_to_add', 'parent_path']
+
+
+def area_deficits(rows, people_per_school, area_field=DEFAULT_AREA_FIELD, parent_fields=(), level=None, area=None):
+    """
+    Roll per-area counts up to the deficits of every admin level, or of ``area`` at ``level`` and the levels below it.
+
+    ``rows`` are (level_1 .. level_n, area key, population, available
+    schools) tuples. The deficits are those of the dialog's calculation.
+    Returns (admin level, area name, required, available, to add, parent
+    path) rows ordered by :func:`engine.sort_results`.
+    """
+    levels = list(parent_fields) + [area_field]
+    depth = 0
+    if level not in (None, TOTAL_LEVEL):
+        if level not in levels:
+            raise ValueError(f"Unknown admin level {level!r}, expected one of {', '.join(levels)}")
+        depth = levels.index(level) + 1
+        rows = [row for row in rows if row[depth - 1] == area]
+        if not rows:
+            raise LookupError(f"No area {area!r} at admin level {level}")
+    results = rollup_counts([(*row, []) for row in rows], people_per_school, area_field, parent_fields)
+    # Levels above the requested area would only hold its share, so they are left out
+    results = [
+        row[:6] for row in results
+        if (row[0] == TOTAL_LEVEL and not depth) or (row[0] != TOTAL_LEVEL and levels.index(row[0]) + 1 >= depth)
+    ]
+    return sort_results(results, area_field, parent_fields)
+
+
+class LRUCache:
+    """Thread-safe cache of at most ``maxsize`` entries, dropping the least recently used and those older than ``ttl``."""
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE, ttl=DEFAULT_TTL, clock=time.monotonic):
+        """
+        Constructor method.
+        :param maxsize: Number of entries kept
+        :param ttl: Seconds an entry stays valid, None to keep entries until they are evicted
+        :param clock: Function returning the current time in seconds
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the value cached for ``key``, or None."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and (self.ttl is None or self.clock() - entry[0] < self.ttl):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """Cache ``value`` for ``key``, evicting the least recently used entry when full."""
+        with self.lock:
+            self.entries[key] = (self.clock(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every entry."""
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        """Return the size, hits and misses of the cache."""
+        with self.lock:
+            return {'size': len(self.entries), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+class LatencyMetrics:
+    """Count the requests and errors of every route and keep their recent latencies."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        """
+        Constructor method.
+        :param window: Number of recent latencies kept per route
+        """
+        self.window = window
+        self.routes = {}
+        self.lock = threading.Lock()
+
+    def record(self, route, seconds, error=False):
+        """Record one request of ``route`` that took ``seconds``."""
+        with self.lock:
+            metrics = self.routes.setdefault(route, {
+                'requests': 0, 'errors': 0, 'total_seconds': 0.0, 'latencies': deque(maxlen=self.window)
+            })
+            metrics['requests'] += 1
+            metrics['errors'] += bool(error)
+            metrics['total_seconds'] += seconds
+            metrics['latencies'].append(seconds)
+
+    def snapshot(self):
+        """Return the request counts and the mean, 50th, 95th, 99th percentile and maximum latency in ms per route."""
+        with self.lock:
+            routes = {route: (dict(metrics), sorted(metrics['latencies'])) for route, metrics in self.routes.items()}
+        snapshot = {}
+        for route, (metrics, latencies) in routes.items():
+            def percentile(p):
+                return round(latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000, 3)
+            snapshot[route] = {
+                'requests': metrics['requests'],
+                'errors': metrics['errors'],
+                'mean_ms': round(metrics['total_seconds'] / metrics['requests'] * 1000, 3),
+                'p50_ms': percentile(50),
+                'p95_ms': percentile(95),
+                'p99_ms': percentile(99),
+                'max_ms': round(latencies[-1] * 1000, 3),
+            }
+        return snapshot
+
+
+class DeficitService:
+    """Calculate deficits from pooled read-only connections, caching the counts of the layers and the responses."""
+
+    def __init__(self, pool, city_layer, schools_layer, population_field, area_field=DEFAULT_AREA_FIELD,
+                 parent_fields=(), cache_size=DEFAULT_CACHE_SIZE, ttl=DEFAULT_TTL):
+        """
+        Constructor method.
+        :param pool: psycopg2 connection pool
+        :param city_layer: Default layer of the areas
+        :param schools_layer: Default layer of the schools
+        :param population_field: Default population field of the areas
+        :param area_field: Default field naming the areas
+        :param parent_fields: Default admin level fields above the areas
+        :param cache_size: Number of responses and of layer counts kept
+        :param ttl: Seconds after which counts and responses are read from the database again
+        """
+        self.pool = pool
+        # The pool raises instead of waiting when every connection is lent, so requests queue here
+        self.slots = threading.BoundedSemaphore(pool.maxconn)
+        self.defaults = {
+            'city_layer': city_layer,
+            'schools_layer': schools_layer,
+            'population_field': population_field,
+            'area_field': area_field,
+            'parent_fields': [field for field in parent_fields if field],
+        }
+        self.responses = LRUCache(cache_size, ttl)
+        self.counts_cache = LRUCache(cache_size, ttl)
+        self.metrics = LatencyMetrics()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection of the pool for one read-only transaction, discarding it when it was lost."""
+        with self.slots:
+            connection = self.pool.getconn()
+            lost = False
+            try:
+                connection.set_session(readonly=True)
+                yield connection
+            except psycopg2.OperationalError:
+                lost = True
+                raise
+            finally:
+                if not lost and not connection.closed:
+                    connection.rollback()
+                self.pool.putconn(connection, close=lost or bool(connection.closed))
+
+    def layer_inputs(self, params):
+        """Return the layers and fields of a request, falling back to the defaults of the service."""
+        inputs = dict(self.defaults)
+        for name in ('city_layer', 'schools_layer', 'population_field', 'area_field'):
+            if params.get(name):
+                inputs[name] = params[name]
+        if 'parent_fields' in params:
+            inputs['parent_fields'] = [field for field in params['parent_fields'].split(',') if field]
+        missing = [name for name in ('city_layer', 'schools_layer', 'population_field') if not inputs[name]]
+        if missing:
+            raise ValueError(f"Missing {', '.join(missing)}")
+        return inputs
+
+    def counts(self, inputs):
+        """Return the per-area counts of the layers in ``inputs``, counting them once per time-to-live."""
+        key = json.dumps(inputs, sort_keys=True)
+        rows = self.counts_cache.get(key)
+        if rows is None:
+            with self.connection() as connection:
+                cursor = connection.cursor()
+                cursor.execute(grouped_counts_query(
+                    inputs['city_layer'], inputs['schools_layer'], inputs['population_field'],
+                    inputs['area_field'], inputs['parent_fields']
+                ))
+                rows = [(*row[:-2], float(row[-2] or 0), int(row[-1])) for row in cursor.fetchall()]
+            self.counts_cache.put(key, rows)
+        return rows
+
+    def deficits(self, people_per_school, inputs, level=None, area=None):
+        """Return the deficits of :func:`area_deficits` from the cached counts, so a new ratio never queries the database."""
+        return area_deficits(self.counts(inputs), people_per_school, inputs['area_field'], inputs['parent_fields'],
+                             level, area)
+
+    def handle(self, path, query):
+        """Answer a GET request; return the HTTP status and the JSON body as bytes."""
+        params = {name: values[-1] for name, values in parse_qs(query).items()}
+        if path == '/health':
+            return 200, b'{"status": "ok"}'
+        if path == '/metrics':
+            return 200, json.dumps({'routes': self.metrics.snapshot(), 'cache': self.responses.stats(),
+                                    'counts_cache': self.counts_cache.stats()}).encode()
+        if path != '/deficits':
+            return 404, json.dumps({'error': f"Unknown path {path}"}).encode()
+        if params.get('level') not in (None, TOTAL_LEVEL) and not params.get('area'):
+            raise ValueError("area is required with level")
+
+        key = (path, tuple(sorted(params.items())))
+        body = self.responses.get(key)
+        if body is None:
+            try:
+                people_per_school = float(params.get('ratio', ''))
+            except ValueError:
+                raise ValueError("ratio must be the number of people per school")
+            if people_per_school <= 0:
+                raise ValueError("ratio must be positive")
+            inputs = self.layer_inputs(params)
+            results = self.deficits(people_per_school, inputs, params.get('level'), params.get('area'))
+            body = json.dumps({
+                'people_per_school': people_per_school,
+                'results': [dict(zip(RESULT_FIELDS, row)) for row in results],
+            }).encode()
+            self.responses.put(key, body)
+        return 200, body
+
+
+class DeficitRequestHandler(BaseHTTPRequestHandler):
+    """Route GET requests to the :class:`DeficitService` of the server and record their latency."""
+
+    def do_GET(self):
+        """Answer a GET request with JSON."""
+        started = time.perf_counter()
+        url = urlparse(self.path)
+        try:
+            status, body = self.server.service.handle(url.path, url.query)
+        except ValueError as error:
+            status, body = 400, json.dumps({'error': str(error)}).encode()
+        except LookupError as error:
+            status, body = 404, json.dumps({'error': str(error)}).encode()
+        except psycopg2.OperationalError as error:
+            status, body = 503, json.dumps({'error': f"Database unavailable: {error}"}).encode()
+        except psycopg2.Error as error:
+            status, body = 400, json.dumps({'error': str(error).strip()}).encode()
+        except Exception as error:
+            status, body = 500, json.dumps({'error': str(error)}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        # Unknown paths share one entry, so scanning clients cannot grow the metrics without bound
+        route = url.path if url.path in ROUTES else 'other'
+        self.server.service.metrics.record(route, time.perf_counter() - started, error=status >= 400)
+
+
+def create_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """Return a threaded HTTP server answering with ``service``; port 0 picks a free port."""
+    server = ThreadingHTTPServer((host, port), DeficitRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def main(argv=None):
+    """Parse the command line and serve until interrupted."""
+    parser = argparse.ArgumentParser(description="Serve school deficits over HTTP.")
+    parser.add_argument('--dsn', default=DEFAULT_DSN, help="libpq connection string of the database to read")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--city-layer', required=True)
+    parser.add_argument('--schools-layer', required=True)
+    parser.add_argument('--population-field', required=True)
+    parser.add_argument('--area-field', default=DEFAULT_AREA_FIELD)
+    parser.add_argument('--parent-fields', default='', help="Comma-separated admin level fields above the areas")
+    parser.add_argument('--connections', type=int, default=8, help="Largest number of pooled connections")
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE)
+    parser.add_argument('--ttl', type=float, default=DEFAULT_TTL, help="Seconds counts and responses are reused")
+    parser.add_argument('--statement-timeout', type=int, default=DEFAULT_STATEMENT_TIMEOUT)
+    args = parser.parse_args(argv)
+
+    pool = ThreadedConnectionPool(
+        1, args.connections, args.dsn, connect_timeout=CONNECT_TIMEOUT,
+        options=f"-c statement_timeout={args.statement_timeout * 1000}"
+    )
+    service = DeficitService(
+        pool, args.city_layer, args.schools_layer, args.population_field, args.area_field,
+        args.parent_fields.split(','), cache_size=args.cache_size, ttl=args.ttl
+    )
+    server = create_server(service, args.host, args.port)
+    print(f"Serving deficits on http://{args.host}:{server.server_port}/deficits")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.closeall()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
+from .engine import (
+    CHECKPOINT_TABLE, DEFAULT_AREA_FIELD, checkpoint_query, data_fingerprint, ensure_checkpoint_table,
+    ensure_results_table, fetch_area_counts, lock_key, rollup_query, sort_results, upsert_query
+)
+
+NATIONAL_RESULTS_TABLE = 'national_results'
+COMPLETED_SHARDS_TABLE = 'additional_schools_completed_shards'
+SHARD_LEVEL = 'region'
+
+
+class ShardError(Exception):
+    """Raised when some regional databases failed; the counts of the others are kept for the next attempt."""
+
+    def __init__(self, failures):
+        """
+        Constructor method.
+        :param failures: Dict of shard name to the error it failed with
+        """
+        self.failures = failures
+        super().__init__("; ".join(f"{name}: {error}" for name, error in failures.items()))
+
+
+def shard_run_key(shards, city_layer, schools_layer, population_field, area_field, parent_fields):
+    """
+    Return the id under which the counts of the shards of a national run with these inputs are stored.
+
+    The id covers the connection string of every shard; the data of each
+    shard is checked by the fingerprint stored with its counts.
+    """
+    inputs = ['shards', sorted(shards.items()), city_layer, schools_layer, population_field, area_field,
+              list(parent_fields)]
+    return hashlib.md5(json.dumps(inputs).encode()).hexdigest()
+
+
+def ensure_completed_shards_table(cursor):
+    """Create the table recording which shards of a national run are counted."""
+    cursor.execute(sql.SQL("""
+        CREATE TABLE IF NOT EXISTS {table} (
+            run_id text NOT NULL,
+            shard text NOT NULL,
+            PRIMARY KEY (run_id, shard)
+        )
+    """).format(table=sql.Identifier(COMPLETED_SHARDS_TABLE)))
+    cursor.execute(sql.SQL("ALTER TABLE {table} ADD COLUMN IF NOT EXISTS fingerprint text").format(
+        table=sql.Identifier(COMPLETED_SHARDS_TABLE)
+    ))
+
+
+def completed_shards(cursor, run_id):
+    """Return a dict of the shards whose counts are already stored for ``run_id`` to the fingerprint of their data."""
+    cursor.execute(sql.SQL("SELECT shard, fingerprint FROM {table} WHERE run_id = %s").format(
+        table=sql.Identifier(COMPLETED_SHARDS_TABLE)
+    ), [run_id])
+    return dict(cursor.fetchall())
+
+
+def checkpoint_shard(cursor, run_id, shard, rows, parent_fields=(), fingerprint=None):
+    """
+    Store the counts returned by :func:`engine.fetch_area_counts` for ``shard``, with the shard as top level.
+
+    Counts stored for the shard before are replaced. The shard is recorded
+    as completed with its counts and the ``fingerprint`` of its data, so a
+    shard without any area is not counted again on the next attempt.
+    """
+    cursor.execute(sql.SQL("DELETE FROM {table} WHERE run_id = %s AND parents[1] = %s").format(
+        table=sql.Identifier(CHECKPOINT_TABLE)
+    ), [run_id, shard])
+    cursor.execute(sql.SQL("""
+        INSERT INTO {table} (run_id, shard, fingerprint) VALUES (%s, %s, %s)
+        ON CONFLICT (run_id, shard) DO UPDATE SET fingerprint = EXCLUDED.fingerprint
+    """).format(table=sql.Identifier(COMPLETED_SHARDS_TABLE)), [run_id, shard, fingerprint])
+    levels = len(parent_fields)
+    execute_values(cursor, sql.SQL("""
+        INSERT INTO {table} (run_id, area_key, parents, population, geom, available_schools) VALUES %s
+    """).format(table=sql.Identifier(CHECKPOINT_TABLE)).as_string(cursor.connection), [
+        (run_id, row[levels], [shard] + list(row[:levels]), row[levels + 1], row[levels + 3], row[levels + 2])
+        for row in rows
+    ], template="(%s, %s, %s::text[], %s, %s, %s)", page_size=1000)
+
+
+def count_shard(connect, dsn, city_layer, schools_layer, population_field, area_field, parent_fields,
+                counted_fingerprint=None):
+    """
+    Count the schools of every area of one regional database on a read-only connection of its own.
+
+    Returns the fingerprint of the shard's data (see
+    :func:`engine.data_fingerprint`) and its counts, or None for the counts
+    when the fingerprint is still ``counted_fingerprint``.
+    """
+    connection = connect(dsn)
+    try:
+        connection.set_session(readonly=True)
+        cursor = connection.cursor()
+        fingerprint = json.dumps(data_fingerprint(cursor, city_layer, schools_layer))
+        if fingerprint == counted_fingerprint:
+            return fingerprint, None
+        return fingerprint, fetch_area_counts(
+            cursor, city_layer, schools_layer, population_field, area_field, parent_fields
+        )
+    finally:
+        connection.close()
+
+
+def calculate_national_deficits(cursor, shards, connect, city_layer, schools_layer, population_field, people_per_school,
+                                area_field=DEFAULT_AREA_FIELD, parent_fields=(), results_table=NATIONAL_RESULTS_TABLE,
+                                workers=None):
+    """
+    Count every regional database at once and merge their deficits into the national results table.
+
+    ``shards`` maps shard names to connection strings (see
+    :func:`database.parse_shards`) and ``connect`` opens a connection to
+    one of them. The layers must have the same names and fields in every
+    shard. The
+    counts of each shard are committed on ``cursor`` as checkpoints as soon
+    as it finishes, so when some shards fail a :class:`ShardError` is raised
+    and calling this again with the same inputs only counts the failed ones
+    and those whose data changed since. Runs with the same inputs are
+    serialised with an advisory lock, so they never store a shard twice.
+    Once every shard is counted, all admin levels are written in one
+    roll-up with the shard as the top level, named :data:`SHARD_LEVEL`,
+    so areas of the same name in two shards differ by their parent path.
+    The caller commits the results.
+    """
+    parent_fields = [field for field in parent_fields if field]
+    levels = [SHARD_LEVEL] + parent_fields
+    connection = cursor.connection
+    run_id = shard_run_key(shards, city_layer, schools_layer, population_field, area_field, parent_fields)
+    # Held across the commits of the shards like the chunked runs of engine.calculate_deficits_in_chunks
+    cursor.execute("SELECT pg_advisory_lock(%s)", [lock_key(run_id)])
+    ensure_checkpoint_table(cursor)
+    ensure_completed_shards_table(cursor)
+    connection.commit()
+
+    # Every shard is asked for its fingerprint, and only counted when it has none stored or its data changed
+    done = completed_shards(cursor, run_id)
+    failures = {}
+    with ThreadPoolExecutor(max_workers=workers or len(shards)) as executor:
+        futures = {
+            executor.submit(count_shard, connect, dsn, city_layer, schools_layer, population_field, area_field,
+                            parent_fields, done.get(name)): name
+            for name, dsn in shards.items()
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                fingerprint, rows = future.result()
+            except Exception as error:
+                # One unreachable region must not throw away the counts of the others
+                failures[name] = error
+                continue
+            if rows is not None:
+                checkpoint_shard(cursor, run_id, name, rows, parent_fields, fingerprint)
+                connection.commit()
+    if failures:
+        cursor.execute("SELECT pg_advisory_unlock(%s)", [lock_key(run_id)])
+        connection.commit()
+        raise ShardError(failures)
+
+    cursor.execute("SELECT pg_advisory_xact_lock(%(key)s), pg_advisory_unlock(%(key)s)", {'key': lock_key(run_id)})
+    ensure_results_table(cursor, results_table, area_field)
+    cursor.execute(
+        upsert_query(rollup_query(checkpoint_query(levels), area_field, levels), results_table),
+        {'people_per_school': people_per_school, 'run_id': run_id},
+    )
+    results = sort_results([list(row) for row in cursor.fetchall()], area_field, levels)
+    for table in (CHECKPOINT_TABLE, COMPLETED_SHARDS_TABLE):
+        cursor.execute(sql.SQL("DELETE FROM {table} WHERE run_id = %s").format(table=sql.Identifier(table)), [run_id])
+    return results
@@ -0,0 +1,52 @@
+import numpy as np
+from psycopg2 import sql
+
+CLASS_FIELD = 'schools_to_add'
+DEFAULT_CLASSES = 5
+
+
+def class_fractions(classes=DEFAULT_CLASSES):
+    """Return the quantile fractions bounding ``classes`` equal-count classes, from 0 to 1."""
+    return [i / classes for i in range(classes + 1)]
+
+
+def distinct_breaks(breaks):
+    """Drop the repeated breaks skewed values produce, keeping at least one class."""
+    unique = []
+    for value in breaks:
+        if not unique or value > unique[-1]:
+            unique.append(float(value))
+    if len(unique) == 1:
+        unique.append(unique[0])
+    return unique
+
+
+def class_breaks(cursor, results_table, admin_level, classes=DEFAULT_CLASSES):
+    """
+    Compute quantile class breaks of the schools to add at ``admin_level`` on the server.
+
+    Only the breaks are sent back, so QGIS never has to read the layer to
+    classify it. Returns the ascending breaks, or an empty list when the
+    level has no rows.
+    """
+    cursor.execute(sql.SQL("""
+        SELECT percentile_cont(%(fractions)s::double precision[]) WITHIN GROUP (ORDER BY {field})
+        FROM {results_table}
+        WHERE admin_level = %(admin_level)s AND {field} IS NOT NULL
+    """).format(field=sql.Identifier(CLASS_FIELD), results_table=sql.Identifier(results_table)),
+        {'fractions': class_fractions(classes), 'admin_level': admin_level})
+    breaks = cursor.fetchone()[0]
+    return distinct_breaks(breaks) if breaks else []
+
+
+def local_class_breaks(values, classes=DEFAULT_CLASSES):
+    """Compute the breaks of :func:`class_breaks` for values already in memory, e.g. from a GeoPackage run."""
+    values = np.asarray(values, dtype=float)
+    if not len(values):
+        return []
+    return distinct_breaks(np.percentile(values, [fraction * 100 for fraction in class_fractions(classes)]))
+
+
+def class_ranges(breaks):
+    """Return (lower, upper, label) of the classes between consecutive ``breaks``."""
+    return [(lower, upper, f"{lower:g} - {upper:g}") for lower, upper in zip(breaks[:-1], breaks[1:])]
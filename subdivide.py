@@ -0,0 +1,61 @@
+from psycopg2 import sql
+
+DEFAULT_MAX_VERTICES = 256
+SUBDIVIDED_SUFFIX = '_subdivided'
+
+
+def subdivided_table(city_layer):
+    """Return the name of the table caching the subdivided geometries of ``city_layer``."""
+    return f"{city_layer}{SUBDIVIDED_SUFFIX}"
+
+
+def refresh_subdivided(cursor, city_layer, schools_layer, max_vertices=DEFAULT_MAX_VERTICES):
+    """
+    Bring the cached ``ST_Subdivide`` pieces of the city layer up to date.
+
+    Pieces are stored in the SRID of the schools layer and keyed by the md5
+    of the source geometry, so only areas whose geometry changed since the
+    last run are subdivided again and pieces of removed geometries are
+    dropped. Changing ``max_vertices`` or the schools SRID rebuilds the cache.
+    Returns the name of the cache table.
+    """
+    table = subdivided_table(city_layer)
+    identifiers = {
+        'table': sql.Identifier(table),
+        'city_layer': sql.Identifier(city_layer),
+        'schools_name': sql.Literal(schools_layer),
+    }
+    cursor.execute(sql.SQL("""
+        CREATE TABLE IF NOT EXISTS {table} (
+            source_hash text NOT NULL,
+            srid integer NOT NULL,
+            max_vertices integer NOT NULL,
+            piece geometry NOT NULL
+        )
+    """).format(**identifiers))
+    cursor.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {index} ON {table} (source_hash)").format(
+        index=sql.Identifier(f"{table}_hash_idx"), **identifiers
+    ))
+    cursor.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {index} ON {table} USING GIST (piece)").format(
+        index=sql.Identifier(f"{table}_piece_idx"), **identifiers
+    ))
+    cursor.execute(sql.SQL("""
+        DELETE FROM {table}
+        WHERE srid <> Find_SRID('public', {schools_name}, 'geom')
+        OR max_vertices <> %(max_vertices)s
+        OR NOT EXISTS (SELECT 1 FROM {city_layer} c WHERE md5(ST_AsEWKB(c.geom)) = {table}.source_hash)
+    """).format(**identifiers), {'max_vertices': max_vertices})
+    removed = cursor.rowcount
+    cursor.execute(sql.SQL("""
+        INSERT INTO {table} (source_hash, srid, max_vertices, piece)
+        SELECT source_hash, target.srid, %(max_vertices)s, ST_Subdivide(ST_Transform(geom, target.srid), %(max_vertices)s)
+        FROM (
+            SELECT DISTINCT ON (source_hash) source_hash, geom
+            FROM (SELECT md5(ST_AsEWKB(geom)) AS source_hash, geom FROM {city_layer} WHERE geom IS NOT NULL) hashed
+        ) source
+        CROSS JOIN (SELECT Find_SRID('public', {schools_name}, 'geom') AS srid) target
+        WHERE NOT EXISTS (SELECT 1 FROM {table} cached WHERE cached.source_hash = source.source_hash)
+    """).format(**identifiers), {'max_vertices': max_vertices})
+    if removed or cursor.rowcount:
+        cursor.execute(sql.SQL("ANALYZE {table}").format(**identifiers))
+    return table
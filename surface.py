@@ -0,0 +1,164 @@
+import math
+import os
+
+import numpy as np
+from psycopg2 import sql
+
+RATIO = 'ratio'
+GAP = 'gap'
+DEFAULT_BANDWIDTH = 2000
+TILE_SIZE = 1024
+NODATA = -9999.0
+SCHOOLS_RASTER = 'schools.npy'
+POPULATION_RASTER = 'population.npy'
+# People per km² below which schools per 1,000 people are left undefined
+MIN_DENSITY = 1.0
+
+
+def import_gdal():
+    """Import GDAL, which ships with QGIS but is not needed by the rest of the calculation."""
+    try:
+        from osgeo import gdal, osr
+    except ImportError:
+        raise ImportError("Coverage surfaces need the GDAL Python bindings (osgeo) installed")
+    return gdal, osr
+
+
+def layer_window(cursor, city_layer, srid, size):
+    """
+    Return the pixel window covering the city layer on the ``ST_SquareGrid`` cells of side ``size`` in ``srid``.
+
+    The window is (first cell i, last cell j, columns, rows); rows run from
+    north to south, so raster row r holds the cells of row j = last j - r.
+    """
+    cursor.execute(sql.SQL("""
+        SELECT ST_XMin(e), ST_YMin(e), ST_XMax(e), ST_YMax(e)
+        FROM (SELECT ST_Extent(ST_Transform(geom, %(srid)s)) AS e FROM {city_layer}) extent
+    """).format(city_layer=sql.Identifier(city_layer)), {'srid': srid})
+    minx, miny, maxx, maxy = cursor.fetchone()
+    first_i, first_j = math.floor(minx / size), math.floor(miny / size)
+    last_i, last_j = math.floor(maxx / size), math.floor(maxy / size)
+    return first_i, last_j, last_i - first_i + 1, last_j - first_j + 1
+
+
+def create_rasters(directory, window):
+    """Create the zeroed school and population rasters of ``window`` as memory-mapped files in ``directory``."""
+    shape = (window[3], window[2])
+    return tuple(
+        np.lib.format.open_memmap(os.path.join(directory, name), mode='w+', dtype=np.float32, shape=shape)
+        for name in (SCHOOLS_RASTER, POPULATION_RASTER)
+    )
+
+
+def open_rasters(directory):
+    """Memory-map the school and population rasters written by :func:`create_rasters` for reading."""
+    return tuple(np.load(os.path.join(directory, name), mmap_mode='r') for name in (SCHOOLS_RASTER, POPULATION_RASTER))
+
+
+def rasterize(array, i, j, weights, window):
+    """Add ``weights`` to the pixels of cells (i, j) of ``window`` in ``array``, ignoring cells outside it."""
+    first_i, last_j, columns, rows = window
+    column = np.asarray(i, dtype=np.int64) - first_i
+    row = last_j - np.asarray(j, dtype=np.int64)
+    inside = (column >= 0) & (column < columns) & (row >= 0) & (row < rows)
+    np.add.at(array, (row[inside], column[inside]), np.asarray(weights, dtype=array.dtype)[inside])
+
+
+def gaussian_kernel(bandwidth, size):
+    """Return the Gaussian kernel of standard deviation ``bandwidth`` on pixels of side ``size``, cut at 3 deviations and summing to 1."""
+    sigma = bandwidth / size
+    radius = max(1, math.ceil(3 * sigma))
+    offsets = np.arange(-radius, radius + 1)
+    kernel = np.exp(-(offsets[:, None] ** 2 + offsets[None, :] ** 2) / (2 * sigma ** 2))
+    return kernel / kernel.sum()
+
+
+def smoothed_tiles(arrays, kernel, tile_size=TILE_SIZE):
+    """
+    Convolve every array with ``kernel`` tile by tile and yield (row, column, smoothed tiles).
+
+    Each tile is read with a halo of the kernel radius, so the tiles join
+    without seams, and convolved through a zero-padded FFT of one fixed
+    size whose kernel transform is computed once. Only one tile of each
+    array is in memory at a time, so ``arrays`` may be memory-mapped
+    rasters of any size. Tiles without any value are yielded as None.
+    """
+    radius = kernel.shape[0] // 2
+    block = tile_size + 2 * radius
+    # Large enough that the linear convolution of a block never wraps around
+    shape = (block + 2 * radius, block + 2 * radius)
+    kernel_fft = np.fft.rfft2(kernel, shape)
+    rows, columns = arrays[0].shape
+    for row in range(0, rows, tile_size):
+        for column in range(0, columns, tile_size):
+            height, width = min(tile_size, rows - row), min(tile_size, columns - column)
+            top, left = max(0, row - radius), max(0, column - radius)
+            bottom, right = min(rows, row + height + radius), min(columns, column + width + radius)
+            smoothed = []
+            for array in arrays:
+                values = np.asarray(array[top:bottom, left:right], dtype=float)
+                if not values.any():
+                    smoothed.append(None)
+                    continue
+                padded = np.zeros((block, block))
+                padded[top - row + radius:bottom - row + radius, left - column + radius:right - column + radius] = values
+                full = np.fft.irfft2(np.fft.rfft2(padded, shape) * kernel_fft, shape)
+                smoothed.append(full[2 * radius:2 * radius + height, 2 * radius:2 * radius + width])
+            yield row, column, smoothed
+
+
+def coverage_surface(schools, population, size, people_per_school, mode=RATIO):
+    """
+    Return the coverage surface of smoothed school and population counts per pixel.
+
+    In :data:`RATIO` mode it is the schools per 1,000 people, undefined
+    (:data:`NODATA`) where fewer than MIN_DENSITY people live per km²; in
+    :data:`GAP` mode the schools missing per km², negative where there are
+    more schools than the population needs. ``schools`` or ``population``
+    may be None for a tile without any.
+    """
+    km2 = size * size / 1e6
+    if population is None:
+        population = np.zeros_like(schools)
+    if schools is None:
+        schools = np.zeros_like(population)
+    if mode == GAP:
+        return (population / people_per_school - schools) / km2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = schools / population * 1000
+    return np.where(population / km2 >= MIN_DENSITY, ratio, NODATA)
+
+
+def write_geotiff(path, schools, population, window, size, srid, people_per_school, mode=RATIO,
+                  bandwidth=DEFAULT_BANDWIDTH, tile_size=TILE_SIZE):
+    """
+    Smooth the school and population rasters and write their coverage surface as a tiled, compressed GeoTIFF.
+
+    ``schools`` and ``population`` are rasters of ``window`` (see
+    :func:`layer_window`), north up, such as memory-mapped arrays filled
+    by :func:`rasterize`. The surface is written tile by tile as computed.
+    """
+    gdal, osr = import_gdal()
+    first_i, last_j, columns, rows = window
+    dataset = gdal.GetDriverByName('GTiff').Create(
+        path, columns, rows, 1, gdal.GDT_Float32,
+        options=['TILED=YES', 'COMPRESS=DEFLATE', 'PREDICTOR=3', 'BIGTIFF=IF_SAFER']
+    )
+    dataset.SetGeoTransform((first_i * size, size, 0, (last_j + 1) * size, 0, -size))
+    reference = osr.SpatialReference()
+    reference.ImportFromEPSG(int(srid))
+    dataset.SetProjection(reference.ExportToWkt())
+    band = dataset.GetRasterBand(1)
+    band.SetNoDataValue(NODATA)
+    band.SetDescription("Schools per 1,000 people" if mode == RATIO else "Schools missing per km²")
+
+    kernel = gaussian_kernel(bandwidth, size)
+    for row, column, (smoothed_schools, smoothed_population) in smoothed_tiles([schools, population], kernel, tile_size):
+        height, width = min(tile_size, rows - row), min(tile_size, columns - column)
+        if smoothed_schools is None and smoothed_population is None:
+            surface = np.full((height, width), NODATA if mode == RATIO else 0.0)
+        else:
+            surface = coverage_surface(smoothed_schools, smoothed_population, size, people_per_school, mode)
+        band.WriteArray(surface.astype(np.float32), column, row)
+    band.FlushCache()
+    dataset = None
@@ -0,0 +1,93 @@
+# coding=utf-8
+"""Columnar export test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'bsc-inf-01-20@unima.ac.mw'
+__date__ = '2026-10-19'
+__copyright__ = 'Copyright 2024, bsc-inf-01-20'
+
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from columnar import ARROW, PARQUET, RESULT_COLUMNS, decode_hex, export_schema, wkb_array, write_batches
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+# WKB of POINT(1 2) and POINT(3 4)
+POINTS = ['0101000000000000000000f03f0000000000000040', '010100000000000000000008400000000000001040']
+
+
+class DecodeHexTest(unittest.TestCase):
+    """Test hex encoded WKB is decoded without a Python loop."""
+
+    def test_strings_are_decoded_with_their_offsets(self):
+        """Each string decodes to half as many bytes, upper and lower case alike."""
+        data = np.frombuffer(b'00ffAB10', dtype=np.uint8)
+        decoded, offsets = decode_hex(data, [0, 6, 6, 8])
+        self.assertEqual(bytes(decoded), b'\x00\xff\xab\x10')
+        self.assertEqual(offsets.tolist(), [0, 3, 3, 4])
+
+
+@unittest.skipUnless(pyarrow, "needs pyarrow")
+class ColumnarExportTest(unittest.TestCase):
+    """Test result batches are written as GeoParquet and Arrow IPC."""
+
+    def setUp(self):
+        """Build two result rows, the second without geometry."""
+        self.schema = export_schema(RESULT_COLUMNS, 4326)
+        self.batch = pyarrow.RecordBatch.from_arrays([
+            pyarrow.array(['adm3_en', 'adm3_en']), pyarrow.array(['A', 'B']), pyarrow.array([3, 1], pyarrow.int32()),
+            pyarrow.array([1, 1], pyarrow.int32()), pyarrow.array([2, 0], pyarrow.int32()), pyarrow.array(['N', 'N']),
+            wkb_array(pyarrow.array([POINTS[0], ''])),
+        ], schema=self.schema)
+        self.directory = tempfile.mkdtemp()
+
+    def test_geometry_is_decoded_to_wkb(self):
+        """Hex strings become WKB and empty strings become nulls."""
+        geometry = self.batch.column(6)
+        self.assertEqual(geometry[0].as_py(), bytes.fromhex(POINTS[0]))
+        self.assertIsNone(geometry[1].as_py())
+
+    def test_parquet_has_geo_metadata_and_row_groups(self):
+        """Row groups hold the requested number of rows and the schema carries the GeoParquet metadata."""
+        import pyarrow.parquet as pq
+        path = os.path.join(self.directory, 'results.parquet')
+        self.assertEqual(write_batches([self.batch] * 3, self.schema, path, PARQUET, row_group_size=4), 6)
+        parquet = pq.ParquetFile(path)
+        self.assertEqual([parquet.metadata.row_group(i).num_rows for i in range(parquet.num_row_groups)], [4, 2])
+        geo = json.loads(parquet.schema_arrow.metadata[b'geo'])
+        self.assertEqual(geo['columns']['geometry']['encoding'], 'WKB')
+        self.assertNotIn('crs', geo['columns']['geometry'])
+
+    def test_arrow_file_round_trips(self):
+        """An Arrow IPC file reads back the rows written."""
+        path = os.path.join(self.directory, 'results.arrow')
+        write_batches([self.batch], self.schema, path, ARROW)
+        table = pyarrow.ipc.open_file(path).read_all()
+        self.assertEqual(table.column('schools_to_add').to_pylist(), [2, 0])
+
+    def test_projected_grid_names_its_crs(self):
+        """Geometries outside EPSG:4326 carry their EPSG code."""
+        schema = export_schema(RESULT_COLUMNS, 32736, ['Polygon'])
+        crs = json.loads(schema.metadata[b'geo'])['columns']['geometry']['crs']
+        self.assertEqual(crs['id']['code'], 32736)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(DecodeHexTest)
+    suite.addTests(unittest.makeSuite(ColumnarExportTest))
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
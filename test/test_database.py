@@ -0,0 +1,225 @@
+# coding=utf-8
+"""Read replica routing test.
+
+Runs against two local PostgreSQL servers given as libpq connection strings
+in ADDITIONAL_SCHOOLS_WRITE_DSN and ADDITIONAL_SCHOOLS_READ_DSN; skipped
+otherwise.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'bsc-inf-01-20@unima.ac.mw'
+__date__ = '2026-10-19'
+__copyright__ = 'Copyright 2024, bsc-inf-01-20'
+
+import os
+import unittest
+from unittest import mock
+
+import psycopg2
+
+from database import (
+    CircuitBreaker, DatabaseRouter, DatabaseUnavailableError, current_lsn, is_transient, parse_shards, replica_lag,
+    wait_for_replay
+)
+from .utilities import plugin_module
+
+shards_module = plugin_module('shards')
+
+WRITE_DSN = os.environ.get('ADDITIONAL_SCHOOLS_WRITE_DSN')
+READ_DSN = os.environ.get('ADDITIONAL_SCHOOLS_READ_DSN')
+
+
+def server_port(connection):
+    """Return the port of the server behind ``connection``."""
+    cursor = connection.cursor()
+    cursor.execute("SHOW port")
+    port = cursor.fetchone()[0]
+    connection.close()
+    return port
+
+
+@unittest.skipUnless(WRITE_DSN and READ_DSN, "needs two local PostgreSQL servers")
+class DatabaseRouterTest(unittest.TestCase):
+    """Test reads and writes are sent to their own servers."""
+
+    def test_reads_and_writes_are_routed(self):
+        """Reads go to the replica and writes to the primary."""
+        router = DatabaseRouter(WRITE_DSN, READ_DSN)
+        self.assertTrue(router.has_replica)
+        self.assertNotEqual(server_port(router.connect_write()), server_port(router.connect_read()))
+
+    def test_without_replica_reads_from_primary(self):
+        """Without a replica every connection goes to the primary."""
+        router = DatabaseRouter(WRITE_DSN)
+        self.assertFalse(router.has_replica)
+        self.assertEqual(router.read_endpoint(), WRITE_DSN)
+
+    def test_primary_has_no_lag(self):
+        """A server that is not in recovery never lags."""
+        router = DatabaseRouter(WRITE_DSN, READ_DSN, max_lag_seconds=1)
+        connection = router.connect_write()
+        self.assertEqual(replica_lag(connection), 0)
+        connection.close()
+
+    def test_unreplayed_position_falls_back_to_primary(self):
+        """A standby that has not replayed a position of the primary is not read from."""
+        router = DatabaseRouter(WRITE_DSN, READ_DSN, replay_timeout=0)
+        connection = psycopg2.connect(READ_DSN)
+        cursor = connection.cursor()
+        cursor.execute("SELECT pg_is_in_recovery()")
+        standby = cursor.fetchone()[0]
+        connection.close()
+        # No server has written this far, so only a server that is not a standby counts as caught up
+        self.assertEqual(router.read_endpoint('FFFFFFFF/FFFFFFFF'), WRITE_DSN if standby else READ_DSN)
+
+    def test_current_lsn_is_replayed_by_primary(self):
+        """The primary has always replayed its own position."""
+        router = DatabaseRouter(WRITE_DSN, READ_DSN, replay_timeout=0)
+        connection = router.connect_write()
+        lsn = current_lsn(connection)
+        self.assertTrue(wait_for_replay(connection, lsn, 0))
+        connection.close()
+
+
+class ResilienceTest(unittest.TestCase):
+    """Test failures are classified and the circuit breaker opens and closes."""
+
+    def test_lost_connection_is_transient(self):
+        """Errors without a server code come from the connection and are worth retrying."""
+        self.assertTrue(is_transient(psycopg2.OperationalError("server closed the connection unexpectedly")))
+        self.assertFalse(is_transient(psycopg2.ProgrammingError("syntax error")))
+
+    def test_breaker_opens_after_repeated_failures(self):
+        """The circuit opens after the threshold and lets a call through after the reset time."""
+        breaker = CircuitBreaker(failure_threshold=2, reset_after=60)
+        breaker.record_failure()
+        breaker.check()
+        breaker.record_failure()
+        self.assertRaises(DatabaseUnavailableError, breaker.check)
+        breaker.reset_after = 0
+        breaker.check()
+        breaker.record_success()
+        self.assertEqual(breaker.failures, 0)
+
+    def test_open_circuit_fails_without_connecting(self):
+        """An open circuit raises before the unreachable server is contacted."""
+        router = DatabaseRouter("host=192.0.2.1 dbname=none")
+        breaker = CircuitBreaker(failure_threshold=1)
+        breaker.record_failure()
+        router.breakers[router.write_dsn] = breaker
+        self.assertRaises(DatabaseUnavailableError, router.connect_write)
+
+    def test_failed_connect_is_retried(self):
+        """A refused connection at the start of a run is retried like any other transient failure."""
+        class Connection:
+            closed = False
+
+            def commit(self):
+                pass
+
+            def close(self):
+                pass
+
+        attempts = []
+
+        class FlakyRouter(DatabaseRouter):
+            def connect_write(self):
+                attempts.append(None)
+                if len(attempts) == 1:
+                    raise psycopg2.OperationalError("could not connect to server")
+                return Connection()
+
+        self.assertEqual(FlakyRouter().run(lambda connection: 'done', backoff=0), 'done')
+        self.assertEqual(len(attempts), 2)
+
+
+class ShardConfigTest(unittest.TestCase):
+    """Test regional databases are read from the settings text."""
+
+    def test_shards_keep_their_order(self):
+        """Every line names a shard; comments and blank lines are skipped."""
+        shards = parse_shards("# regions\nnorth: dbname=north host=db1\n\nsouth: postgresql://db2/south\n")
+        self.assertEqual(list(shards), ['north', 'south'])
+        self.assertEqual(shards['south'], 'postgresql://db2/south')
+
+    def test_line_without_name_is_rejected(self):
+        """A connection string without a shard name is an error, not a silently skipped region."""
+        self.assertRaises(ValueError, parse_shards, "dbname=north")
+        self.assertEqual(parse_shards(None), {})
+
+
+@unittest.skipUnless(WRITE_DSN, "needs a local PostGIS database")
+class NationalRunTest(unittest.TestCase):
+    """Test regional databases are counted and merged into one national result."""
+
+    # Both regions read the test database, told apart by their connection strings
+    SHARDS = {'north': f"{WRITE_DSN} application_name=north", 'south': f"{WRITE_DSN} application_name=south"}
+
+    def setUp(self):
+        """Runs before each test."""
+        self.connection = psycopg2.connect(WRITE_DSN)
+        self.cursor = self.connection.cursor()
+        self.cursor.execute("""
+            CREATE TABLE shard_test_city (adm1_en text, adm3_en text, pop integer, geom geometry(Polygon, 4326));
+            CREATE TABLE shard_test_schools (geom geometry(Point, 4326));
+            INSERT INTO shard_test_city VALUES
+                ('Lake', 'a', 1000, ST_MakeEnvelope(0, 0, 1, 1, 4326)),
+                ('Hill', 'b', 600, ST_MakeEnvelope(1, 0, 2, 1, 4326));
+            INSERT INTO shard_test_schools VALUES (ST_SetSRID(ST_MakePoint(0.5, 0.5), 4326));
+        """)
+        self.connection.commit()
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.connection.rollback()
+        self.cursor.execute("DROP TABLE IF EXISTS shard_test_city, shard_test_schools, shard_test_results")
+        self.connection.commit()
+        self.connection.close()
+
+    def calculate(self, connect):
+        """Run the national calculation of the test layers and commit it."""
+        results = shards_module.calculate_national_deficits(
+            self.cursor, self.SHARDS, connect, 'shard_test_city', 'shard_test_schools', 'pop', 500,
+            area_field='adm3_en', parent_fields=['adm1_en'], results_table='shard_test_results'
+        )
+        self.connection.commit()
+        return results
+
+    def test_same_area_in_two_shards(self):
+        """An area of the same name in both regions gets a row per region, and the total adds both up."""
+        results = self.calculate(psycopg2.connect)
+        self.assertIn(['total', 'total', 6, 2, 4, ''], results)
+        self.assertIn(['adm3_en', 'a', 2, 1, 1, 'north / Lake'], results)
+        self.assertIn(['adm3_en', 'a', 2, 1, 1, 'south / Lake'], results)
+
+    def test_rerun_counts_only_the_failed_shard(self):
+        """After one region failed, running again counts that region alone and merges it with the kept counts."""
+        def connect_failing_south(dsn):
+            if dsn == self.SHARDS['south']:
+                raise psycopg2.OperationalError("could not connect to server")
+            return psycopg2.connect(dsn)
+
+        with self.assertRaises(shards_module.ShardError) as raised:
+            self.calculate(connect_failing_south)
+        self.assertEqual(list(raised.exception.failures), ['south'])
+
+        with mock.patch.object(shards_module, 'fetch_area_counts', wraps=shards_module.fetch_area_counts) as counted:
+            results = self.calculate(psycopg2.connect)
+        self.assertEqual(counted.call_count, 1)
+        self.assertIn(['total', 'total', 6, 2, 4, ''], results)
+        self.assertIn(['region', 'north', 3, 1, 2, ''], results)
+        self.assertIn(['region', 'south', 3, 1, 2, ''], results)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(DatabaseRouterTest)
+    suite.addTests(unittest.makeSuite(ResilienceTest))
+    suite.addTests(unittest.makeSuite(ShardConfigTest))
+    suite.addTests(unittest.makeSuite(NationalRunTest))
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,78 @@
+# coding=utf-8
+"""School de-duplication test.
+
+Runs against a local PostGIS database given as a libpq connection string in
+ADDITIONAL_SCHOOLS_WRITE_DSN; it is skipped otherwise. Everything is rolled
+back afterwards.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'bsc-inf-01-20@unima.ac.mw'
+__date__ = '2026-10-19'
+__copyright__ = 'Copyright 2024, bsc-inf-01-20'
+
+import os
+import unittest
+
+import psycopg2
+
+from .utilities import plugin_module
+
+deduplicate = plugin_module('deduplicate')
+
+WRITE_DSN = os.environ.get('ADDITIONAL_SCHOOLS_WRITE_DSN')
+SCHOOLS_LAYER = 'deduplicate_test_schools'
+
+
+@unittest.skipUnless(WRITE_DSN, "needs a local PostGIS database")
+class DeduplicateTest(unittest.TestCase):
+    """Test nearby schools are merged within the tolerance."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.connection = psycopg2.connect(WRITE_DSN)
+        self.cursor = self.connection.cursor()
+        # About 11 m between the first two schools and 1.1 km to the last one
+        self.cursor.execute(f"""
+            CREATE TABLE {SCHOOLS_LAYER} (name text, geom geometry(Point, 4326));
+            INSERT INTO {SCHOOLS_LAYER} VALUES
+                ('Alpha', ST_SetSRID(ST_MakePoint(35.0, -15.0), 4326)),
+                (' alpha ', ST_SetSRID(ST_MakePoint(35.0001, -15.0), 4326)),
+                ('Beta', ST_SetSRID(ST_MakePoint(35.0, -15.0), 4326)),
+                (NULL, ST_SetSRID(ST_MakePoint(35.0, -15.0), 4326)),
+                (NULL, ST_SetSRID(ST_MakePoint(35.0, -15.0), 4326)),
+                ('Alpha', ST_SetSRID(ST_MakePoint(35.01, -15.0), 4326));
+        """)
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.connection.rollback()
+        self.connection.close()
+
+    def kept_schools(self, table):
+        """Return (name, merged) of the kept schools."""
+        self.cursor.execute(f"SELECT name, merged FROM {table} ORDER BY name NULLS LAST, merged DESC")
+        return self.cursor.fetchall()
+
+    def test_schools_within_the_tolerance_are_merged(self):
+        """Without a name field every school within the tolerance is merged, however it is named."""
+        table = deduplicate.refresh_deduplicated(self.cursor, SCHOOLS_LAYER, tolerance=50)
+        self.assertEqual(self.kept_schools(table), [(None, 5), (None, 1)])
+
+    def test_names_must_match_to_merge(self):
+        """With a name field only matching names merge, and unnamed schools are each kept."""
+        table = deduplicate.refresh_deduplicated(self.cursor, SCHOOLS_LAYER, tolerance=50, name_field='name')
+        self.assertEqual(self.kept_schools(table), [('Alpha', 2), ('Alpha', 1), ('Beta', 1), (None, 1), (None, 1)])
+        self.assertEqual([(row[0], row[3], row[4]) for row in deduplicate.merged_duplicates(self.cursor, table)],
+                         [('Alpha', 2, 'Alpha;  alpha ')])
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(DeduplicateTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,60 @@
+# coding=utf-8
+"""Query plan capture test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'bsc-inf-01-20@unima.ac.mw'
+__date__ = '2026-10-19'
+__copyright__ = 'Copyright 2024, bsc-inf-01-20'
+
+import unittest
+
+from diagnostics import MAX_STATEMENT_LENGTH, ExplainCursor, bulk_key
+
+
+class RecordingCursor:
+    """Cursor that records the statements it is given instead of running them."""
+
+    def __init__(self):
+        self.executed = []
+
+    def execute(self, query, vars=None):
+        self.executed.append(query)
+
+    def fetchone(self):
+        return [[{'Plan': {}}]]
+
+
+class DiagnosticsTest(unittest.TestCase):
+    """Test which statements are explained and how they are reported."""
+
+    def test_bulk_pages_are_one_unexplained_entry(self):
+        """Pages of inlined rows are grouped under their common prefix and never explained."""
+        cursor = ExplainCursor(RecordingCursor())
+        for page in range(3):
+            cursor.execute(f"INSERT INTO merged_counts VALUES ('a{page}', 1, 2),('b', 3, 4)".encode())
+        self.assertEqual(list(cursor.statements), ["INSERT INTO merged_counts VALUES ..."])
+        self.assertEqual(cursor.statements["INSERT INTO merged_counts VALUES ..."]['executions'], 3)
+        self.assertEqual(cursor.statements["INSERT INTO merged_counts VALUES ..."]['plans'], [])
+        self.assertEqual(len(cursor.wrapped.executed), 3)
+
+    def test_statement_text_is_truncated(self):
+        """A long statement is explained once but kept in the report only up to the length limit."""
+        cursor = ExplainCursor(RecordingCursor())
+        cursor.execute("SELECT " + "1, " * MAX_STATEMENT_LENGTH + "1")
+        entry, = cursor.statements.values()
+        self.assertEqual(len(entry['statement']), MAX_STATEMENT_LENGTH + len(' ...'))
+        self.assertEqual(len(entry['plans']), 1)
+        self.assertEqual(bulk_key("EXECUTE insert_count_0a1b ('a', 1, 2);EXECUTE insert_count_0a1b ('b', 3, 4)"),
+                         "EXECUTE insert_count_0a1b ( ...")
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(DiagnosticsTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
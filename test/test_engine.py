@@ -0,0 +1,215 @@
+# coding=utf-8
+"""Deficit calculation test.
+
+Runs against a local PostGIS database given as a libpq connection string in
+ADDITIONAL_SCHOOLS_WRITE_DSN; it is skipped otherwise.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'bsc-inf-01-20@unima.ac.mw'
+__date__ = '2026-10-19'
+__copyright__ = 'Copyright 2024, bsc-inf-01-20'
+
+import os
+import unittest
+from unittest import mock
+
+import psycopg2
+
+import engine
+from engine import (
+    CHECKPOINT_TABLE, calculate_deficits, calculate_deficits_from_counts, calculate_deficits_in_chunks, calculate_deficits_per_area,
+    fetch_area_counts
+)
+from .utilities import plugin_module
+
+parallel = plugin_module('parallel')
+
+WRITE_DSN = os.environ.get('ADDITIONAL_SCHOOLS_WRITE_DSN')
+RESULTS_TABLE = 'engine_test_results'
+
+
+@unittest.skipUnless(WRITE_DSN, "needs a local PostGIS database")
+class EngineTest(unittest.TestCase):
+    """Test the deficits of every admin level are calculated in the database."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.connection = psycopg2.connect(WRITE_DSN)
+        self.cursor = self.connection.cursor()
+        # Area 'a' exists under both regions, and area 'c' is split over two features
+        self.cursor.execute("""
+            CREATE TABLE engine_test_city (adm1_en text, adm3_en text, pop integer, geom geometry(Polygon, 4326));
+            CREATE TABLE engine_test_schools (geom geometry(Point, 4326));
+            INSERT INTO engine_test_city VALUES
+                ('North', 'a', 1000, ST_MakeEnvelope(0, 0, 1, 1, 4326)),
+                ('North', 'b', 400, ST_MakeEnvelope(1, 0, 2, 1, 4326)),
+                ('South', 'a', 1500, ST_MakeEnvelope(0, 2, 1, 3, 4326)),
+                ('South', 'c', 400, ST_MakeEnvelope(2, 2, 3, 3, 4326)),
+                ('South', 'c', 400, ST_MakeEnvelope(3, 2, 4, 3, 4326));
+            INSERT INTO engine_test_schools VALUES
+                (ST_SetSRID(ST_MakePoint(0.5, 0.5), 4326)),
+                (ST_SetSRID(ST_MakePoint(1.5, 0.5), 4326)),
+                (ST_SetSRID(ST_MakePoint(1.6, 0.5), 4326));
+        """)
+        self.connection.commit()
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.connection.rollback()
+        self.cursor.execute(f"DROP TABLE IF EXISTS engine_test_city, engine_test_schools, {RESULTS_TABLE}")
+        self.connection.commit()
+        self.connection.close()
+
+    def test_every_admin_level_is_rolled_up(self):
+        """Each level sums its areas, the total row sums all, and same-named areas are rows of their own."""
+        results = calculate_deficits(self.cursor, 'engine_test_city', 'engine_test_schools', 'pop', 500,
+                                     area_field='adm3_en', parent_fields=['adm1_en'], results_table=RESULTS_TABLE)
+        self.assertEqual(results, [
+            ['total', 'total', 7, 3, 6, ''],
+            ['adm1_en', 'North', 3, 3, 1, ''],
+            ['adm1_en', 'South', 5, 0, 5, ''],
+            ['adm3_en', 'a', 2, 1, 1, 'North'],
+            ['adm3_en', 'a', 3, 0, 3, 'South'],
+            ['adm3_en', 'b', 1, 2, 0, 'North'],
+            ['adm3_en', 'c', 2, 0, 2, 'South'],
+        ])
+        self.cursor.execute(f"SELECT COUNT(*) FROM {RESULTS_TABLE} WHERE area_name = 'a'")
+        self.assertEqual(self.cursor.fetchone()[0], 2)
+
+    def test_unserved_population_of_same_named_areas(self):
+        """Areas of the same name under different parents need schools for their own unserved population only."""
+        counts = fetch_area_counts(self.cursor, 'engine_test_city', 'engine_test_schools', 'pop', 'adm3_en', ['adm1_en'])
+        unserved = {('North', 'a'): 500, ('North', 'b'): 0, ('South', 'a'): 1500}
+        results = calculate_deficits_from_counts(self.cursor, counts, 500, 'adm3_en', ['adm1_en'],
+                                                 results_table=RESULTS_TABLE, unserved=unserved)
+        to_add = {(row[1], row[5]): row[4] for row in results if row[0] == 'adm3_en'}
+        self.assertEqual(to_add, {('a', 'North'): 1, ('b', 'North'): 0, ('a', 'South'): 3, ('c', 'South'): 0})
+
+    def test_strategies_agree(self):
+        """Every counting strategy gives the same deficits, also for an area split over several features."""
+        layers = (self.cursor, 'engine_test_city', 'engine_test_schools', 'pop', 1000)
+        options = {'area_field': 'adm3_en', 'parent_fields': ['adm1_en'], 'results_table': RESULTS_TABLE}
+        runs = {
+            'plain': lambda: calculate_deficits(*layers, **options),
+            'chunked': lambda: calculate_deficits_in_chunks(*layers, chunk_size=1, **options),
+            'per area': lambda: calculate_deficits_per_area(*layers, **options),
+            'parallel': lambda: parallel.calculate_deficits_in_parallel(
+                self.cursor, lambda: psycopg2.connect(WRITE_DSN), *layers[1:], workers=2, **options
+            ),
+            'from counts': lambda: calculate_deficits_from_counts(
+                self.cursor, fetch_area_counts(*layers[:4], 'adm3_en', ['adm1_en']), 1000, **options
+            ),
+        }
+        results = {}
+        for name, run in runs.items():
+            results[name] = run()
+            self.connection.commit()
+        # Two features of 400 people need one school together, though neither needs one alone
+        self.assertIn(['adm3_en', 'c', 1, 0, 1, 'South'], results['plain'])
+        for name, rows in results.items():
+            self.assertEqual(rows, results['plain'], name)
+
+    def test_parallel_workers_count_the_coordinator_snapshot(self):
+        """Schools added once the snapshot is exported are not counted by any worker."""
+        layers = (self.cursor, 'engine_test_city', 'engine_test_schools', 'pop', 1000)
+        options = {'area_field': 'adm3_en', 'parent_fields': ['adm1_en'], 'results_table': RESULTS_TABLE}
+        plain = calculate_deficits(*layers, **options)
+        self.connection.commit()
+        export = parallel.export_snapshot
+
+        def export_then_edit(connection):
+            snapshot = export(connection)
+            editor = psycopg2.connect(WRITE_DSN)
+            editor.cursor().execute("INSERT INTO engine_test_schools VALUES (ST_SetSRID(ST_MakePoint(2.5, 2.5), 4326))")
+            editor.commit()
+            editor.close()
+            return snapshot
+
+        with mock.patch.object(parallel, 'export_snapshot', side_effect=export_then_edit):
+            results = parallel.calculate_deficits_in_parallel(
+                self.cursor, lambda: psycopg2.connect(WRITE_DSN), *layers[1:], workers=2, **options
+            )
+        self.connection.commit()
+        self.assertEqual(results, plain)
+        self.assertNotEqual(calculate_deficits(*layers, **options), plain)
+
+    def test_merged_areas_keep_their_own_geometry(self):
+        """An area of a name used under another parent gets only its own polygon, and a split area each piece once."""
+        calculate_deficits_per_area(self.cursor, 'engine_test_city', 'engine_test_schools', 'pop', 1000,
+                                    area_field='adm3_en', parent_fields=['adm1_en'], results_table=RESULTS_TABLE)
+        self.cursor.execute(f"""
+            SELECT parent_path, area_name, ST_NumGeometries(geom), ST_Area(geom) FROM {RESULTS_TABLE}
+            WHERE admin_level = 'adm3_en' ORDER BY parent_path, area_name
+        """)
+        self.assertEqual(self.cursor.fetchall(), [
+            ('North', 'a', 1, 1.0), ('North', 'b', 1, 1.0), ('South', 'a', 1, 1.0), ('South', 'c', 2, 2.0)
+        ])
+
+    def interrupt_after_first_chunk(self):
+        """Run a chunked calculation of one area per chunk that fails after committing its first chunk."""
+        count = engine.checkpoint_areas
+        calls = []
+
+        def count_then_fail(*args, **kwargs):
+            calls.append(None)
+            if len(calls) > 1:
+                raise RuntimeError("interrupted")
+            return count(*args, **kwargs)
+
+        with mock.patch.object(engine, 'checkpoint_areas', side_effect=count_then_fail):
+            with self.assertRaises(RuntimeError):
+                self.calculate_in_chunks()
+        self.connection.rollback()
+
+    def calculate_in_chunks(self):
+        """Run a chunked calculation of one area per chunk and commit it."""
+        results = calculate_deficits_in_chunks(
+            self.cursor, 'engine_test_city', 'engine_test_schools', 'pop', 1000, area_field='adm3_en',
+            parent_fields=['adm1_en'], results_table=RESULTS_TABLE, chunk_size=1
+        )
+        self.connection.commit()
+        return results
+
+    def checkpointed_areas(self):
+        """Return the area keys checkpointed for the test layers by any run."""
+        run_id = engine.run_key('engine_test_city', 'engine_test_schools', 'pop', 'adm3_en', ['adm1_en'])
+        self.cursor.execute(f"SELECT DISTINCT area_key FROM {CHECKPOINT_TABLE} WHERE run_id LIKE %s ORDER BY 1",
+                            [run_id.split(':')[0] + ':%'])
+        return [row[0] for row in self.cursor.fetchall()]
+
+    def test_resumed_run_matches_a_plain_run(self):
+        """A run interrupted after one chunk resumes from its checkpoint and gives the plain results."""
+        self.interrupt_after_first_chunk()
+        self.assertEqual(self.checkpointed_areas(), ['a'])
+
+        with mock.patch.object(engine, 'checkpoint_areas', wraps=engine.checkpoint_areas) as counted:
+            results = self.calculate_in_chunks()
+        self.assertEqual(counted.call_count, 2)
+        self.assertEqual(self.checkpointed_areas(), [])
+        plain = calculate_deficits(self.cursor, 'engine_test_city', 'engine_test_schools', 'pop', 1000,
+                                   area_field='adm3_en', parent_fields=['adm1_en'], results_table=RESULTS_TABLE)
+        self.assertEqual(results, plain)
+
+    def test_changed_data_invalidates_checkpoints(self):
+        """Checkpoints counted before the layer changed are not resumed."""
+        self.interrupt_after_first_chunk()
+        self.cursor.execute("UPDATE engine_test_city SET pop = 3000 WHERE adm3_en = 'a' AND adm1_en = 'North'")
+        self.connection.commit()
+
+        with mock.patch.object(engine, 'checkpoint_areas', wraps=engine.checkpoint_areas) as counted:
+            results = self.calculate_in_chunks()
+        self.assertEqual(counted.call_count, 3)
+        self.assertIn(['adm3_en', 'a', 3, 1, 2, 'North'], results)
+        self.assertEqual(self.checkpointed_areas(), [])
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(EngineTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
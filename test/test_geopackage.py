@@ -0,0 +1,200 @@
+# coding=utf-8
+"""GeoPackage backend test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'bsc-inf-01-20@unima.ac.mw'
+__date__ = '2026-10-19'
+__copyright__ = 'Copyright 2024, bsc-inf-01-20'
+
+import os
+import shutil
+import sqlite3
+import struct
+import tempfile
+import unittest
+
+import numpy as np
+
+from geopackage import (
+    PointIndex, calculate_deficits, chunk_shape, geometry_blob, point_index, points_in_polygons, read_geometry,
+    read_points, rollup_counts
+)
+
+
+def point_blob(x, y, srs_id=32736):
+    """Encode a point as a GeoPackage geometry blob without envelope."""
+    return b'GP' + struct.pack('<BBi', 0, 0x01, srs_id) + struct.pack('<BIdd', 1, 1, x, y)
+
+
+def square(x, y, size):
+    """Return the rings of a square polygon."""
+    return [np.array([[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]], dtype=float)]
+
+
+class GeoPackageTest(unittest.TestCase):
+    """Test the offline GeoPackage backend."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.connection = sqlite3.connect(':memory:')
+        self.connection.executescript("""
+            CREATE TABLE gpkg_contents (table_name TEXT PRIMARY KEY, data_type TEXT, identifier TEXT, srs_id INTEGER);
+            CREATE TABLE gpkg_geometry_columns (
+                table_name TEXT, column_name TEXT, geometry_type_name TEXT, srs_id INTEGER, z INTEGER, m INTEGER,
+                PRIMARY KEY (table_name, column_name)
+            );
+            CREATE TABLE city (fid INTEGER PRIMARY KEY, geom BLOB, adm2_en TEXT, adm3_en TEXT, pop INTEGER);
+            CREATE TABLE schools (fid INTEGER PRIMARY KEY, geom BLOB);
+            CREATE VIRTUAL TABLE rtree_schools_geom USING rtree(id, minx, maxx, miny, maxy);
+            INSERT INTO gpkg_geometry_columns VALUES ('city', 'geom', 'MULTIPOLYGON', 32736, 0, 0);
+            INSERT INTO gpkg_geometry_columns VALUES ('schools', 'geom', 'POINT', 32736, 0, 0);
+        """)
+        areas = [('North', 'A', 4000, square(0, 0, 10)), ('North', 'B', 1000, square(10, 0, 10)), ('South', 'C', 3000, square(0, 20, 10))]
+        for district, area, population, rings in areas:
+            self.connection.execute(
+                "INSERT INTO city (geom, adm2_en, adm3_en, pop) VALUES (?, ?, ?, ?)",
+                [geometry_blob([rings], 32736), district, area, population]
+            )
+        for fid, (x, y) in enumerate([(1, 1), (2, 2), (15, 5), (50, 50)], start=1):
+            self.connection.execute("INSERT INTO schools VALUES (?, ?)", [fid, point_blob(x, y)])
+            self.connection.execute("INSERT INTO rtree_schools_geom VALUES (?, ?, ?, ?, ?)", [fid, x, x, y, y])
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.connection.close()
+
+    def test_geometry_round_trip(self):
+        """A written multipolygon blob reads back to the same rings."""
+        rings = square(0, 0, 5)
+        polygons = read_geometry(geometry_blob([rings], 4326))
+        np.testing.assert_array_equal(polygons[0][0], rings[0])
+
+    def test_multilinestring_reads_as_lines(self):
+        """Every line of a multilinestring is read as its own vertex array, with Z dropped."""
+        line = struct.pack('<BII', 1, 1002, 2) + np.array([[0, 0, 9], [1, 1, 9]], dtype='<f8').tobytes()
+        blob = b'GP' + struct.pack('<BBi', 0, 0x01, 4326) + struct.pack('<BII', 1, 5, 2) + line + line
+        lines = read_geometry(blob)
+        self.assertEqual(len(lines), 2)
+        np.testing.assert_array_equal(lines[1], [[0, 0], [1, 1]])
+
+    def test_multipoints_are_flattened(self):
+        """Every point of a multipoint school is read as a point of its own."""
+        multipoint = (b'GP' + struct.pack('<BBi', 0, 0x01, 32736) + struct.pack('<BII', 1, 4, 2)
+                      + struct.pack('<BIdd', 1, 1, 3, 4) + struct.pack('<BIdd', 1, 1, 5, 6))
+        self.connection.execute("INSERT INTO schools VALUES (5, ?)", [multipoint])
+        points = read_points(self.connection, 'schools', 'geom')
+        self.assertEqual(points.tolist()[-2:], [[3, 4], [5, 6]])
+
+    def test_points_in_polygon_with_hole(self):
+        """Points inside a hole are outside the polygon."""
+        rings = square(0, 0, 10) + square(4, 4, 2)
+        inside = points_in_polygons([[1, 1], [5, 5], [11, 1]], [rings])
+        self.assertEqual(inside.tolist(), [True, False, False])
+
+    def test_many_vertex_polygon_is_tested_in_bounded_blocks(self):
+        """A polygon of many vertices is split over edges too, with the same result."""
+        angles = np.linspace(0, 2 * np.pi, 50001)
+        ring = np.column_stack([np.cos(angles), np.sin(angles)]) * 10
+        ring[-1] = ring[0]
+        points = np.random.default_rng(0).uniform(-12, 12, (5000, 2))
+        point_block, edge_block = chunk_shape(len(points), len(ring) - 1, 10000)
+        self.assertLessEqual(point_block * edge_block, 10000)
+        self.assertEqual((point_block, edge_block), (1, 10000))
+        inside = points_in_polygons(points, [[ring]], max_elements=10000)
+        expected = np.hypot(points[:, 0], points[:, 1]) < 10
+        near_edge = np.abs(np.hypot(points[:, 0], points[:, 1]) - 10) < 1e-3
+        np.testing.assert_array_equal(inside[~near_edge], expected[~near_edge])
+        self.assertEqual(chunk_shape(5000, 4, 10000), (2500, 4))
+
+    def test_point_index_query(self):
+        """The index returns exactly the points inside a box, also after a memory-mapped round trip."""
+        points = np.random.default_rng(0).uniform(0, 100, (5000, 2))
+        directory = tempfile.mkdtemp()
+        try:
+            PointIndex.build(points).save(directory)
+            index = PointIndex.load(directory)
+            for bounds in [(10, 20, 30, 25), (-5, -5, 0.5, 100), (99, 99, 200, 200), (150, 0, 160, 10)]:
+                minx, miny, maxx, maxy = bounds
+                expected = points[(points[:, 0] >= minx) & (points[:, 0] <= maxx)
+                                  & (points[:, 1] >= miny) & (points[:, 1] <= maxy)]
+                found = index.query(bounds)
+                self.assertEqual(sorted(map(tuple, found)), sorted(map(tuple, expected)))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_point_index_is_cached_until_the_layer_changes(self):
+        """A file GeoPackage reuses its cached index until a school is moved."""
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'layers.gpkg')
+            connection = sqlite3.connect(path)
+            self.connection.commit()
+            self.connection.backup(connection)
+            cache = os.path.join(directory, 'indexes')
+            point_index(connection, 'schools', 'geom', cache)
+            self.assertEqual(len(point_index(connection, 'schools', 'geom', cache).query((0, 0, 100, 100))), 4)
+            self.assertEqual(len(os.listdir(cache)), 1)
+
+            connection.execute("UPDATE schools SET geom = ? WHERE fid = 4", [point_blob(5, 5)])
+            connection.execute("UPDATE rtree_schools_geom SET minx = 5, maxx = 5, miny = 5, maxy = 5 WHERE id = 4")
+            self.assertEqual(len(point_index(connection, 'schools', 'geom', cache).query((0, 0, 10, 10))), 3)
+            # The index of the earlier version of the layer is evicted
+            self.assertEqual(len(os.listdir(cache)), 1)
+            connection.close()
+        finally:
+            shutil.rmtree(directory)
+
+    def test_calculate_deficits(self):
+        """Deficits are counted per area, rolled up and stored in the GeoPackage."""
+        results = calculate_deficits(self.connection, 'city', 'schools', 'pop', 1000, parent_fields=['adm2_en'])
+        self.assertEqual(results, [
+            ['total', 'total', 8, 3, 5, ''],
+            ['adm2_en', 'North', 5, 3, 2, ''],
+            ['adm2_en', 'South', 3, 0, 3, ''],
+            ['adm3_en', 'A', 4, 2, 2, 'North'],
+            ['adm3_en', 'B', 1, 1, 0, 'North'],
+            ['adm3_en', 'C', 3, 0, 3, 'South'],
+        ])
+        stored = self.connection.execute("SELECT COUNT(*) FROM results_table").fetchone()[0]
+        self.assertEqual(stored, 6)
+
+    def test_empty_geometries_are_skipped(self):
+        """Areas with an empty geometry are left out instead of failing the run."""
+        self.connection.execute("INSERT INTO city (geom, adm2_en, adm3_en, pop) VALUES (?, 'South', 'D', 500)",
+                                [geometry_blob([], 32736)])
+        self.connection.execute("INSERT INTO city (geom, adm2_en, adm3_en, pop) VALUES (?, 'South', 'E', 500)",
+                                [geometry_blob([[np.empty((0, 2))]], 32736)])
+        results = calculate_deficits(self.connection, 'city', 'schools', 'pop', 1000, parent_fields=['adm2_en'])
+        self.assertEqual(results[0], ['total', 'total', 8, 3, 5, ''])
+        self.assertNotIn('D', [row[1] for row in results])
+
+    def test_features_of_one_area_are_summed_first(self):
+        """Two features of one area need the schools of their summed population, as in the database."""
+        rows = rollup_counts([('a', 400, 0, []), ('a', 400, 0, [])], 1000, 'adm3_en')
+        self.assertEqual([row[:6] for row in rows], [['total', 'total', 1, 0, 1, ''], ['adm3_en', 'a', 1, 0, 1, '']])
+
+    def test_areas_of_the_same_name_stay_apart(self):
+        """An area named like one under another parent gets its own row, told apart by its parent path."""
+        self.connection.execute(
+            "INSERT INTO city (geom, adm2_en, adm3_en, pop) VALUES (?, 'South', 'A', 2000)",
+            [geometry_blob([square(10, 20, 10)], 32736)]
+        )
+        results = calculate_deficits(self.connection, 'city', 'schools', 'pop', 1000, parent_fields=['adm2_en'])
+        self.assertEqual([row for row in results if row[1] == 'A'], [
+            ['adm3_en', 'A', 4, 2, 2, 'North'],
+            ['adm3_en', 'A', 2, 0, 2, 'South'],
+        ])
+        stored = self.connection.execute("SELECT COUNT(*) FROM results_table WHERE area_name = 'A'").fetchone()[0]
+        self.assertEqual(stored, 2)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(GeoPackageTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,67 @@
+# coding=utf-8
+"""Grid analysis test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'bsc-inf-01-20@unima.ac.mw'
+__date__ = '2026-10-19'
+__copyright__ = 'Copyright 2024, bsc-inf-01-20'
+
+import unittest
+
+import numpy as np
+
+from grid import HEXAGON, SQUARE, cell_centres, grid_deficits, hexagon_cells, square_cells
+
+
+class GridTest(unittest.TestCase):
+    """Test schools are hashed to the cells PostGIS generates."""
+
+    def test_hexagon_cells_match_nearest_centre(self):
+        """Every point falls in the hexagon with the nearest centre."""
+        points = np.random.default_rng(7).uniform(-5000, 5000, (2000, 2))
+        i, j = hexagon_cells(points, 250)
+        candidates_i, candidates_j = np.meshgrid(np.arange(-30, 31), np.arange(-30, 31))
+        centres = cell_centres(candidates_i.ravel(), candidates_j.ravel(), 250, HEXAGON)
+        nearest = np.argmin(((points[:, None, :] - centres[None, :, :]) ** 2).sum(axis=2), axis=1)
+        np.testing.assert_array_equal(i, candidates_i.ravel()[nearest])
+        np.testing.assert_array_equal(j, candidates_j.ravel()[nearest])
+
+    def test_square_cells(self):
+        """Square cells are floored coordinates, also below the origin."""
+        i, j = square_cells([[10, 990], [-1, 1000]], 1000)
+        np.testing.assert_array_equal(i, [0, -1])
+        np.testing.assert_array_equal(j, [0, 1])
+
+    def test_square_centres_fall_in_their_cells(self):
+        """Cell centres hash back to their own cells."""
+        i, j = square_cells(cell_centres([0, -3], [2, -1], 500, SQUARE), 500)
+        np.testing.assert_array_equal(i, [0, -3])
+        np.testing.assert_array_equal(j, [2, -1])
+
+    def test_grid_deficits(self):
+        """Schools are counted in their populated cell and unpopulated cells are ignored."""
+        cells = grid_deficits(
+            np.array([0, 1, 0]), np.array([0, 0, 1]), np.array([2400.0, 600.0, 0.0]),
+            np.array([[10, 10], [20, 20], [1500, 10], [5000, 5000]]), 1000, SQUARE, 1000
+        )
+        np.testing.assert_array_equal(cells['available_schools'], [2, 1, 0])
+        np.testing.assert_array_equal(cells['required_schools'], [2, 1, 0])
+        np.testing.assert_array_equal(cells['schools_to_add'], [0, 0, 0])
+        self.assertEqual(cells.itemsize, 24)
+
+    def test_hexagon_deficits(self):
+        """Hexagon cells are matched by their hashed indices."""
+        cells = grid_deficits(np.array([2]), np.array([-1]), np.array([3000.0]), cell_centres([2], [-1], 100, HEXAGON), 100, HEXAGON, 1000)
+        self.assertEqual(cells['schools_to_add'][0], 2)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(GridTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
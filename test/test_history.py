@@ -0,0 +1,72 @@
+# coding=utf-8
+"""Run history test.
+
+Runs against a local PostGIS database given as a libpq connection string in
+ADDITIONAL_SCHOOLS_WRITE_DSN; it is skipped otherwise. Everything is rolled
+back afterwards, so the history already in the database is kept.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'bsc-inf-01-20@unima.ac.mw'
+__date__ = '2026-10-19'
+__copyright__ = 'Copyright 2024, bsc-inf-01-20'
+
+import os
+import unittest
+
+import psycopg2
+
+from history import diff_runs, list_runs, partition_name, prune_runs, record_run
+
+WRITE_DSN = os.environ.get('ADDITIONAL_SCHOOLS_WRITE_DSN')
+
+
+@unittest.skipUnless(WRITE_DSN, "needs a local PostGIS database")
+class HistoryTest(unittest.TestCase):
+    """Test runs are recorded in partitions, compared and pruned."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.connection = psycopg2.connect(WRITE_DSN)
+        self.cursor = self.connection.cursor()
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.connection.rollback()
+        self.connection.close()
+
+    def test_record_diff_and_prune(self):
+        """Changed and one-sided areas are reported, and pruning drops the partition of the old run."""
+        old_run = record_run(self.cursor, {'people_per_school': 500}, [
+            ['total', 'total', 5, 3, 2, ''],
+            ['adm3_en', 'a', 2, 0, 2, 'North'],
+            ['adm3_en', 'gone', 1, 1, 0, 'North'],
+        ])
+        new_run = record_run(self.cursor, {'people_per_school': 400}, [
+            ['total', 'total', 6, 3, 3, ''],
+            ['adm3_en', 'a', 2, 0, 2, 'North'],
+            ['adm3_en', 'new', 1, 0, 1, 'South'],
+        ])
+        self.assertEqual(diff_runs(self.cursor, old_run, new_run), [
+            ('adm3_en', 'gone', 1, None, 1, None, 0, None, 'North'),
+            ('adm3_en', 'new', None, 1, None, 0, None, 1, 'South'),
+            ('total', 'total', 5, 6, 3, 3, 2, 3, ''),
+        ])
+
+        pruned = prune_runs(self.cursor, keep_last=1)
+        self.assertIn(old_run, pruned)
+        self.assertNotIn(new_run, pruned)
+        self.assertEqual(list_runs(self.cursor)[0][0], new_run)
+        self.cursor.execute("SELECT to_regclass(%s), to_regclass(%s)", [partition_name(old_run), partition_name(new_run)])
+        self.assertEqual(self.cursor.fetchone(), (None, partition_name(new_run)))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(HistoryTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
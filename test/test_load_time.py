@@ -0,0 +1,91 @@
+# coding=utf-8
+"""Plugin load cost test.
+
+QGIS imports every enabled plugin and calls its classFactory at startup, so
+loading the plugin must stay cheap and must not pull in the libraries only
+the dialog needs.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'bsc-inf-01-20@unima.ac.mw'
+__date__ = '2026-10-19'
+__copyright__ = 'Copyright 2024, bsc-inf-01-20'
+
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The probe loads the plugin next to the QGIS modules, so it needs the QGIS Python bindings
+QGIS_AVAILABLE = importlib.util.find_spec('qgis') is not None
+
+# Seconds classFactory may take on top of the QGIS modules already loaded by QGIS
+LOAD_BUDGET_SECONDS = 0.25
+
+# Modules that may only be imported once the dialog is opened
+LAZY_MODULES = ['psycopg2', 'numpy', 'additional_schools_dialog']
+
+PROBE = """
+import json, sys, time
+import qgis.core, qgis.PyQt.QtCore, qgis.PyQt.QtWidgets
+sys.path.insert(0, {parent!r})
+before = set(sys.modules)
+start = time.perf_counter()
+__import__({package!r}).classFactory(None)
+print(json.dumps({{'seconds': time.perf_counter() - start, 'modules': sorted(set(sys.modules) - before)}}))
+"""
+
+
+def slowest_imports(importtime_output, count=5):
+    """Return the ``count`` imports with the largest cumulative time in ``-X importtime`` output."""
+    imports = []
+    for line in importtime_output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+@unittest.skipUnless(QGIS_AVAILABLE, "needs the QGIS Python bindings")
+class LoadTimeTest(unittest.TestCase):
+    """Test the cost of loading the plugin."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Load the plugin in a fresh interpreter, as QGIS does at startup."""
+        probe = PROBE.format(parent=os.path.dirname(PLUGIN_DIR), package=os.path.basename(PLUGIN_DIR))
+        process = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', probe], capture_output=True, text=True, check=True
+        )
+        cls.load = json.loads(process.stdout)
+        cls.importtime = process.stderr
+
+    def test_load_within_budget(self):
+        """classFactory stays within the load budget."""
+        self.assertLess(
+            self.load['seconds'], LOAD_BUDGET_SECONDS,
+            f"Slowest imports (us, module): {slowest_imports(self.importtime)}"
+        )
+
+    def test_heavy_modules_are_lazy(self):
+        """The dialog and its libraries are not imported by classFactory."""
+        loaded = [
+            module for module in self.load['modules']
+            if module.split('.')[0] in LAZY_MODULES or module.split('.')[-1] in LAZY_MODULES
+        ]
+        self.assertEqual(loaded, [])
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(LoadTimeTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,71 @@
+# coding=utf-8
+"""Road network cache test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'bsc-inf-01-20@unima.ac.mw'
+__date__ = '2026-10-19'
+__copyright__ = 'Copyright 2024, bsc-inf-01-20'
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from .utilities import plugin_module
+
+network = plugin_module('network')
+
+
+class NetworkTest(unittest.TestCase):
+    """Test the graphs of road layers are cached per version of the file."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'roads.gpkg')
+        with open(self.path, 'wb') as roads:
+            roads.write(b'roads')
+        self.cache = os.path.join(self.directory, 'graphs')
+        lines = [np.array([[0, 0], [100, 0], [200, 0]], dtype=float)]
+        patcher = mock.patch.object(network, 'read_roads', return_value=(lines, 32736, False))
+        self.read_roads = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.directory)
+
+    def test_graph_is_cached_until_the_file_changes(self):
+        """The cached graph is loaded while the file is unchanged, and replaced once it is edited."""
+        network.load_graph(self.path, 'roads', self.cache)
+        graph = network.load_graph(self.path, 'roads', self.cache)
+        self.assertEqual(self.read_roads.call_count, 1)
+        self.assertEqual(len(graph.nodes), 3)
+
+        with open(self.path, 'ab') as roads:
+            roads.write(b' edited')
+        network.load_graph(self.path, 'roads', self.cache)
+        self.assertEqual(self.read_roads.call_count, 2)
+        # The graph of the earlier version of the file is evicted
+        self.assertEqual(os.listdir(self.cache), [os.path.basename(network.cache_path(self.path, 'roads', self.cache))])
+
+    def test_other_layers_are_kept(self):
+        """Caching the graph of one layer leaves the graphs of other layers."""
+        network.load_graph(self.path, 'roads', self.cache)
+        network.load_graph(self.path, 'tracks', self.cache)
+        self.assertEqual(len(os.listdir(self.cache)), 2)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(NetworkTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
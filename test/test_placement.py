@@ -0,0 +1,75 @@
+# coding=utf-8
+"""Site placement test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'bsc-inf-01-20@unima.ac.mw'
+__date__ = '2026-10-19'
+__copyright__ = 'Copyright 2024, bsc-inf-01-20'
+
+import unittest
+
+import numpy as np
+
+from placement import pairs_within, coverage_matrix, greedy_max_coverage, nearest_points
+
+
+class PlacementTest(unittest.TestCase):
+    """Test the maximal coverage placement engine."""
+
+    def test_pairs_within_matches_brute_force(self):
+        """Grid hashing finds the same pairs as comparing every point."""
+        rng = np.random.default_rng(1)
+        centres = rng.random((200, 2)) * 1000
+        points = rng.random((300, 2)) * 1000
+        centre_index, point_index = pairs_within(centres, points, 75)
+        distance = np.hypot(*(centres[:, None, :] - points[None, :, :]).transpose(2, 0, 1))
+        expected = set(zip(*np.nonzero(distance <= 75)))
+        self.assertEqual(set(zip(centre_index, point_index)), expected)
+
+    def test_nearest_points_matches_brute_force(self):
+        """Widening the search radius finds the same nearest centre as comparing every point."""
+        rng = np.random.default_rng(2)
+        centres = rng.random((50, 2)) * 1000
+        # Some points lie far outside the centres, so the search radius has to grow
+        points = np.vstack([rng.random((400, 2)) * 1000, rng.random((20, 2)) * 10000])
+        index, distance = nearest_points(centres, points)
+        gaps = np.hypot(*(centres[:, None, :] - points[None, :, :]).transpose(2, 0, 1))
+        np.testing.assert_allclose(distance, gaps.min(axis=0))
+        np.testing.assert_allclose(gaps[index, np.arange(len(points))], gaps.min(axis=0))
+
+    def test_greedy_prefers_uncovered_population(self):
+        """The second site goes to the cluster the first one left uncovered."""
+        demand = np.array([[0, 0], [10, 0], [1000, 0]], dtype=float)
+        weights = np.array([50, 50, 60], dtype=float)
+        indptr, indices = coverage_matrix(demand, demand, 20)
+        selected = greedy_max_coverage(weights, indptr, indices, 2)
+        self.assertEqual([candidate for candidate, gain in selected][1], 2)
+        self.assertEqual([gain for candidate, gain in selected], [100, 60])
+
+    def test_demand_without_population_has_no_weight(self):
+        """An area with a NULL population does not upset the order of the other sites."""
+        demand = np.array([[0, 0], [1000, 0], [2000, 0], [3000, 0], [4000, 0]], dtype=float)
+        weights = np.array([None, 10, 30, 40, 20], dtype=float)
+        indptr, indices = coverage_matrix(demand, demand, 20)
+        selected = greedy_max_coverage(weights, indptr, indices, 3)
+        self.assertEqual(selected, [(3, 40), (2, 30), (4, 20)])
+
+    def test_existing_schools_cover_demand(self):
+        """Demand already covered by a school does not attract a new site."""
+        demand = np.array([[0, 0], [1000, 0]], dtype=float)
+        weights = np.array([100, 10], dtype=float)
+        indptr, indices = coverage_matrix(demand, demand, 20)
+        selected = greedy_max_coverage(weights, indptr, indices, 1, covered=[True, False])
+        self.assertEqual(selected[0][0], 1)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(PlacementTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
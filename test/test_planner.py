@@ -0,0 +1,65 @@
+# coding=utf-8
+"""Execution planner test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'bsc-inf-01-20@unima.ac.mw'
+__date__ = '2026-10-19'
+__copyright__ = 'Copyright 2024, bsc-inf-01-20'
+
+import unittest
+
+from planner import CHUNKED, MAX_CHUNK_SIZE, PARALLEL, PLAIN, SUBDIVIDE_VERTICES, choose_plan
+
+
+def statistics(city_rows, schools_rows, mean_vertices=50, max_vertices=200, schools_indexed=True):
+    """Return table statistics as gathered by diagnostics.table_statistics."""
+    return {
+        'city_rows': city_rows, 'schools_rows': schools_rows, 'schools_indexed': schools_indexed,
+        'mean_vertices': mean_vertices, 'max_vertices': max_vertices,
+    }
+
+
+class PlannerTest(unittest.TestCase):
+    """Test the strategy follows the size of the layers."""
+
+    def test_small_layers_use_one_query(self):
+        """A small city is counted in one set query."""
+        plan = choose_plan(statistics(50, 2000), cpu_count=8)
+        self.assertEqual((plan.strategy, plan.chunk_size, plan.workers, plan.max_vertices), (PLAIN, 0, 1, 0))
+
+    def test_many_schools_run_in_parallel(self):
+        """A million schools are counted on several connections, capped by the processors."""
+        plan = choose_plan(statistics(300, 2000000), cpu_count=4)
+        self.assertEqual((plan.strategy, plan.workers), (PARALLEL, 2))
+        plan = choose_plan(statistics(40000, 2000000), cpu_count=4)
+        self.assertEqual((plan.strategy, plan.workers), (PARALLEL, 4))
+
+    def test_huge_cities_are_chunked(self):
+        """Very many areas are counted in resumable chunks."""
+        plan = choose_plan(statistics(200000, 100000))
+        self.assertEqual((plan.strategy, plan.chunk_size), (CHUNKED, 4000))
+
+    def test_unindexed_schools_are_not_scanned_in_parallel(self):
+        """Without a spatial index the schools are counted in one query, or in the largest chunks."""
+        plan = choose_plan(statistics(300, 2000000, schools_indexed=False), cpu_count=4)
+        self.assertEqual((plan.strategy, plan.workers), (PLAIN, 1))
+        plan = choose_plan(statistics(200000, 100000, schools_indexed=False))
+        self.assertEqual((plan.strategy, plan.chunk_size), (CHUNKED, MAX_CHUNK_SIZE))
+
+    def test_complex_areas_are_subdivided(self):
+        """Areas with many vertices are subdivided and missing indexes are reported."""
+        plan = choose_plan(statistics(50, 2000, mean_vertices=3000, schools_indexed=False))
+        self.assertEqual(plan.max_vertices, SUBDIVIDE_VERTICES)
+        self.assertTrue(any('spatial index' in reason for reason in plan.reasons))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(PlannerTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
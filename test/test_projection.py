@@ -0,0 +1,56 @@
+# coding=utf-8
+"""Population projection test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'bsc-inf-01-20@unima.ac.mw'
+__date__ = '2026-10-19'
+__copyright__ = 'Copyright 2024, bsc-inf-01-20'
+
+import unittest
+
+import numpy as np
+
+from .utilities import plugin_module
+
+projection = plugin_module('projection')
+
+
+class ProjectionTest(unittest.TestCase):
+    """Test deficits are projected for every area, level and year."""
+
+    KEYS = [('North', 'a'), ('North', 'b'), ('South', 'c')]
+
+    def test_project_population(self):
+        """Population compounds yearly at the area rate."""
+        projected = projection.project_population([1000, 200], [0.1, 0.0], [0, 1, 2])
+        np.testing.assert_allclose(projected, [[1000, 1100, 1210], [200, 200, 200]])
+
+    def test_growth_rate_precedence(self):
+        """Area rates win over level rates, which win over the global rate."""
+        rates = projection.area_growth_rates(
+            self.KEYS, 0.03, 'adm3', ['adm1'],
+            area_rates={'a': 0.05, 'b': None},
+            level_rates={('adm1', 'South'): 0.0, ('adm1', 'North'): 0.02}
+        )
+        np.testing.assert_allclose(rates, [0.05, 0.02, 0.0])
+
+    def test_projection_rows(self):
+        """Levels sum the areas' population and schools to add for every year."""
+        rows = projection.projection_rows(self.KEYS, [1000, 500, 800], [0, 1, 2], [0.05, 0.03, 0.0], 2026, 2, 500, 'adm3', ['adm1'])
+        by_key = {row[:3]: row[3:] for row in rows}
+        self.assertEqual(len(rows), (1 + 2 + 3) * 3)
+        self.assertEqual(by_key[('adm3', 'a', 2028)], (1103.0, 2, 0, 2, 'North'))
+        self.assertEqual(by_key[('adm1', 'North', 2026)], (1500.0, 3, 1, 2, ''))
+        self.assertEqual(by_key[('total', 'total', 2027)], (2365.0, 5, 3, 2, ''))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(ProjectionTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,93 @@
+# coding=utf-8
+"""Road network graph test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'bsc-inf-01-20@unima.ac.mw'
+__date__ = '2026-10-19'
+__copyright__ = 'Copyright 2024, bsc-inf-01-20'
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from roadgraph import RoadGraph, build_graph, distances, shortest_times, unserved_population
+
+
+def grid_lines(size, spacing):
+    """Return the horizontal and vertical streets of a square grid of ``size`` by ``size`` junctions."""
+    ticks = np.arange(size) * spacing
+    lines = [np.column_stack([ticks, np.full(size, y)]) for y in ticks]
+    lines += [np.column_stack([np.full(size, x), ticks]) for x in ticks]
+    return lines
+
+
+class RoadGraphTest(unittest.TestCase):
+    """Test the CSR road graph and the multi-source travel times."""
+
+    def test_streets_meet_at_shared_junctions(self):
+        """Crossing streets share their junction nodes and every segment is an edge both ways."""
+        graph = build_graph(grid_lines(3, 100), 32736, False)
+        self.assertEqual(len(graph.nodes), 9)
+        self.assertEqual(len(graph.indices), 24)
+        np.testing.assert_allclose(graph.lengths, 100)
+
+    def test_times_follow_the_streets(self):
+        """Travel times are Manhattan distances on a street grid, from the nearer school."""
+        graph = build_graph(grid_lines(5, 100), 32736, False)
+        nodes = {tuple(node): index for index, node in enumerate(graph.nodes.tolist())}
+        sources = [nodes[(0.0, 0.0)], nodes[(400.0, 400.0)]]
+        # 3.6 km/h is one metre per second, so times are metres
+        times = shortest_times(graph, sources, [0, 50], 3.6)
+        manhattan = np.minimum(graph.nodes.sum(axis=1), 50 + (800 - graph.nodes.sum(axis=1)))
+        np.testing.assert_allclose(times, manhattan, rtol=1e-5, atol=1e-3)
+
+    def test_limit_leaves_far_nodes_unreached(self):
+        """Nodes beyond the limit stay at infinity."""
+        graph = build_graph([np.array([[0, 0], [100, 0], [200, 0]], dtype=float)], 32736, False)
+        times = shortest_times(graph, [0], [0], 3.6, limit=150)
+        self.assertEqual(np.isinf(times).sum(), 1)
+
+    def test_parallel_edges_keep_the_shortest(self):
+        """Of two roads between the same junctions only the shorter one is used."""
+        lines = [np.array([[0, 0], [100, 0]], dtype=float), np.array([[0, 0], [50, 50], [100, 0]], dtype=float)]
+        lines.append(np.array([[0, 0], [100, 0]], dtype=float))
+        graph = build_graph(lines, 32736, False)
+        self.assertEqual(len(graph.indices), 6)
+
+    def test_great_circle_distances(self):
+        """A degree of latitude is about 111 km."""
+        self.assertAlmostEqual(distances([[35, -15]], [[35, -14]], True)[0] / 1000, 111.2, places=1)
+
+    def test_unserved_population_per_area(self):
+        """Only population further than the threshold counts, summed per area."""
+        unserved = unserved_population(['A', 'A', 'B'], [10, np.inf, 5], [100, 50, 30], 8)
+        self.assertEqual(unserved, {'A': 150.0, 'B': 0.0})
+
+    def test_same_named_areas_stay_apart(self):
+        """Areas of the same name under different parents keep their own unserved population."""
+        keys = [('North', 'A'), ('South', 'A'), ('South', 'A')]
+        unserved = unserved_population(keys, [np.inf, np.inf, 1], [100, 40, 30], 8)
+        self.assertEqual(unserved, {('North', 'A'): 100.0, ('South', 'A'): 40.0})
+
+    def test_graph_round_trips_through_the_cache_file(self):
+        """A saved graph loads back unchanged."""
+        graph = build_graph(grid_lines(3, 100), 4326, True)
+        path = os.path.join(tempfile.mkdtemp(), 'graph.npz')
+        graph.save(path)
+        loaded = RoadGraph.load(path)
+        np.testing.assert_array_equal(loaded.indices, graph.indices)
+        self.assertEqual((loaded.srid, loaded.geographic), (4326, True))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(RoadGraphTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,134 @@
+# coding=utf-8
+"""Deficit service test.
+
+The HTTP round trip runs against a local PostGIS database given as a libpq
+connection string in ADDITIONAL_SCHOOLS_WRITE_DSN; it is skipped otherwise.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'bsc-inf-01-20@unima.ac.mw'
+__date__ = '2026-10-19'
+__copyright__ = 'Copyright 2024, bsc-inf-01-20'
+
+import json
+import os
+import threading
+import unittest
+from urllib.request import urlopen
+
+from psycopg2.pool import ThreadedConnectionPool
+
+from service import DeficitService, LatencyMetrics, LRUCache, area_deficits, create_server
+
+WRITE_DSN = os.environ.get('ADDITIONAL_SCHOOLS_WRITE_DSN')
+
+
+class ServiceTest(unittest.TestCase):
+    """Test deficits are answered from cached counts."""
+
+    ROWS = [('North', 'a', 1000.0, 0), ('North', 'b', 500.0, 1), ('South', 'c', 800.0, 2)]
+
+    def test_lru_cache_evicts_least_recently_used(self):
+        """A full cache drops the entry used longest ago, and entries expire after their time to live."""
+        now = [0]
+        cache = LRUCache(maxsize=2, ttl=10, clock=lambda: now[0])
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        now[0] = 11
+        self.assertIsNone(cache.get('c'))
+        self.assertEqual(cache.stats(), {'size': 1, 'maxsize': 2, 'hits': 2, 'misses': 2})
+
+    def test_latency_percentiles(self):
+        """Latencies are reported in milliseconds per route."""
+        metrics = LatencyMetrics()
+        for milliseconds in range(1, 101):
+            metrics.record('/deficits', milliseconds / 1000, error=milliseconds > 98)
+        snapshot = metrics.snapshot()['/deficits']
+        self.assertEqual((snapshot['requests'], snapshot['errors']), (100, 2))
+        self.assertEqual((snapshot['p50_ms'], snapshot['p95_ms'], snapshot['max_ms']), (51, 96, 100))
+
+    def test_area_deficits_of_every_level(self):
+        """The roll-up matches the calculation of the dialog."""
+        self.assertEqual(area_deficits(self.ROWS, 500, 'adm3', ['adm1']), [
+            ['total', 'total', 5, 3, 2, ''],
+            ['adm1', 'North', 3, 1, 2, ''],
+            ['adm1', 'South', 2, 2, 0, ''],
+            ['adm3', 'a', 2, 0, 2, 'North'],
+            ['adm3', 'b', 1, 1, 0, 'North'],
+            ['adm3', 'c', 2, 2, 0, 'South'],
+        ])
+
+    def test_area_deficits_of_one_region(self):
+        """Asking for one region returns it and its areas only."""
+        self.assertEqual(area_deficits(self.ROWS, 250, 'adm3', ['adm1'], 'adm1', 'North'), [
+            ['adm1', 'North', 6, 1, 5, ''],
+            ['adm3', 'a', 4, 0, 4, 'North'],
+            ['adm3', 'b', 2, 1, 1, 'North'],
+        ])
+        with self.assertRaises(LookupError):
+            area_deficits(self.ROWS, 250, 'adm3', ['adm1'], 'adm1', 'East')
+        with self.assertRaises(ValueError):
+            area_deficits(self.ROWS, 250, 'adm3', ['adm1'], 'adm2', 'North')
+
+
+@unittest.skipUnless(WRITE_DSN, "needs a local PostGIS database")
+class ServiceDatabaseTest(unittest.TestCase):
+    """Test the service over HTTP against a database."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.pool = ThreadedConnectionPool(1, 4, WRITE_DSN)
+        connection = self.pool.getconn()
+        cursor = connection.cursor()
+        cursor.execute("""
+            CREATE TABLE service_test_city (adm1_en text, adm3_en text, pop integer, geom geometry(Polygon, 4326));
+            CREATE TABLE service_test_schools (geom geometry(Point, 4326));
+            INSERT INTO service_test_city VALUES
+                ('North', 'a', 1000, ST_MakeEnvelope(0, 0, 1, 1, 4326)),
+                ('South', 'c', 800, ST_MakeEnvelope(2, 0, 3, 1, 4326));
+            INSERT INTO service_test_schools VALUES (ST_SetSRID(ST_MakePoint(2.5, 0.5), 4326));
+        """)
+        connection.commit()
+        self.pool.putconn(connection)
+        service = DeficitService(self.pool, 'service_test_city', 'service_test_schools', 'pop', 'adm3_en', ['adm1_en'])
+        self.server = create_server(service, port=0)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.server.shutdown()
+        self.server.server_close()
+        connection = self.pool.getconn()
+        connection.cursor().execute("DROP TABLE service_test_city, service_test_schools")
+        connection.commit()
+        self.pool.closeall()
+
+    def test_deficits_are_cached(self):
+        """A repeated request is answered from the cache and shows in the metrics."""
+        for _ in range(2):
+            with urlopen(f"{self.url}/deficits?ratio=500&level=adm1_en&area=North") as response:
+                results = json.loads(response.read())['results']
+        self.assertEqual(results, [{'admin_level': 'adm1_en', 'area_name': 'North', 'required_schools': 2,
+                                    'available_schools': 0, 'schools_to_add': 2, 'parent_path': ''},
+                                   {'admin_level': 'adm3_en', 'area_name': 'a', 'required_schools': 2,
+                                    'available_schools': 0, 'schools_to_add': 2, 'parent_path': 'North'}])
+        with urlopen(f"{self.url}/metrics") as response:
+            metrics = json.loads(response.read())
+        self.assertEqual(metrics['cache']['hits'], 1)
+        self.assertEqual(metrics['routes']['/deficits']['requests'], 2)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(ServiceTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,41 @@
+# coding=utf-8
+"""Result layer classification test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'bsc-inf-01-20@unima.ac.mw'
+__date__ = '2026-10-19'
+__copyright__ = 'Copyright 2024, bsc-inf-01-20'
+
+import unittest
+
+from styling import class_ranges, distinct_breaks, local_class_breaks
+
+
+class StylingTest(unittest.TestCase):
+    """Test the class breaks of the result layer."""
+
+    def test_local_breaks_are_quantiles(self):
+        """Breaks split the values into equal-count classes like percentile_cont."""
+        self.assertEqual(local_class_breaks(range(11), 5), [0.0, 2.0, 4.0, 6.0, 8.0, 10.0])
+
+    def test_repeated_breaks_are_dropped(self):
+        """Skewed values do not produce empty classes."""
+        self.assertEqual(distinct_breaks([0, 0, 0, 1, 5]), [0.0, 1.0, 5.0])
+        self.assertEqual(distinct_breaks([3, 3]), [3.0, 3.0])
+
+    def test_class_ranges(self):
+        """Each class spans two consecutive breaks."""
+        self.assertEqual(class_ranges([0.0, 1.5, 4.0]), [(0.0, 1.5, "0 - 1.5"), (1.5, 4.0, "1.5 - 4")])
+        self.assertEqual(local_class_breaks([]), [])
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(StylingTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,100 @@
+# coding=utf-8
+"""Subdivided geometry cache test.
+
+Runs against a local PostGIS database given as a libpq connection string in
+ADDITIONAL_SCHOOLS_WRITE_DSN; it is skipped otherwise. Everything is rolled
+back afterwards.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'bsc-inf-01-20@unima.ac.mw'
+__date__ = '2026-10-19'
+__copyright__ = 'Copyright 2024, bsc-inf-01-20'
+
+import os
+import unittest
+
+import psycopg2
+
+from subdivide import refresh_subdivided, subdivided_table
+
+WRITE_DSN = os.environ.get('ADDITIONAL_SCHOOLS_WRITE_DSN')
+CITY_LAYER = 'subdivide_test_city'
+SCHOOLS_LAYER = 'subdivide_test_schools'
+
+
+@unittest.skipUnless(WRITE_DSN, "needs a local PostGIS database")
+class SubdivideTest(unittest.TestCase):
+    """Test the subdivided pieces are cached per source geometry."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.connection = psycopg2.connect(WRITE_DSN)
+        self.cursor = self.connection.cursor()
+        # Circles of 65 vertices, in another SRID than the schools
+        self.cursor.execute(f"""
+            CREATE TABLE {CITY_LAYER} (adm3_en text, geom geometry(Polygon, 4326));
+            CREATE TABLE {SCHOOLS_LAYER} (geom geometry(Point, 3857));
+            INSERT INTO {CITY_LAYER} VALUES
+                ('a', ST_Buffer(ST_SetSRID(ST_MakePoint(0, 0), 4326), 1, 16)),
+                ('b', ST_Buffer(ST_SetSRID(ST_MakePoint(3, 0), 4326), 1, 16));
+        """)
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.connection.rollback()
+        self.connection.close()
+
+    def cached_pieces(self):
+        """Return the row locations of the cached pieces per source hash."""
+        self.cursor.execute(f"SELECT source_hash, array_agg(ctid::text ORDER BY ctid) FROM {subdivided_table(CITY_LAYER)} "
+                            "GROUP BY source_hash")
+        return dict(self.cursor.fetchall())
+
+    def area_hash(self, name):
+        """Return the md5 of the EWKB of an area of the city layer."""
+        self.cursor.execute(f"SELECT md5(ST_AsEWKB(geom)) FROM {CITY_LAYER} WHERE adm3_en = %s", [name])
+        return self.cursor.fetchone()[0]
+
+    def test_pieces_cover_the_areas_in_the_schools_srid(self):
+        """Every area is cut into pieces of at most the vertex limit that together cover it."""
+        table = refresh_subdivided(self.cursor, CITY_LAYER, SCHOOLS_LAYER, max_vertices=16)
+        self.cursor.execute(f"""
+            SELECT count(*) > 2, bool_and(ST_NPoints(piece) <= 16), bool_and(ST_SRID(piece) = 3857),
+                   abs(sum(ST_Area(piece)) - (SELECT sum(ST_Area(ST_Transform(geom, 3857))) FROM {CITY_LAYER})) < 1
+            FROM {table}
+        """)
+        self.assertEqual(self.cursor.fetchone(), (True, True, True, True))
+
+    def test_unchanged_areas_reuse_their_pieces(self):
+        """Only a changed area is subdivided again, and its old pieces are dropped."""
+        refresh_subdivided(self.cursor, CITY_LAYER, SCHOOLS_LAYER, max_vertices=16)
+        before = self.cached_pieces()
+        old_b = self.area_hash('b')
+        self.cursor.execute(f"UPDATE {CITY_LAYER} SET geom = ST_Translate(geom, 1, 0) WHERE adm3_en = 'b'")
+
+        refresh_subdivided(self.cursor, CITY_LAYER, SCHOOLS_LAYER, max_vertices=16)
+        after = self.cached_pieces()
+        self.assertEqual(set(after), {self.area_hash('a'), self.area_hash('b')})
+        self.assertEqual(after[self.area_hash('a')], before[self.area_hash('a')])
+        self.assertNotIn(old_b, after)
+
+    def test_new_vertex_limit_rebuilds_the_cache(self):
+        """Changing the vertex limit subdivides every area again."""
+        refresh_subdivided(self.cursor, CITY_LAYER, SCHOOLS_LAYER, max_vertices=16)
+        before = self.cached_pieces()
+        refresh_subdivided(self.cursor, CITY_LAYER, SCHOOLS_LAYER, max_vertices=32)
+        after = self.cached_pieces()
+        self.assertEqual(set(after), set(before))
+        self.assertTrue(all(set(after[key]).isdisjoint(before[key]) for key in after))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(SubdivideTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
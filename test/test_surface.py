@@ -0,0 +1,85 @@
+# coding=utf-8
+"""Coverage surface test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'bsc-inf-01-20@unima.ac.mw'
+__date__ = '2026-10-19'
+__copyright__ = 'Copyright 2024, bsc-inf-01-20'
+
+import unittest
+
+import numpy as np
+
+from surface import GAP, NODATA, coverage_surface, gaussian_kernel, rasterize, smoothed_tiles
+
+
+def convolve(array, kernel):
+    """Convolve ``array`` with ``kernel`` by summing shifted copies, keeping the array shape."""
+    radius = kernel.shape[0] // 2
+    padded = np.pad(array, radius)
+    result = np.zeros(array.shape)
+    for dy in range(kernel.shape[0]):
+        for dx in range(kernel.shape[1]):
+            result += kernel[dy, dx] * padded[dy:dy + array.shape[0], dx:dx + array.shape[1]]
+    return result
+
+
+def assemble(array, kernel, tile_size):
+    """Return the first smoothed array of :func:`smoothed_tiles` put back together."""
+    result = np.zeros(array.shape)
+    for row, column, (smoothed,) in smoothed_tiles([array], kernel, tile_size):
+        if smoothed is not None:
+            result[row:row + smoothed.shape[0], column:column + smoothed.shape[1]] = smoothed
+    return result
+
+
+class SurfaceTest(unittest.TestCase):
+    """Test school and population rasters are smoothed and compared."""
+
+    def test_kernel_keeps_the_total(self):
+        """The kernel sums to 1, so smoothing moves people without adding any."""
+        kernel = gaussian_kernel(300, 100)
+        self.assertEqual(kernel.shape, (19, 19))
+        self.assertAlmostEqual(kernel.sum(), 1)
+
+    def test_tiles_join_without_seams(self):
+        """Tiled FFT convolution equals the direct convolution of the whole raster."""
+        array = np.zeros((45, 61))
+        array[np.random.default_rng(0).integers(0, 45, 80), np.random.default_rng(1).integers(0, 61, 80)] = 5
+        kernel = gaussian_kernel(250, 100)
+        np.testing.assert_allclose(assemble(array, kernel, 16), convolve(array, kernel), atol=1e-9)
+        np.testing.assert_allclose(assemble(array, kernel, 64), convolve(array, kernel), atol=1e-9)
+
+    def test_empty_tiles_are_skipped(self):
+        """Tiles whose neighbourhood holds no value are not transformed."""
+        array = np.zeros((40, 40))
+        array[2, 2] = 1
+        tiles = {(row, column): smoothed for row, column, (smoothed,) in smoothed_tiles([array], gaussian_kernel(100, 100), 10)}
+        self.assertIsNotNone(tiles[(0, 0)])
+        self.assertIsNone(tiles[(30, 30)])
+
+    def test_rasterize_flips_rows_north_up(self):
+        """Cells are added to their pixel, the northern row first, and cells outside are ignored."""
+        array = np.zeros((2, 3))
+        rasterize(array, [10, 12, 12, 20], [5, 4, 4, 4], [1, 2, 3, 9], (10, 5, 3, 2))
+        np.testing.assert_array_equal(array, [[1, 0, 0], [0, 0, 5]])
+
+    def test_coverage_surface(self):
+        """Ratios are per 1,000 people where people live, gaps per km²."""
+        schools = np.array([[1.0, 0.0]])
+        population = np.array([[2000.0, 0.0]])
+        np.testing.assert_allclose(coverage_surface(schools, population, 1000, 500), [[0.5, NODATA]])
+        np.testing.assert_allclose(coverage_surface(schools, population, 1000, 500, GAP), [[3, 0]])
+        np.testing.assert_allclose(coverage_surface(None, population, 1000, 500, GAP), [[4, 0]])
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(SurfaceTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,80 @@
+# coding=utf-8
+"""Deficit uncertainty test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'bsc-inf-01-20@unima.ac.mw'
+__date__ = '2026-10-19'
+__copyright__ = 'Copyright 2024, bsc-inf-01-20'
+
+import unittest
+
+import numpy as np
+
+from .utilities import plugin_module
+
+uncertainty = plugin_module('uncertainty')
+
+
+class UncertaintyTest(unittest.TestCase):
+    """Test percentiles of the schools to add are simulated for every area and level."""
+
+    KEYS = [('South', 'c'), ('North', 'a'), ('North', 'b')]
+
+    def test_noise_has_the_requested_spread(self):
+        """Every distribution draws factors with mean 1 and the given relative deviation."""
+        rng = np.random.default_rng(0)
+        for distribution in uncertainty.DISTRIBUTIONS:
+            factors = uncertainty.relative_noise(rng, 200000, 0.2, distribution)
+            self.assertAlmostEqual(factors.mean(), 1, places=2)
+            self.assertAlmostEqual(factors.std(), 0.2, places=2)
+            self.assertGreaterEqual(factors.min(), 0)
+
+    def test_without_error_every_percentile_is_the_deficit(self):
+        """Exact populations reproduce the deficits of the calculation at every level."""
+        rows = uncertainty.deficit_percentiles(self.KEYS, [800, 1000, 500], [2, 0, 1], 500, 'adm3', ['adm1'],
+                                   draws=50, population_error=0)
+        by_key = {row[:3]: row[3] for row in rows}
+        self.assertEqual(len(rows), (1 + 2 + 3) * 3)
+        for percentile in (5, 50, 95):
+            self.assertEqual(by_key[('adm3', 'a', percentile)], 2)
+            self.assertEqual(by_key[('adm3', 'c', percentile)], 0)
+            self.assertEqual(by_key[('adm1', 'North', percentile)], 2)
+            self.assertEqual(by_key[('total', 'total', percentile)], 2)
+
+    def test_percentiles_widen_around_the_deficit(self):
+        """Uncertain populations give ordered bands around the exact deficit."""
+        rows = uncertainty.deficit_percentiles(self.KEYS, [8000, 10000, 5000], [2, 0, 1], 500, 'adm3', ['adm1'],
+                                   draws=2000, population_error=0.2, seed=1)
+        by_key = {row[:3]: row[3] for row in rows}
+        self.assertEqual(by_key[('adm3', 'a', 50)], 20)
+        self.assertLess(by_key[('adm3', 'a', 5)], 20)
+        self.assertGreater(by_key[('adm3', 'a', 95)], 20)
+        self.assertLessEqual(by_key[('total', 'total', 5)], by_key[('total', 'total', 50)])
+        self.assertLessEqual(by_key[('total', 'total', 50)], by_key[('total', 'total', 95)])
+
+    def test_large_ratio_error_stays_finite(self):
+        """Ratios cut off at 0 by a large error ask for at most one school per person."""
+        rows = uncertainty.deficit_percentiles(self.KEYS, [8000, 10000, 5000], [2, 0, 1], 500, 'adm3', ['adm1'],
+                                   draws=500, population_error=0, ratio_error=3, seed=2)
+        by_key = {row[:3]: row[3] for row in rows}
+        self.assertLessEqual(by_key[('adm3', 'a', 95)], 10000)
+        self.assertLessEqual(by_key[('total', 'total', 95)], 23000)
+
+    def test_blocks_do_not_change_the_draws(self):
+        """Simulating a few areas at a time gives the same percentiles as all at once."""
+        arguments = (self.KEYS, [8000, 10000, 5000], [2, 0, 1], 500, 'adm3', ['adm1'])
+        options = {'draws': 300, 'population_error': 0.2, 'ratio_error': 0.1, 'seed': 3}
+        self.assertEqual(uncertainty.deficit_percentiles(*arguments, chunk_elements=300, **options),
+                         uncertainty.deficit_percentiles(*arguments, **options))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(UncertaintyTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
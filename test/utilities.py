@@ -1,6 +1,8 @@
 # coding=utf-8
 """Common functionality used by regression tests."""
 
+import importlib
+import os
 import sys
 import logging
 
@@ -10,6 +12,15 @@ QGIS_APP = None  # Static variable used to hold hand to running QGIS app
 CANVAS = None
 PARENT = None
 IFACE = None
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def plugin_module(name):
+    """Import the module ``name`` of the plugin package, for modules importing their siblings relatively."""
+    parent = os.path.dirname(PLUGIN_DIR)
+    if parent not in sys.path:
+        sys.path.append(parent)
+    return importlib.import_module(f"{os.path.basename(PLUGIN_DIR)}.{name}")
 
 
 def get_qgis_app():
@@ -0,0 +1,137 @@
+import numpy as np
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
+from .engine import PATH_SEPARATOR, TOTAL_LEVEL, round_half_up
+
+UNCERTAINTY_TABLE = 'deficit_uncertainty'
+NORMAL = 'normal'
+LOGNORMAL = 'lognormal'
+UNIFORM = 'uniform'
+DISTRIBUTIONS = (NORMAL, LOGNORMAL, UNIFORM)
+DEFAULT_DRAWS = 10000
+DEFAULT_PERCENTILES = (5, 50, 95)
+# Samples drawn at once, so memory stays bounded however many areas and draws there are
+CHUNK_ELEMENTS = 4 * 1024 * 1024
+# Floor of a sampled people per school ratio, so a ratio cut off at 0 cannot ask for infinitely many schools
+MIN_PEOPLE_PER_SCHOOL = 1
+
+
+def relative_noise(rng, shape, error, distribution=NORMAL):
+    """
+    Draw non-negative multiplicative factors with mean 1 and relative standard deviation ``error``.
+
+    ``error`` is a scalar or an array broadcasting to ``shape``. Log-normal
+    factors keep their mean at 1, uniform ones spread evenly over
+    1 ± error·√3; normal factors are cut off at 0.
+    """
+    error = np.asarray(error, dtype=float)
+    if not error.any():
+        return np.ones(shape)
+    if distribution == NORMAL:
+        factors = rng.normal(1, error, shape)
+    elif distribution == LOGNORMAL:
+        sigma = np.sqrt(np.log1p(error ** 2))
+        factors = rng.lognormal(-sigma ** 2 / 2, sigma, shape)
+    elif distribution == UNIFORM:
+        half_width = error * np.sqrt(3)
+        factors = rng.uniform(1 - half_width, 1 + half_width, shape)
+    else:
+        raise ValueError(f"Unknown distribution {distribution!r}, expected one of {', '.join(DISTRIBUTIONS)}")
+    return np.maximum(factors, 0)
+
+
+def percentile_ranks(percentiles, draws):
+    """Return the position of every percentile among ``draws`` sorted values, rounded to the nearest draw."""
+    return round_half_up(np.asarray(percentiles, dtype=float) / 100 * (draws - 1)).astype(int)
+
+
+def sample_percentiles(samples, ranks):
+    """Return the values at ``ranks`` of every row of ``samples`` without sorting the rows completely."""
+    return np.partition(samples, ranks, axis=1)[:, ranks]
+
+
+def deficit_percentiles(keys, population, available, people_per_school, area_field, parent_fields=(),
+                        draws=DEFAULT_DRAWS, population_error=0.1, ratio_error=0, distribution=NORMAL,
+                        percentiles=DEFAULT_PERCENTILES, seed=None, chunk_elements=CHUNK_ELEMENTS):
+    """
+    Simulate the schools to add of every area and admin level and return their percentiles.
+
+    Every draw multiplies the population of each area by its own factor
+    from ``distribution`` with relative standard deviation
+    ``population_error`` (a scalar or one per area), and all areas by one
+    people per school ratio with relative standard deviation
+    ``ratio_error``, at least :data:`MIN_PEOPLE_PER_SCHOOL`. The school
+    counts stay as counted. As in
+    :func:`engine.rollup_query`, each admin level sums the schools to add
+    of its areas in the same draw. The draws of a block of areas are
+    sampled as one array; the areas are sorted first so the areas of every
+    admin level are adjacent and their draws are summed block by block.
+    Returns long-format (admin level, area name, percentile, schools to
+    add, parent path) rows.
+    """
+    levels = list(parent_fields) + [area_field]
+    order = np.argsort(np.array(['\x1f'.join(key) for key in keys], dtype=str), kind='stable')
+    keys = [keys[i] for i in order]
+    population = np.asarray(population, dtype=float)[order]
+    available = np.asarray(available, dtype=float)[order]
+    errors = np.broadcast_to(np.asarray(population_error, dtype=float), order.shape)[order]
+
+    rng = np.random.default_rng(seed)
+    ratios = np.maximum(people_per_school * relative_noise(rng, draws, ratio_error, distribution), MIN_PEOPLE_PER_SCHOOL)
+    ranks = percentile_ranks(percentiles, draws)
+
+    # Group of every area at each level above the areas; sorting made every group a run of areas
+    parents = []
+    for depth in range(len(levels)):
+        _, first, inverse = np.unique(['\x1f'.join(key[:depth]) for key in keys], return_index=True,
+                                      return_inverse=True)
+        parents.append((depth, first, inverse.ravel(), np.zeros((len(first), draws))))
+
+    area_values = np.zeros((len(keys), len(ranks)))
+    block = max(1, chunk_elements // draws)
+    for start in range(0, len(keys), block):
+        stop = min(start + block, len(keys))
+        sampled = population[start:stop, None] * relative_noise(
+            rng, (stop - start, draws), errors[start:stop, None], distribution
+        )
+        to_add = np.maximum(0, round_half_up(sampled / ratios) - available[start:stop, None])
+        area_values[start:stop] = sample_percentiles(to_add, ranks)
+        for _, _, inverse, totals in parents:
+            groups = inverse[start:stop]
+            starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+            totals[groups[starts]] += np.add.reduceat(to_add, starts, axis=0)
+
+    rows = []
+    for depth, first, _, totals in parents:
+        level = levels[depth - 1] if depth else TOTAL_LEVEL
+        values = sample_percentiles(totals, ranks)
+        for index, group_values in zip(first, values):
+            name = keys[index][depth - 1] if depth else TOTAL_LEVEL
+            path = PATH_SEPARATOR.join(keys[index][:depth - 1]) if depth else ''
+            rows.extend((level, name, int(p), int(v), path) for p, v in zip(percentiles, group_values))
+    for key, area_value in zip(keys, area_values):
+        path = PATH_SEPARATOR.join(key[:-1])
+        rows.extend((area_field, key[-1], int(p), int(v), path) for p, v in zip(percentiles, area_value))
+    return rows
+
+
+def write_uncertainty(cursor, rows, uncertainty_table=UNCERTAINTY_TABLE):
+    """Store long-format percentile rows, replacing earlier percentiles of the same areas."""
+    identifiers = {'table': sql.Identifier(uncertainty_table)}
+    cursor.execute(sql.SQL("""
+        CREATE TABLE IF NOT EXISTS {table} (
+            admin_level text NOT NULL,
+            area_name text NOT NULL,
+            percentile integer NOT NULL,
+            schools_to_add integer,
+            parent_path text NOT NULL DEFAULT '',
+            PRIMARY KEY (admin_level, parent_path, area_name, percentile)
+        )
+    """).format(**identifiers))
+    execute_values(cursor, sql.SQL("""
+        INSERT INTO {table} (admin_level, area_name, percentile, schools_to_add, parent_path)
+        VALUES %s
+        ON CONFLICT (admin_level, parent_path, area_name, percentile) DO UPDATE SET
+        schools_to_add = EXCLUDED.schools_to_add
+    """).format(**identifiers).as_string(cursor.connection), rows, page_size=1000)